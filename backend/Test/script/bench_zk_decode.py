@@ -0,0 +1,139 @@
+# scripts/bench_zk_decode.py
+"""
+Benchmark pyzk's record-by-record decoder against app/zk_decode.py.
+
+The dump files only hold decoded records, so the raw device buffers are rebuilt
+from them in every layout the fleet firmware uses (8/16/40-byte attendance,
+28/72-byte users), repeated up to --records, then decoded both ways. Results are
+checked for equality before timings are printed.
+
+    python Test/script/bench_zk_decode.py [--dump Test/script/device_dump.json] [--records 20000]
+
+pyzk re-slices the remaining buffer after every record, so its cost grows
+quadratically; keep --records modest when comparing.
+"""
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from zk import ZK                                      # noqa: E402
+from app.zk_decode import decode_attendance, decode_users, ATT_FORMATS, USER_FORMATS  # noqa: E402
+
+DUMPS = ["Test/script/device_dump.json", "Test/Utils/device_dump.json"]
+
+
+def encode_time(t):
+    """zkemsdk EncodeTime (inverse of the device's packed time)."""
+    return (((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) * (24 * 60 * 60)
+            + (t.hour * 60 + t.minute) * 60 + t.second)
+
+
+def load_dump(path):
+    j = json.load(open(path, "r", encoding="utf-8"))
+    users = j.get("users", [])
+    for i, u in enumerate(users, 1):
+        u.setdefault("uid", u.get("user_uid") or i)
+    uid_by_user = {str(u["user_id"]): int(u["uid"]) for u in users}
+    att = []
+    for a in j.get("attendance", []):
+        ts = datetime.strptime(a["timestamp"], "%Y-%m-%d %H:%M:%S")
+        user_id = str(a["user_id"])
+        att.append((uid_by_user.get(user_id, int(a.get("uid") or 0)), user_id, ts, int(a["status"]), int(a["punch"] or 0)))
+    return users, att
+
+
+def build_attendance_buffer(att, record_size, n):
+    fmt = ATT_FORMATS[record_size]
+    out = bytearray()
+    for i in range(n):
+        uid, user_id, ts, status, punch = att[i % len(att)]
+        t = struct.pack("<I", encode_time(ts))
+        if record_size == 8:
+            out += struct.pack(fmt, uid, status, t, punch)
+        elif record_size == 16:
+            out += struct.pack(fmt, int(user_id), t, status, punch, b"\x00\x00", 0)
+        else:
+            out += struct.pack(fmt, uid, user_id.encode(), status, t, punch, b"\x00" * 8)
+    return struct.pack("<I", len(out)) + bytes(out)
+
+
+def build_user_buffer(users, packet_size):
+    fmt = USER_FORMATS[packet_size]
+    out = bytearray()
+    for u in users:
+        name = (u.get("name") or "").encode()
+        if packet_size == 28:
+            out += struct.pack(fmt, int(u["uid"]), int(u.get("privilege") or 0), b"", name[:8], 0, 0, 0, int(u["user_id"]))
+        else:
+            out += struct.pack(fmt, int(u["uid"]), int(u.get("privilege") or 0), b"", name[:24], 0, b"", str(u["user_id"]).encode())
+    return struct.pack("<I", len(out)) + bytes(out)
+
+
+def offline_zk(att_buf, user_buf, records, users):
+    """A pyzk ZK object whose device reads return the prepared buffers."""
+    z = ZK("127.0.0.1")
+
+    def read_sizes():
+        z.records, z.users = records, users
+        return True
+
+    def read_with_buffer(command, fct=0, ext=0):
+        buf = user_buf if fct else att_buf
+        return buf, len(buf)
+
+    z.read_sizes = read_sizes
+    z.read_with_buffer = read_with_buffer
+    return z
+
+
+def bench(fn, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+
+def run(dump, n_records, repeat):
+    users, att = load_dump(dump)
+    print(f"{dump}: {len(users)} users, {len(att)} punches; decoding {n_records} records per layout")
+    print(f"{'layout':>10} {'pyzk rec/s':>14} {'numpy rec/s':>14} {'iter_unpack rec/s':>18} {'speedup':>8}")
+    for packet_size in (28, 72):
+        ubuf = build_user_buffer(users, packet_size)
+        zk = offline_zk(b"", ubuf, 0, len(users))
+        ref = [(u.uid, u.user_id, u.name) for u in zk.get_users()]
+        cols = decode_users(memoryview(ubuf)[4:], packet_size).records()
+        assert [(u.uid, u.user_id, u.name) for u in cols] == ref, f"user layout {packet_size} mismatch"
+    zk_users = offline_zk(b"", build_user_buffer(users, 72), 0, len(users)).get_users()
+
+    for record_size in (8, 16, 40):
+        abuf = build_attendance_buffer(att, record_size, n_records)
+        zk = offline_zk(abuf, build_user_buffer(users, 72), n_records, len(users))
+        t_pyzk, ref = bench(zk.get_attendance, repeat=1)
+        t_np, cols = bench(lambda: decode_attendance(memoryview(abuf)[4:], record_size, users=zk_users).records(), repeat)
+        t_py, cols_py = bench(lambda: decode_attendance(memoryview(abuf)[4:], record_size, users=zk_users,
+                                                        use_numpy=False).records(), repeat)
+        expect = [(str(a.uid), a.user_id, a.timestamp, a.status, a.punch) for a in ref]
+        for got in (cols, cols_py):
+            assert [(str(r.uid), r.user_id, r.timestamp, r.status, r.punch) for r in got] == expect, \
+                f"attendance layout {record_size} mismatch"
+        print(f"{record_size:>8}B {n_records / t_pyzk:>14,.0f} {n_records / t_np:>14,.0f} {n_records / t_py:>18,.0f} "
+              f"{t_pyzk / t_np:>7.1f}x")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--dump", action="append", help="device_dump.json file(s); default: both dumps in Test/")
+    p.add_argument("--records", type=int, default=20000)
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+    for dump in args.dump or DUMPS:
+        run(dump, args.records, args.repeat)
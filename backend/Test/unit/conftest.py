@@ -0,0 +1,134 @@
+# Test/unit/conftest.py
+"""
+Fixtures for the pipeline tests: a Flask app on a throwaway SQLite database (schema from
+the models), one branch with three devices, an SQLite end DB with the export target
+table, and a fake ZK device for the polling path. `app_context()` builds the same app
+with config overrides.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app import create_app  # noqa: E402
+from app.config import Config  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models import Branch, Device  # noqa: E402
+from app.seen_index import invalidate_seen_index  # noqa: E402
+
+END_TABLE_DDL = """
+CREATE TABLE att_raw_data_old (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, log_date DATE NOT NULL, badge TEXT, badge_dup TEXT,
+    placeholder TEXT, log_time TIME, flag INTEGER DEFAULT 0, access_door TEXT, batch TEXT, access_device TEXT
+)
+"""
+
+
+class FakeRecord:
+    def __init__(self, uid, user_id, timestamp, status=1, punch=0):
+        self.uid, self.user_id, self.timestamp, self.status, self.punch = uid, user_id, timestamp, status, punch
+
+
+class FakeUser:
+    def __init__(self, uid, user_id, name):
+        self.uid, self.user_id, self.name = uid, user_id, name
+
+
+class FakeZK:
+    """Stands in for zk.ZK: serves RECORDS[ip] and SERIALS[ip]."""
+    RECORDS = {}
+    SERIALS = {}
+
+    def __init__(self, ip, **kwargs):
+        self.ip = ip
+
+    def connect(self):
+        return self
+
+    def disable_device(self):
+        pass
+
+    def enable_device(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def get_users(self):
+        return [FakeUser(i, str(100 + i), f"user{i}") for i in range(1, 10)]
+
+    def get_attendance(self):
+        return list(self.RECORDS.get(self.ip, []))
+
+    def get_serialnumber(self):
+        return self.SERIALS.get(self.ip, "SN" + self.ip.replace(".", ""))
+
+
+@contextmanager
+def app_context(tmp_path, **overrides):
+    """The test app (TestConfig plus `overrides`) inside an app context, with the seed data."""
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'app.db'}"
+        ENDDB_DATABASE_URI = f"sqlite:///{tmp_path / 'end.db'}"
+        SCHEDULER_LOG_DIR = str(tmp_path / "logs")
+        INGEST_SPOOL_DIR = str(tmp_path / "spool")
+        REPLICA_LOCK_DIR = str(tmp_path)
+        INGEST_WRITE_BEHIND = False
+        EVENT_BUS_ENABLED = False
+        AUDIT_INSERTS_ENABLED = False
+        EXPORT_RETRY_BASE_SECONDS = 0
+
+    for name, value in overrides.items():
+        setattr(TestConfig, name, value)
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all(bind_key=None)   # the primary only; a replica is a copy of it
+        branch = Branch(name="B1", ip_range="10.0.0.0/24")
+        db.session.add(branch)
+        db.session.commit()
+        for i in range(1, 4):
+            db.session.add(Device(branch_id=branch.id, name=f"D{i}", ip_address=f"10.0.0.{i}"))
+        db.session.commit()
+        try:
+            yield app
+        finally:
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+            invalidate_seen_index()
+
+
+@pytest.fixture
+def app(tmp_path):
+    with app_context(tmp_path) as app:
+        yield app
+
+
+@pytest.fixture
+def end_db(app):
+    """The end DB engine, with an empty att_raw_data_old."""
+    from app.exporter import _end_engine
+    engine = _end_engine(app.config["ENDDB_DATABASE_URI"])
+    with engine.begin() as conn:
+        conn.execute(text(END_TABLE_DDL))
+    return engine
+
+
+@pytest.fixture
+def fake_zk(monkeypatch):
+    import app.tasks as tasks
+    FakeZK.RECORDS, FakeZK.SERIALS = {}, {}
+    monkeypatch.setattr(tasks, "ZK", FakeZK)
+    return FakeZK
+
+
+def make_records(ip, n, start_uid=1, base=None):
+    base = base or datetime(2025, 9, 1, 8, 0, 0)
+    records = [FakeRecord(start_uid + i, str(101 + i % 9), base + timedelta(minutes=i)) for i in range(n)]
+    FakeZK.RECORDS.setdefault(ip, []).extend(records)
+    return records
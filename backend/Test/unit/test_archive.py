@@ -0,0 +1,71 @@
+# Test/unit/test_archive.py
+"""/api/logs listings over hot rows merged with the cold archive."""
+from datetime import date, datetime, timedelta
+
+from app.archive import archive_month, load_manifest
+from app.extensions import db
+from app.ingest import attendance_row
+from app.models import AttendanceLog, DeviceDailyRollup
+from app.rollups import rebuild_rollups
+
+OLD = datetime(2025, 9, 1, 8, 0, 0)
+NEW = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def _insert(device_id, base, n, exported=True):
+    rows = [dict(attendance_row(device_id, i, str(100 + i % 3), None, base + timedelta(hours=i), "1",
+                                sn=f"SN{device_id}"), exported=exported) for i in range(n)]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+
+
+def _archive(app, tmp_path):
+    app.config["ARCHIVE_DIR"] = str(tmp_path / "archive")
+    _insert(1, OLD, 12)
+    _insert(2, OLD, 6)
+    _insert(1, NEW, 5, exported=False)
+    assert archive_month(app.config["ARCHIVE_DIR"], date(2025, 9, 1), 1)["deleted"] == 18
+    assert AttendanceLog.query.count() == 5
+
+
+def test_listing_bounded_only_by_to_includes_archived_months(app, tmp_path):
+    _archive(app, tmp_path)
+    client = app.test_client()
+
+    assert client.get("/api/logs?to=2025-09-30").get_json()["total"] == 18
+    assert client.get("/api/logs?to=2026-10-31").get_json()["total"] == 23
+    assert client.get("/api/logs?q=2025-09-01").get_json()["total"] == 18
+    # no bounds at all: the hot table only
+    assert client.get("/api/logs").get_json()["total"] == 5
+
+
+def test_user_listing_includes_archived_rows(app, tmp_path):
+    _archive(app, tmp_path)
+    client = app.test_client()
+
+    body = client.get("/api/logs/user/100?from=2025-01-01&to=2026-12-31&per_page=100").get_json()
+    # i % 3 == 0: ids 0, 3, 6, 9 on D1 and 0, 3 on D2 archived, 0, 3 hot
+    assert body["total"] == 8
+    assert sum(1 for item in body["items"] if item["timestamp"].startswith("2025-09")) == 6
+
+
+def test_device_delete_removes_its_archived_rows(app, tmp_path):
+    app.config["ARCHIVE_ENABLED"] = True
+    _archive(app, tmp_path)
+    rebuild_rollups(archive_dir=app.config["ARCHIVE_DIR"])
+    client = app.test_client()
+
+    body = client.delete("/api/logs/device/1/logs?confirm=1").get_json()
+    assert (body["deleted"], body["archived_deleted"]) == (17, 12)
+
+    assert client.get("/api/logs?to=2026-10-31").get_json()["total"] == 6
+    assert client.get("/api/logs?device_id=1&to=2026-10-31").get_json()["total"] == 0
+    stats = client.get("/api/logs/stats?start_date=2025-09-01&end_date=2025-09-30").get_json()
+    assert stats["total"] == 6
+    assert DeviceDailyRollup.query.filter_by(device_id=1).count() == 0
+    entry, = load_manifest(app.config["ARCHIVE_DIR"])["files"].values()
+    assert entry["rows"] == 6
+
+    # deleting the other device empties the file, which goes away with its entry
+    assert client.delete("/api/logs/device/2/logs?confirm=1").get_json()["archived_deleted"] == 6
+    assert load_manifest(app.config["ARCHIVE_DIR"])["files"] == {}
@@ -0,0 +1,78 @@
+# Test/unit/test_counters.py
+"""Maintained per-device / per-branch log counters and their reconcile."""
+from datetime import date, datetime, time, timedelta
+
+from app.counters import reconcile_log_counters
+from app.extensions import db
+from app.ingest import IngestBatch, attendance_row, write_batches
+from app.models import AttendanceLog, Branch, BranchLogCounter, DeviceLogCounter
+
+BASE = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def _rows(device_id, n, base=BASE):
+    return [attendance_row(device_id, i, str(100 + i), None, base + timedelta(minutes=i), "1", sn=f"SN{device_id}")
+            for i in range(n)]
+
+
+def _insert_uncounted(device_id, n):
+    """Rows written behind the counters' back (drift)."""
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), _rows(device_id, n))
+
+
+def _ingest(device_id, rows):
+    write_batches(db.session, [IngestBatch(device_id, sn=f"SN{device_id}", attendance_rows=rows)])
+    db.session.commit()
+
+
+def _counters():
+    db.session.remove()
+    return ({c.device_id: c.log_count for c in DeviceLogCounter.query},
+            {c.branch_id: c.log_count for c in BranchLogCounter.query})
+
+
+def test_reconcile_creates_missing_rows_and_fixes_drift(app):
+    _insert_uncounted(1, 5)
+    _insert_uncounted(2, 3)
+    db.session.add(DeviceLogCounter(device_id=3, log_count=7, updated_at=BASE))
+    db.session.commit()
+
+    res = reconcile_log_counters()
+    assert res["fixed_devices"] == {1: {"was": None, "now": 5}, 2: {"was": None, "now": 3},
+                                    3: {"was": 7, "now": 0}}
+    assert res["fixed_branches"] == {1: {"was": None, "now": 8}}
+    assert _counters() == ({1: 5, 2: 3, 3: 0}, {1: 8})
+
+    # nothing left to fix
+    res = reconcile_log_counters()
+    assert (res["fixed_devices"], res["fixed_branches"]) == ({}, {})
+    assert _counters() == ({1: 5, 2: 3, 3: 0}, {1: 8})
+
+
+def test_ingest_deletes_and_moves_apply_deltas(app):
+    client = app.test_client()
+    b2 = Branch(name="B2", ip_range="10.0.1.0/24")
+    db.session.add(b2)
+    db.session.commit()
+    b2 = b2.id
+    today = datetime.combine(date.today(), time(8))
+
+    _ingest(1, _rows(1, 10))
+    _ingest(1, _rows(1, 12))                    # the first 10 are duplicates: +2
+    _ingest(2, _rows(2, 4) + _rows(2, 3, base=today))
+    assert _counters() == ({1: 12, 2: 7}, {1: 19})
+    assert {b["id"]: b["log_count"] for b in client.get("/api/devices/").get_json()} == {1: 19, b2: 0}
+
+    assert client.delete("/api/logs/device/2/logs/today?confirm=1").status_code == 200
+    assert _counters() == ({1: 12, 2: 4}, {1: 16})
+
+    assert client.put("/api/devices/device/2", json={"branch_id": b2}).status_code == 200
+    assert _counters() == ({1: 12, 2: 4}, {1: 12, b2: 4})
+
+    assert client.delete("/api/logs/device/1/logs?confirm=1").get_json()["deleted"] == 12
+    assert client.delete("/api/devices/device/2").status_code == 200
+    assert _counters() == ({1: 0}, {1: 0, b2: 0})
+    # the deltas left no drift; reconcile only creates the row D3 never needed
+    res = reconcile_log_counters()
+    assert (res["fixed_devices"], res["fixed_branches"]) == ({3: {"was": None, "now": 0}}, {})
@@ -0,0 +1,57 @@
+# Test/unit/test_dead_letters.py
+"""Bad rows are bisected out of a batch into ingest_dead_letters and can be retried."""
+import json
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.ingest import IngestBatch, attendance_row, insert_rows_isolated, retry_dead_letters, write_batches
+from app.models import AttendanceLog, IngestDeadLetter
+
+BASE = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def _rows(n, bad=()):
+    rows = [attendance_row(1, i, str(100 + i % 5), None, BASE + timedelta(minutes=i), "1", sn="SN1") for i in range(n)]
+    for i in bad:
+        rows[i]["status"] = None    # NOT NULL violation
+    return rows
+
+
+def test_bisection_quarantines_only_the_bad_rows(app):
+    quarantined = []
+    inserted = insert_rows_isolated(db.session, AttendanceLog.__table__, _rows(100, bad=(7, 50, 99)),
+                                    savepoint_rows=32, quarantine=lambda row, e: quarantined.append(row["record_id"]))
+    db.session.commit()
+    assert inserted == 97
+    assert sorted(quarantined) == [7, 50, 99]
+    assert AttendanceLog.query.count() == 97
+
+
+def test_bad_rows_are_dead_lettered_and_retried(app):
+    batch = IngestBatch(1, sn="SN1", attendance_rows=_rows(40, bad=(3, 30)))
+    assert write_batches(db.session, [batch], savepoint_rows=16) == 38
+    db.session.commit()
+    assert (batch.inserted, batch.quarantined) == (38, 2)
+
+    dead = IngestDeadLetter.query.order_by(IngestDeadLetter.id).all()
+    assert [(d.device_id, d.sn, d.attempts) for d in dead] == [(1, "SN1", 1)] * 2
+    assert all(d.error.startswith("IntegrityError") for d in dead)
+
+    # still bad: the attempt is counted and the row stays
+    res = retry_dead_letters(ids=[dead[0].id])
+    assert (res["inserted"], res["failed"]) == (0, 1)
+    db.session.remove()
+    assert db.session.get(IngestDeadLetter, dead[0].id).attempts == 2
+
+    # fixed payloads go in and leave the table
+    for d in IngestDeadLetter.query:
+        payload = json.loads(d.payload)
+        payload["status"] = "1"
+        d.payload = json.dumps(payload)
+    db.session.commit()
+    res = retry_dead_letters()
+    assert (res["retried"], res["inserted"], res["failed"]) == (2, 2, 0)
+    db.session.remove()
+    assert IngestDeadLetter.query.count() == 0
+    assert AttendanceLog.query.count() == 40
+    assert AttendanceLog.query.filter_by(record_id=30).one().timestamp == BASE + timedelta(minutes=30)
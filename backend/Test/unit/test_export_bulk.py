@@ -0,0 +1,72 @@
+# Test/unit/test_export_bulk.py
+"""The bulk-file export: rows go through temporary files, which are verified and removed."""
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.ingest import attendance_row
+from app.models import AttendanceLog, SyncCursor
+from app.scheduler import start_export_job
+
+ODD = 'a\tb\\n"q\'\nz'
+
+
+def _insert(n, start=0, badge=lambda i: str(100 + i % 7)):
+    now = datetime.utcnow()
+    rows = [attendance_row(1, start + i, badge(i), None, now - timedelta(minutes=start + i), "1", sn="SN1")
+            for i in range(n)]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+
+
+def _end_count(end_db, where="1 = 1", **params):
+    with end_db.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM att_raw_data_old WHERE {where}"), params).scalar()
+
+
+def _wait(app, job_id, timeout=10):
+    client = app.test_client()
+    deadline = time.monotonic() + timeout
+    while (job := client.get(f"/api/sync/job/{job_id}").get_json())["status"] == "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return job
+
+
+def _bulk_files(path):
+    return [f for f in os.listdir(path) if f.startswith("enddb-export-")]
+
+
+def test_bulk_export_loads_every_row(app, end_db, tmp_path):
+    app.config.update(EXPORT_BULK_FILE_ROWS=7, EXPORT_BULK_DIR=str(tmp_path), EXPORT_LOOKBACK_DAYS=10)
+    _insert(30, badge=lambda i: ODD if i == 5 else str(100 + i % 7))
+    job = _wait(app, app.test_client().post("/api/admin/export/enddb/bulk").get_json()["job_id"])
+    res = job["results"][0]
+    assert (job["type"], job["status"], res["exported"], res["errors"]) == ("export_enddb_bulk", "finished", 30, 0)
+
+    db.session.remove()
+    assert AttendanceLog.query.filter_by(exported=False).count() == 0
+    assert db.session.get(SyncCursor, "enddb_export").position == 30
+    assert _end_count(end_db) == 30
+    # tabs, newlines, backslashes and quotes survive the file round trip
+    assert _end_count(end_db, "badge = :b AND badge_dup = :b", b=ODD) == 1
+    assert _bulk_files(tmp_path) == []
+
+
+def test_failed_verification_rolls_the_file_back(app, end_db, tmp_path):
+    app.config.update(EXPORT_BULK_DIR=str(tmp_path), EXPORT_LOOKBACK_DAYS=10, EXPORT_DRAIN_MAX_FAILURES=1)
+    _insert(10)
+    with end_db.begin() as conn:
+        # the target silently drops one row, as a filtering trigger on the real end DB could
+        conn.execute(text("CREATE TRIGGER drop_one AFTER INSERT ON att_raw_data_old WHEN NEW.badge = '103' "
+                          "BEGIN DELETE FROM att_raw_data_old WHERE id = NEW.id; END"))
+    job = start_export_job(app, background=False, bulk=True)
+    assert job["status"] == "failed" and "verification" in job["error"]
+
+    db.session.remove()
+    assert _end_count(end_db) == 0
+    assert AttendanceLog.query.filter_by(exported=False).count() == 10
+    assert _bulk_files(tmp_path) == []
@@ -0,0 +1,68 @@
+# Test/unit/test_export_cursor.py
+"""The end-DB export cursor with ids committed out of order, and export retries."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.exporter import drain_export_backlog
+from app.extensions import db
+from app.ingest import attendance_row
+from app.models import AttendanceLog, ExportRetry, SyncCursor
+
+
+def _insert(ids, age=timedelta(0), device_id=1):
+    """Commit rows with the given ids, as a concurrent writer holding those ids would."""
+    now = datetime.utcnow() - age
+    rows = [dict(attendance_row(device_id, i, str(i), None, now - timedelta(minutes=i), "1", sn="SN1"), id=i)
+            for i in ids]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+
+
+def _end_rows(end_db):
+    with end_db.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM att_raw_data_old")).scalar()
+
+
+def test_export_picks_up_rows_committed_below_the_cursor(app, end_db):
+    app.config["EXPORT_BATCH_SIZE"] = 4
+    _insert([1, 2, 3, 4, 5, 6, 10, 11, 12, 13, 14, 15])
+    assert drain_export_backlog(app, lookback_days=10)["exported"] == 12
+    assert db.session.get(SyncCursor, "enddb_export").position == 15
+
+    _insert([7, 8, 9])          # a slower writer commits its lower ids late
+    assert drain_export_backlog(app, lookback_days=10)["exported"] == 3
+    _insert([16, 17])
+    assert drain_export_backlog(app, lookback_days=10)["exported"] == 2
+
+    db.session.remove()
+    assert AttendanceLog.query.filter_by(exported=False).count() == 0
+    assert _end_rows(end_db) == 17
+
+
+def test_late_rows_are_not_exported_twice(app, end_db):
+    _insert([1, 2, 5, 6])
+    drain_export_backlog(app, lookback_days=10)
+    _insert([3, 4])
+    first = drain_export_backlog(app, lookback_days=10)
+    again = drain_export_backlog(app, lookback_days=10)
+    assert (first["exported"], again["exported"], again["skipped_existing"]) == (2, 0, 0)
+    assert _end_rows(end_db) == 6
+
+
+def test_requeued_stale_rows_are_exported(app, end_db):
+    _insert([1, 2, 3], age=timedelta(days=30))
+    res = drain_export_backlog(app, lookback_days=10)
+    assert (res["exported"], res["dead"]) == (0, 3)
+    assert {r.error for r in ExportRetry.query} == {"older than the lookback window"}
+
+    resp = app.test_client().post("/api/sync/export-retries/requeue", json={})
+    assert resp.get_json()["requeued"] == 3
+    res = drain_export_backlog(app, lookback_days=10)
+    assert (res["exported"], res["dead"]) == (3, 0)
+
+    db.session.remove()
+    assert ExportRetry.query.count() == 0
+    assert _end_rows(end_db) == 3
+    # and they stay exported: nothing goes dead again
+    assert drain_export_backlog(app, lookback_days=10)["dead"] == 0
@@ -0,0 +1,67 @@
+# Test/unit/test_export_partitions.py
+"""The partitioned export: every partition drains, and a failed one is left to the serial pass."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import app.exporter as exporter
+from app.extensions import db
+from app.ingest import attendance_row
+from app.models import AttendanceLog, SyncCursor
+from app.scheduler import start_export_job
+
+
+def _insert(n_per_device, devices=(1, 2, 3)):
+    now = datetime.utcnow()
+    rows = [attendance_row(d, i, str(100 + i), None, now - timedelta(minutes=i), "1", sn=f"SN{d}")
+            for i in range(n_per_device) for d in devices]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+    return len(rows)
+
+
+def _end_rows(end_db):
+    with end_db.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM att_raw_data_old")).scalar()
+
+
+def _cursors():
+    db.session.remove()
+    return {c.name: c.position for c in SyncCursor.query}
+
+
+def test_every_partition_drains(app, end_db):
+    app.config.update(EXPORT_PARALLEL_WORKERS=3, EXPORT_BATCH_SIZE=5, EXPORT_LOOKBACK_DAYS=10)
+    total = _insert(12)
+    job = start_export_job(app, background=False)
+    res = job["results"][0]
+    assert (job["status"], res["exported"], res["errors"]) == ("finished", total, 0)
+    assert [(p["partition"], p["exported"], p["error"]) for p in res["partitions"]] == [
+        ("0/3", 12, None), ("1/3", 12, None), ("2/3", 12, None)]
+
+    assert AttendanceLog.query.filter_by(exported=False).count() == 0
+    assert _end_rows(end_db) == total
+    assert _cursors() == {"enddb_export": total, "enddb_export:0/3": total,
+                          "enddb_export:1/3": total, "enddb_export:2/3": total}
+
+
+def test_failed_partition_is_drained_serially(app, end_db, monkeypatch):
+    app.config.update(EXPORT_PARALLEL_WORKERS=3, EXPORT_LOOKBACK_DAYS=10)
+    total = _insert(8)
+    drain = exporter.drain_export_backlog
+
+    def failing_drain(app, lookback_days=None, progress=None, partition=None):
+        if partition == (2, 3):
+            raise RuntimeError("end DB went away")
+        return drain(app, lookback_days, progress=progress, partition=partition)
+
+    monkeypatch.setattr(exporter, "drain_export_backlog", failing_drain)
+    res = start_export_job(app, background=False)["results"][0]
+    assert [(p["partition"], p["error"]) for p in res["partitions"]] == [
+        ("0/3", None), ("1/3", None), ("2/3", "RuntimeError: end DB went away")]
+    # D2's rows (partition 2/3) were picked up by the serial drain
+    assert res["exported"] == total
+    assert AttendanceLog.query.filter_by(exported=False).count() == 0
+    assert _end_rows(end_db) == total
+    cursors = _cursors()
+    assert (cursors["enddb_export"], cursors["enddb_export:2/3"]) == (total, 0)
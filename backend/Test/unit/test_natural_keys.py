@@ -0,0 +1,73 @@
+# Test/unit/test_natural_keys.py
+"""Ingest, the natural-key backfill and the seen index build the same keys from the same serial."""
+from datetime import datetime
+
+from app.extensions import db
+from app.ingest import backfill_natural_keys, natural_key, natural_key_int, timestamp_order
+from app.models import AttendanceLog, Device
+from app.seen_index import get_seen_index, invalidate_seen_index
+from app.tasks import fetch_and_forward_for_device
+
+from conftest import make_records
+
+
+def _poll(device_id):
+    fetch_and_forward_for_device(db.session.get(Device, device_id))
+    db.session.remove()
+
+
+def _legacy_row(device_id, record_id, userid, ts, status="1"):
+    """A row as written before natural keys existed."""
+    db.session.add(AttendanceLog(device_id=device_id, record_id=record_id, user_id=userid, device_userid=userid,
+                                 timestamp=ts, status=status, natural_key=None))
+    db.session.commit()
+
+
+def test_key_serial_is_claimed_on_first_contact(app, fake_zk):
+    fake_zk.SERIALS["10.0.0.1"] = "SNREAL"
+    make_records("10.0.0.1", 5)
+    _poll(1)
+
+    device = db.session.get(Device, 1)
+    assert device.key_serial == "SNREAL"
+    row = AttendanceLog.query.order_by(AttendanceLog.id).first()
+    assert row.natural_key == natural_key("SNREAL", row.device_userid, row.timestamp, row.status)
+
+
+def test_keys_agree_after_serial_no_changes(app, fake_zk):
+    fake_zk.SERIALS["10.0.0.1"] = "SNREAL"
+    records = make_records("10.0.0.1", 20)
+    _poll(1)
+    stored = AttendanceLog.query.filter_by(device_id=1).count()
+    assert stored == 20
+
+    # an admin corrects serial_no: keys must not move with it
+    device = db.session.get(Device, 1)
+    device.serial_no = "RENAMED"
+    db.session.commit()
+
+    # a legacy copy of an ingested punch, and a legacy punch ingest never saw
+    dup = records[3]
+    _legacy_row(1, 9001, dup.user_id, dup.timestamp)
+    _legacy_row(1, 9002, "555", datetime(2025, 9, 2, 7, 0, 0))
+
+    # the seen index keys the legacy rows on the fly with the same serial as ingest
+    invalidate_seen_index(1)
+    index = get_seen_index(1)
+    for r in AttendanceLog.query.filter_by(device_id=1):
+        key = r.natural_key or natural_key("SNREAL", r.device_userid, r.timestamp, r.status)
+        assert index.contains(natural_key_int(key), timestamp_order(r.timestamp))
+
+    # the backfill deletes the legacy copy and keys the other row the same way
+    res = backfill_natural_keys(chunk_size=7)
+    db.session.remove()
+    assert res["updated"] == 1 and res["duplicates"] == 1
+    assert AttendanceLog.query.filter_by(device_id=1).count() == stored + 1
+    unique = AttendanceLog.query.filter_by(record_id=9002).one()
+    assert unique.natural_key == natural_key("SNREAL", "555", unique.timestamp, unique.status)
+    assert AttendanceLog.query.filter(AttendanceLog.natural_key.is_(None)).count() == 0
+
+    # polling again (serial_no now RENAMED) inserts nothing
+    invalidate_seen_index(1)
+    _poll(1)
+    assert AttendanceLog.query.filter_by(device_id=1).count() == stored + 1
@@ -0,0 +1,82 @@
+# Test/unit/test_projection.py
+"""access_checkinout projection of attendance_logs."""
+from datetime import datetime, timedelta
+
+import app.tasks as tasks
+from app.extensions import db
+from app.ingest import attendance_row
+from app.models import AccessUserInfo, AttendanceLog, Badge, CheckinOut, Device, SyncCursor, User
+from app.projection import CHECKINOUT_CURSOR, project_checkinout
+
+from conftest import make_records
+
+
+def _insert(ids, device_id=1):
+    """Commit rows with the given ids, as a concurrent writer holding those ids would."""
+    now = datetime.utcnow()
+    rows = [dict(attendance_row(device_id, i, str(i), None, now - timedelta(minutes=i), "1", sn="SN1"), id=i)
+            for i in ids]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+
+
+def test_projection_picks_up_rows_committed_below_the_watermark(app):
+    _insert([1, 2, 3, 10, 11])
+    assert project_checkinout(batch_size=4)["projected"] == 5
+    _insert([4, 5])
+    res = project_checkinout(batch_size=4)
+    assert res["projected"] == 2 and res["position"] == 11
+    assert project_checkinout(batch_size=4)["projected"] == 0
+    assert CheckinOut.query.count() == 7
+
+
+class _AuditRows:
+    """Collects the insert audit rows: what the old inline path wrote to access_checkinout."""
+    def __init__(self):
+        self.rows = []
+
+    def write_rows(self, stream, sn, rows, header=None):
+        self.rows.extend((userid, ts, sn) for _rid, ts, userid, _status, _sn in rows)
+
+    def record_unmapped(self, *args):
+        pass
+
+
+def _projected():
+    return {(r.USERID, r.CHECKTIME.isoformat(), r.serial.sn) for r in CheckinOut.query}
+
+
+def test_projection_writes_the_userid_resolved_at_ingest(app, fake_zk, monkeypatch):
+    audit = _AuditRows()
+    monkeypatch.setattr(tasks, "get_audit_writer", lambda _app: audit)
+    app.config["AUDIT_INSERTS_ENABLED"] = True
+    fake_zk.SERIALS["10.0.0.1"] = "SNREAL"
+    records = make_records("10.0.0.1", 18)
+
+    # device user 102 holds central badge 102, which the replica knows as USERID 7002
+    user = User(branch_id=1, full_name="Mapped", employee_code="E1")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Badge(user_id=user.id, badge_number="102"))
+    db.session.add(AccessUserInfo(USERID="7002", Badgenumber="102", sn="SNREAL"))
+    db.session.commit()
+
+    tasks.fetch_and_forward_for_device(db.session.get(Device, 1))
+    db.session.remove()
+    # an admin corrects serial_no after ingest
+    db.session.get(Device, 1).serial_no = "RENAMED"
+    db.session.commit()
+
+    hot = set(audit.rows)
+    assert ("7002", records[1].timestamp.isoformat(), "SNREAL") in hot
+    project_checkinout()
+    assert _projected() == hot
+
+    # rows written before access_userid existed resolve the same through the badge join
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.update().values(access_userid=None))
+        conn.execute(CheckinOut.__table__.delete())
+        conn.execute(SyncCursor.__table__.delete().where(SyncCursor.__table__.c.name == CHECKINOUT_CURSOR))
+    db.session.remove()
+    project_checkinout()
+    assert _projected() == hot
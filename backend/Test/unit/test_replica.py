@@ -0,0 +1,76 @@
+# Test/unit/test_replica.py
+"""Report reads go to a healthy replica and fall back to the primary when it lags or fails."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.ingest import attendance_row
+from app.models import AttendanceLog
+
+from conftest import app_context
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    with app_context(tmp_path, REPLICA_DATABASE_URI=f"sqlite:///{tmp_path / 'replica.db'}",
+                     REPLICA_CHECK_INTERVAL_SECONDS=0, REPLICA_MAX_LAG_SECONDS=30) as app:
+        yield app
+
+
+def _insert(device_id, n, age=timedelta(0)):
+    rows = [dict(attendance_row(device_id, i, str(100 + i), None, datetime.utcnow() - timedelta(minutes=i), "1",
+                                sn=f"SN{device_id}"), created_at=datetime.utcnow() - age) for i in range(n)]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+
+
+def _sync_replica(tmp_path):
+    """Copy the primary into the replica file (what replication would have done)."""
+    db.engines["replica"].dispose()
+    src, dst = sqlite3.connect(tmp_path / "app.db"), sqlite3.connect(tmp_path / "replica.db")
+    src.backup(dst)
+    # tell the two apart in responses
+    dst.execute("UPDATE branches SET name = 'FROM-REPLICA'")
+    dst.commit()
+    src.close()
+    return dst
+
+
+def test_reads_follow_replica_health(replica_app, tmp_path):
+    client = replica_app.test_client()
+    _insert(1, 20)
+    replica = _sync_replica(tmp_path)
+
+    resp = client.get("/api/devices/")
+    assert resp.headers["X-Read-Source"] == "replica"
+    assert resp.get_json()[0]["name"] == "FROM-REPLICA"
+    assert client.get("/api/logs/stats").get_json()["total"] == 20
+
+    # the primary has rows the replica lacks, written two minutes ago
+    _insert(2, 5, age=timedelta(minutes=2))
+    resp = client.get("/api/devices/")
+    assert (resp.headers["X-Read-Source"], resp.get_json()[0]["name"]) == ("primary", "B1")
+    status = client.get("/api/admin/replica").get_json()["result"]
+    assert status["ok"] is False and status["lag_seconds"] >= 120
+
+    replica.close()
+    replica = _sync_replica(tmp_path)
+    assert client.get("/api/devices/").headers["X-Read-Source"] == "replica"
+
+    # healthy at the probe, but the request fails on the replica: re-run on the primary
+    replica.execute("DROP TABLE sync_cursors")
+    replica.commit()
+    replica.close()
+    resp = client.get("/api/logs/stats")
+    assert (resp.status_code, resp.headers["X-Read-Source"]) == (200, "primary")
+    assert resp.get_json()["total"] == 25
+
+
+def test_writes_stay_on_the_primary(replica_app, tmp_path):
+    _sync_replica(tmp_path).close()
+    client = replica_app.test_client()
+    assert client.put("/api/devices/device/1", json={"name": "D1x"}).status_code == 200
+    with sqlite3.connect(tmp_path / "app.db") as primary:
+        assert primary.execute("SELECT name FROM devices WHERE id = 1").fetchone() == ("D1x",)
@@ -0,0 +1,63 @@
+# Test/unit/test_retention.py
+"""Chunked, throttled purges and the retention job's progress entries."""
+import time
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.ingest import IngestBatch, attendance_row, write_batches
+from app.models import AttendanceLog, DeviceLogCounter, IngestDeadLetter
+from app.retention import purge_rows, start_retention_job
+
+NOW = datetime.utcnow()
+
+
+def _ingest(device_id, n, age_days, exported=False):
+    rows = [dict(attendance_row(device_id, i, str(100 + i % 4), None, NOW - timedelta(days=age_days, minutes=i), "1",
+                                sn=f"SN{device_id}"), exported=exported) for i in range(n)]
+    write_batches(db.session, [IngestBatch(device_id, sn=f"SN{device_id}", attendance_rows=rows)])
+    db.session.commit()
+
+
+def _device_count(device_id):
+    db.session.remove()
+    return db.session.get(DeviceLogCounter, device_id).log_count
+
+
+def test_purge_deletes_in_chunks_and_keeps_counters(app):
+    _ingest(1, 25, age_days=1)
+    calls = []
+    res = purge_rows("attendance_logs", AttendanceLog.device_id == 1, chunk_size=10,
+                     progress=lambda deleted, chunks: calls.append((deleted, chunks)))
+    assert res == {"deleted": 25, "chunks": 3, "complete": True}
+    assert calls == [(10, 1), (20, 2), (25, 3)]
+    assert AttendanceLog.query.count() == 0
+    assert _device_count(1) == 0
+
+
+def test_purge_stops_at_the_deadline(app):
+    _ingest(1, 5, age_days=1)
+    res = purge_rows("attendance_logs", AttendanceLog.device_id == 1, chunk_size=2, deadline=time.monotonic() - 1)
+    assert res == {"deleted": 0, "chunks": 0, "complete": False}
+    assert AttendanceLog.query.count() == 5
+
+
+def test_retention_job_reports_per_table_progress(app):
+    app.config["RETENTION_POLICIES"] = {"attendance_logs": {"keep_days": 30, "chunk": 7},
+                                        "ingest_dead_letters": {"keep_days": 90}}
+    _ingest(1, 20, age_days=40, exported=True)
+    _ingest(2, 5, age_days=40)                  # not exported yet: kept
+    _ingest(3, 5, age_days=1, exported=True)
+    for days in (100, 101, 1):
+        db.session.add(IngestDeadLetter(payload="{}", error="x", created_at=NOW - timedelta(days=days)))
+    db.session.commit()
+
+    job_id = start_retention_job(app, background=False)
+    job = app.test_client().get(f"/api/sync/job/{job_id}").get_json()
+    assert (job["type"], job["status"], job["done"], job["total"]) == ("retention", "finished", 2, 2)
+    assert [(e["table"], e["deleted"], e["chunks"], e["status"]) for e in job["results"]] == [
+        ("attendance_logs", 20, 3, "done"), ("ingest_dead_letters", 2, 1, "done")]
+
+    db.session.remove()
+    assert {d: AttendanceLog.query.filter_by(device_id=d).count() for d in (1, 2, 3)} == {1: 0, 2: 5, 3: 5}
+    assert IngestDeadLetter.query.count() == 1
+    assert _device_count(1) == 0
@@ -0,0 +1,128 @@
+# Test/unit/test_rollups.py
+"""Daily rollups stay equal to the base rows through duplicate-dropping inserts."""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+
+from app.archive import archive_month
+from app.extensions import db
+from app.ingest import IngestBatch, attendance_row, write_batches
+from app.models import AttendanceLog, BadgeDailyRollup, DeviceDailyRollup
+from app.rollups import rebuild_rollups, refresh_rollups, refresh_rollups_for_rows, rollups_ready
+
+DAY = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def _rows(device_id, n, start=0):
+    return [attendance_row(device_id, start + i, str(100 + i % 3), None, DAY + timedelta(minutes=start + i), "1",
+                           sn=f"SN{device_id}") for i in range(n)]
+
+
+def _write(*batches):
+    batches = list(batches)
+    write_batches(db.session, batches, rollups=True)
+    db.session.commit()
+    return [b.inserted for b in batches]
+
+
+def _badge_rollups():
+    return {r.badge: (r.punches, r.devices, r.first_punch, r.last_punch)
+            for r in BadgeDailyRollup.query.filter_by(day=DAY.date())}
+
+
+def _badge_truth():
+    al = AttendanceLog
+    q = (db.session.query(al.user_id, func.count(), func.count(func.distinct(al.device_id)),
+                          func.min(al.timestamp), func.max(al.timestamp)).group_by(al.user_id))
+    return {badge: (n, devices, first, last) for badge, n, devices, first, last in q}
+
+
+def test_rollups_match_base_rows_after_duplicates_are_dropped(app):
+    first = _rows(1, 30)
+    assert _write(IngestBatch(1, sn="SN1", attendance_rows=first)) == [30]
+
+    # the same punches again (re-read after a device reset) plus a few new ones, from two devices
+    again = first + _rows(1, 5, start=30)
+    other = _rows(2, 6)
+    assert _write(IngestBatch(1, sn="SN1", attendance_rows=again), IngestBatch(2, sn="SN2", attendance_rows=other)) == [5, 6]
+
+    assert AttendanceLog.query.count() == 41
+    assert _badge_rollups() == _badge_truth()
+    devices = {r.device_id: r.punches for r in DeviceDailyRollup.query.filter_by(day=DAY.date())}
+    assert devices == {1: 35, 2: 6}
+    # one rollup row per (day, badge)
+    assert BadgeDailyRollup.query.count() == 3
+
+
+def test_refreshing_the_same_region_twice_keeps_one_row_per_key(app):
+    _write(IngestBatch(1, sn="SN1", attendance_rows=_rows(1, 9)))
+    with db.engine.begin() as conn:
+        refresh_rollups(conn, DAY, DAY)
+    with db.engine.begin() as conn:
+        refresh_rollups(conn, DAY, DAY, badges={"100"})
+    assert BadgeDailyRollup.query.count() == 3
+    assert DeviceDailyRollup.query.count() == 1
+    assert _badge_rollups() == _badge_truth()
+
+
+def test_ingest_refreshes_only_the_day_badge_pairs_it_touched(app):
+    day2 = DAY + timedelta(days=1)
+    sentinel = {"punches": 999, "updated_at": DAY}
+    with db.engine.begin() as conn:
+        # rollup rows the batch below has no rows for: a badge on another day, a device on another day
+        conn.execute(BadgeDailyRollup.__table__.insert(), [dict(sentinel, day=DAY.date(), badge="200", devices=1,
+                                                                   first_punch=DAY, last_punch=DAY)])
+        conn.execute(DeviceDailyRollup.__table__.insert(), [dict(sentinel, day=day2.date(), device_id=1)])
+        rows = [attendance_row(1, 1, "100", None, DAY, "1", sn="SN1"),
+                attendance_row(2, 2, "200", None, day2, "1", sn="SN2")]
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+        res = refresh_rollups_for_rows(conn, rows)
+    assert res == {"badge_rows": 2, "device_rows": 2}
+
+    assert BadgeDailyRollup.query.filter_by(day=DAY.date(), badge="200").one().punches == 999
+    assert DeviceDailyRollup.query.filter_by(day=day2.date(), device_id=1).one().punches == 999
+    assert BadgeDailyRollup.query.filter_by(day=day2.date(), badge="200").one().punches == 1
+    assert DeviceDailyRollup.query.filter_by(day=DAY.date(), device_id=1).one().punches == 1
+
+
+def test_stats_count_base_rows_until_rollups_are_rebuilt(app):
+    # rows that predate the rollups (written without them)
+    write_batches(db.session, [IngestBatch(1, sn="SN1", attendance_rows=_rows(1, 12))])
+    db.session.commit()
+    client = app.test_client()
+    url = "/api/logs/stats?start_date=2026-10-01&end_date=2026-10-02"
+
+    assert not rollups_ready()
+    assert client.get(url).get_json()["total"] == 12
+
+    rebuild_rollups()
+    assert rollups_ready()
+    body = client.get(url).get_json()
+    assert body["total"] == 12
+    assert sum(u["count"] for u in body["top_users"]) == 12
+    assert body["top_devices"] == [{"device_id": 1, "device_name": "D1", "count": 12}]
+
+
+def test_archived_and_hot_rows_of_one_day_are_not_counted_twice(app, tmp_path):
+    archive_dir = str(tmp_path / "archive")
+    old = datetime(2025, 9, 1, 8, 0, 0)
+    rows = [dict(attendance_row(1, i, "100", None, old + timedelta(minutes=i), "1", sn="SN1"), exported=True)
+            for i in range(6)]
+    with db.engine.begin() as conn:
+        conn.execute(AttendanceLog.__table__.insert(), rows)
+    assert archive_month(archive_dir, date(2025, 9, 1), 1)["deleted"] == 6
+
+    with db.engine.begin() as conn:
+        # an interrupted archive run left one archived row in the hot table
+        leftover = dict(rows[0], id=1)
+        conn.execute(AttendanceLog.__table__.insert(), [leftover])
+        # and a late punch of the same badge and day from another device
+        conn.execute(AttendanceLog.__table__.insert(),
+                     [dict(attendance_row(2, 99, "100", None, old + timedelta(hours=2), "1", sn="SN2"), id=100)])
+        refresh_rollups(conn, old, old, archive_dir=archive_dir)
+
+    r = BadgeDailyRollup.query.filter_by(day=old.date(), badge="100").one()
+    assert (r.punches, r.devices) == (7, 2)
+    assert (r.first_punch, r.last_punch) == (old, old + timedelta(hours=2))
+    devices = {d.device_id: d.punches for d in DeviceDailyRollup.query.filter_by(day=old.date())}
+    assert devices == {1: 6, 2: 1}
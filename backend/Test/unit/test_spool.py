@@ -0,0 +1,56 @@
+# Test/unit/test_spool.py
+"""The durable ingest spool: batches survive a crash between take and ack."""
+import threading
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.ingest import IngestBatch, attendance_row, write_batches
+from app.models import AttendanceLog
+from app.spool import IngestSpool
+
+BASE = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def _batch(device_id, n):
+    rows = [attendance_row(device_id, i, str(100 + i), None, BASE + timedelta(minutes=i), "1", sn=f"SN{device_id}")
+            for i in range(n)]
+    return IngestBatch(device_id, device_name=f"D{device_id}", sn=f"SN{device_id}", attendance_rows=rows)
+
+
+def _take(spool):
+    return spool.take(flush_rows=1, flush_interval=0, max_txn_rows=100000, stop_event=threading.Event())
+
+
+def test_batches_taken_but_not_acked_are_replayed_after_a_crash(app, tmp_path):
+    path = str(tmp_path / "spool" / "ingest.sqlite")
+    spool = IngestSpool(path)
+    spool.put(_batch(1, 5))
+    spool.put(_batch(2, 3))
+    seqs, batches = _take(spool)
+    assert len(seqs) == 2
+    # the process dies before the main DB commit: nothing acked
+
+    spool = IngestSpool(path)
+    assert spool.depth()["queue_rows"] == 8
+    seqs, batches = _take(spool)
+    assert [(b.device_id, b.sn, b.size) for b in batches] == [(1, "SN1", 5), (2, "SN2", 3)]
+    assert batches[0].attendance_rows[0]["timestamp"] == BASE
+
+    write_batches(db.session, batches)
+    db.session.commit()
+    spool.ack(seqs, batches)
+    assert spool.is_drained()
+    assert AttendanceLog.query.count() == 8
+    assert IngestSpool(path).depth()["queue_batches"] == 0
+
+
+def test_released_batches_stay_spooled_for_the_next_attempt(app, tmp_path):
+    spool = IngestSpool(str(tmp_path / "ingest.sqlite"))
+    spool.put(_batch(1, 4))
+    seqs, batches = _take(spool)
+    assert spool.release(seqs, batches, RuntimeError("database is down")) is False
+
+    depth = spool.depth()
+    assert (depth["queue_rows"], depth["in_flight_batches"], depth["max_attempts"]) == (4, 0, 1)
+    again, batches = _take(spool)
+    assert again == seqs and batches[0].size == 4
@@ -11,6 +11,8 @@ from .views.logs import bp as logs_bp
 from .views.sync import bp as sync_bp
 from .views.admin import bp as admin_bp
 from .logging_handler import init_socketio_logging
+from .events import init_event_bus
+from .replica import configure_replica_bind
 
 # scheduler controls (moved out of tasks.py)
 from app.scheduler import (
@@ -34,6 +36,7 @@ def create_app(config_class=Config):
     CORS(app, resources={r"/api/*": {"origins": origins}})
 
     # Initialize extensions with app
+    configure_replica_bind(app)
     db.init_app(app)
     migrate.init_app(app, db)
     socketio.init_app(app)
@@ -88,5 +91,6 @@ def create_app(config_class=Config):
         return jsonify({"jobs": list_jobs()}), 200
 
     init_socketio_logging()
+    init_event_bus(app)
 
     return app
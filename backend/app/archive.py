@@ -0,0 +1,544 @@
+# app/archive.py
+"""
+Cold archive tier for attendance_logs.
+
+Closed months older than ARCHIVE_AFTER_MONTHS are moved out of the hot table
+into one compressed columnar file per month and branch:
+
+    <ARCHIVE_DIR>/attendance_<YYYYMM>_b<branch_id>.npz     (numpy savez_compressed)
+    <ARCHIVE_DIR>/manifest.json                            (one entry per file)
+
+Each file holds one array per column (ARCHIVE_COLUMNS). Nullable text columns
+carry a `<col>__null` mask, badge_id uses -1 for NULL and datetimes use NaT, so
+the files load with allow_pickle=False. Device and badge labels are copied in
+so archived rows still render after a device or badge is removed.
+
+A month/branch is only archived once every row in it has been exported. The
+file is written and verified, the manifest updated, and only then are the hot
+rows deleted (in id chunks); a crash in between leaves rows in both places,
+which readers drop by id and the next run deletes. Files are only rewritten
+when a device's logs are deleted (`purge_device_rows`).
+
+Readers (`ArchiveReader`) filter the columns with vectorised numpy and return
+plain dicts shaped like the /api/logs items.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import date, datetime
+
+import numpy as np
+from colorama import Fore
+from sqlalchemy import select, delete, func
+
+from .extensions import db
+from .models import AttendanceLog, Device, Badge
+from .partitions import month_start, add_months, month_bounds
+
+MANIFEST_NAME = "manifest.json"
+ARCHIVE_VERSION = 1
+
+# column -> kind; "str" columns are nullable text with a __null mask
+ARCHIVE_COLUMNS = {
+    "id": "int",
+    "device_id": "int",
+    "record_id": "int",
+    "user_id": "str",
+    "device_userid": "str",
+    "badge_id": "int_null",
+    "badge_number": "str",
+    "device_name": "str",
+    "timestamp": "datetime",
+    "status": "str",
+    "created_at": "datetime",
+    "natural_key": "str",
+    "exported_at": "datetime",
+}
+
+_MANIFEST_LOCK = threading.Lock()
+
+
+def archive_file_name(month, branch_id):
+    return f"attendance_{month:%Y%m}_b{int(branch_id)}.npz"
+
+
+# -------------------------
+# Manifest
+# -------------------------
+def load_manifest(archive_dir):
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"version": ARCHIVE_VERSION, "files": {}}
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _save_manifest(archive_dir, manifest):
+    path = os.path.join(archive_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _entry_key(month, branch_id):
+    return f"{month:%Y%m}/b{int(branch_id)}"
+
+
+def manifest_entries(archive_dir, start=None, end=None, branch_id=None):
+    """Manifest entries whose month overlaps [start, end) (either bound optional)."""
+    out = []
+    for entry in load_manifest(archive_dir).get("files", {}).values():
+        lo, hi = datetime.fromisoformat(entry["month_start"]), datetime.fromisoformat(entry["month_end"])
+        if start is not None and hi <= start:
+            continue
+        if end is not None and lo >= end:
+            continue
+        if branch_id is not None and int(entry["branch_id"]) != int(branch_id):
+            continue
+        out.append(entry)
+    return sorted(out, key=lambda e: (e["month_start"], e["branch_id"]))
+
+
+def archived_through(archive_dir, branch_id=None):
+    """End of the newest archived month (for a branch, or any branch); None when nothing is archived."""
+    ends = [datetime.fromisoformat(e["month_end"]) for e in manifest_entries(archive_dir, branch_id=branch_id)]
+    return max(ends) if ends else None
+
+
+# -------------------------
+# Columnar encode / decode
+# -------------------------
+def _encode_columns(rows):
+    cols = {}
+    for name, kind in ARCHIVE_COLUMNS.items():
+        values = [r.get(name) for r in rows]
+        if kind == "int":
+            cols[name] = np.array(values, dtype=np.int64)
+        elif kind == "int_null":
+            cols[name] = np.array([-1 if v is None else v for v in values], dtype=np.int64)
+        elif kind == "datetime":
+            cols[name] = np.array([np.datetime64("NaT") if v is None else np.datetime64(v, "us") for v in values],
+                                  dtype="datetime64[us]")
+        else:
+            cols[name] = np.array(["" if v is None else str(v) for v in values], dtype=str)
+            cols[name + "__null"] = np.array([v is None for v in values], dtype=bool)
+    return cols
+
+
+def write_archive_file(path, rows):
+    """Write rows as a compressed .npz (atomically) and return its sha256."""
+    return _write_columns(path, _encode_columns(rows))
+
+
+def _write_columns(path, cols):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        np.savez_compressed(fh, **cols)
+    os.replace(tmp, path)
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+_FILE_CACHE = {}
+_FILE_CACHE_LOCK = threading.Lock()
+_FILE_CACHE_MAX = 32
+
+
+def load_archive_file(path):
+    """Column dict for one archive file; files are immutable, so loads are cached by (path, mtime)."""
+    key = (path, os.path.getmtime(path))
+    with _FILE_CACHE_LOCK:
+        cols = _FILE_CACHE.get(key)
+    if cols is not None:
+        return cols
+    with np.load(path, allow_pickle=False) as npz:
+        cols = {k: npz[k] for k in npz.files}
+    with _FILE_CACHE_LOCK:
+        if len(_FILE_CACHE) >= _FILE_CACHE_MAX:
+            _FILE_CACHE.pop(next(iter(_FILE_CACHE)))
+        _FILE_CACHE[key] = cols
+    return cols
+
+
+def _concat(files):
+    if not files:
+        return _encode_columns([])
+    if len(files) == 1:
+        return dict(files[0])
+    return {k: np.concatenate([f[k] for f in files]) for k in files[0]}
+
+
+# -------------------------
+# Read side
+# -------------------------
+class ArchiveReader:
+    """
+    Filtered view over the archive files whose month overlaps [start, end).
+    Rows are narrowed with the filter_* methods, which mirror views/logs.py:
+    device, user/badge substring, status substring, timestamp range and q.
+    """
+
+    def __init__(self, archive_dir, start=None, end=None, branch_id=None):
+        self.entries = manifest_entries(archive_dir, start, end, branch_id)
+        files = []
+        for e in self.entries:
+            path = os.path.join(archive_dir, e["file"])
+            if os.path.exists(path):
+                files.append(load_archive_file(path))
+        self.cols = _concat(files)
+        self.mask = np.ones(len(self.cols["id"]), dtype=bool)
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def _contains(self, name, needle):
+        col = self.cols[name]
+        if col.dtype.kind in "Mm":
+            col = np.char.replace(np.datetime_as_string(col, unit="s"), "T", " ")
+        elif col.dtype.kind != "U":
+            col = col.astype(str)
+        hit = np.char.find(np.char.lower(col), needle.lower()) >= 0
+        null = self.cols.get(name + "__null")
+        return hit & ~null if null is not None else hit
+
+    def filter_device(self, device_id):
+        self.mask &= self.cols["device_id"] == int(device_id)
+
+    def filter_user(self, text):
+        self.mask &= (self._contains("user_id", text) | self._contains("device_userid", text)
+                      | self._contains("badge_number", text))
+
+    def filter_status(self, text):
+        self.mask &= self._contains("status", text)
+
+    def filter_range(self, start=None, end=None, end_inclusive=False):
+        ts = self.cols["timestamp"]
+        if start is not None:
+            self.mask &= ts >= np.datetime64(start, "us")
+        if end is not None:
+            self.mask &= (ts <= np.datetime64(end, "us")) if end_inclusive else (ts < np.datetime64(end, "us"))
+
+    def filter_text(self, text):
+        hit = np.zeros(len(self.mask), dtype=bool)
+        for name in ("id", "device_id", "record_id", "user_id", "device_userid", "timestamp", "status", "created_at"):
+            hit |= self._contains(name, text)
+        self.mask &= hit
+
+    def filter_values(self, name, values):
+        """Keep rows whose column is one of `values` (None matches NULL)."""
+        values = list(values)
+        keep = np.isin(self.cols[name], np.array([v for v in values if v is not None], dtype=self.cols[name].dtype))
+        null = self.cols.get(name + "__null")
+        if null is not None:
+            keep &= ~null
+            if None in values:
+                keep |= null
+        self.mask &= keep
+
+    def exclude_ids(self, ids):
+        if ids:
+            self.mask &= ~np.isin(self.cols["id"], np.fromiter(ids, dtype=np.int64))
+
+    # ---- results ----
+    def _value(self, name, i):
+        col = self.cols[name]
+        kind = ARCHIVE_COLUMNS[name]
+        if kind == "int":
+            return int(col[i])
+        if kind == "int_null":
+            return None if col[i] < 0 else int(col[i])
+        if kind == "datetime":
+            v = col[i]
+            return None if np.isnat(v) else v.astype("datetime64[us]").item()
+        return None if self.cols[name + "__null"][i] else str(col[i])
+
+    def sorted_indices(self, sort_by="timestamp", descending=True):
+        idx = np.flatnonzero(self.mask)
+        key = self.cols.get(sort_by if sort_by in ARCHIVE_COLUMNS else "timestamp")
+        order = np.argsort(key[idx], kind="stable")
+        if descending:
+            order = order[::-1]
+        return idx[order]
+
+    def rows(self, indices):
+        names = list(ARCHIVE_COLUMNS)
+        return [{n: self._value(n, i) for n in names} for i in indices]
+
+    def daily_groups(self, key):
+        """
+        Aggregates per (day, <key>) over the matching rows, as dicts with day, key,
+        first_punch, last_punch, punches, devices and badge_id (max).
+        """
+        m = self.mask
+        if not m.any():
+            return []
+        ts = self.cols["timestamp"][m]
+        days = ts.astype("datetime64[D]").astype(np.int64)
+        vals = self.cols[key][m]
+        null = self.cols.get(key + "__null")
+        uniq, codes = np.unique(vals, return_inverse=True)
+        codes = codes.reshape(-1)
+        if null is not None:
+            codes = np.where(null[m], len(uniq), codes)
+        group_keys, ginv = np.unique(days * (len(uniq) + 1) + codes, return_inverse=True)
+        ginv = ginv.reshape(-1)
+        order = np.argsort(ginv, kind="stable")
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(ginv[order])) + 1))
+        t = ts.astype(np.int64)[order]
+        first = np.minimum.reduceat(t, starts)
+        last = np.maximum.reduceat(t, starts)
+        punches = np.bincount(ginv)
+        badge_ids = np.maximum.reduceat(self.cols["badge_id"][m][order], starts)
+        dev = self.cols["device_id"][m]
+        width = int(dev.max()) + 1
+        pairs = np.unique(ginv.astype(np.int64) * width + dev)
+        devices = np.bincount(pairs // width, minlength=len(group_keys))
+
+        out = []
+        for i, gk in enumerate(group_keys):
+            code = int(gk % (len(uniq) + 1))
+            out.append({
+                "day": np.datetime64(int(gk // (len(uniq) + 1)), "D").item(),
+                "key": None if code == len(uniq) else uniq[code].item(),
+                "first_punch": np.datetime64(int(first[i]), "us").item(),
+                "last_punch": np.datetime64(int(last[i]), "us").item(),
+                "punches": int(punches[i]),
+                "devices": int(devices[i]),
+                "badge_id": None if badge_ids[i] < 0 else int(badge_ids[i]),
+            })
+        return out
+
+    def daily_device_sets(self, key):
+        """{(day, <key>): {device ids}} over the matching rows (None key for NULL text)."""
+        m = self.mask
+        if not m.any():
+            return {}
+        days = self.cols["timestamp"][m].astype("datetime64[D]").astype(np.int64)
+        uniq, codes = np.unique(self.cols[key][m], return_inverse=True)
+        codes = codes.reshape(-1)
+        null = self.cols.get(key + "__null")
+        if null is not None:
+            codes = np.where(null[m], len(uniq), codes)
+        out = {}
+        for d, code, dev in np.unique(np.stack([days, codes, self.cols["device_id"][m]], axis=1), axis=0):
+            k = (np.datetime64(int(d), "D").item(), None if code == len(uniq) else uniq[code].item())
+            out.setdefault(k, set()).add(int(dev))
+        return out
+
+    def count_by(self, name):
+        """{value: count} over the matching rows (None for NULL text)."""
+        m = self.mask
+        if name == "date":
+            vals = self.cols["timestamp"][m].astype("datetime64[D]")
+            keys, counts = np.unique(vals, return_counts=True)
+            return {k.item(): int(c) for k, c in zip(keys, counts)}
+        vals = self.cols[name][m]
+        null = self.cols.get(name + "__null")
+        out = {}
+        if null is not None:
+            nulls = int(null[m].sum())
+            if nulls:
+                out[None] = nulls
+            vals = vals[~null[m]]
+        keys, counts = np.unique(vals, return_counts=True)
+        for k, c in zip(keys, counts):
+            out[k.item()] = out.get(k.item(), 0) + int(c)
+        return out
+
+
+# -------------------------
+# Write side (archive job)
+# -------------------------
+def _month_rows(conn, lo, hi, branch_id, after_id, limit):
+    al = AttendanceLog.__table__
+    dev = Device.__table__
+    bd = Badge.__table__
+    return conn.execute(
+        select(al.c.id, al.c.device_id, al.c.record_id, al.c.user_id, al.c.device_userid, al.c.badge_id,
+               bd.c.badge_number, dev.c.name.label("device_name"), al.c.timestamp, al.c.status,
+               al.c.created_at, al.c.natural_key, al.c.exported_at)
+        .select_from(al.join(dev, dev.c.id == al.c.device_id).outerjoin(bd, bd.c.id == al.c.badge_id))
+        .where(dev.c.branch_id == branch_id, al.c.timestamp >= lo, al.c.timestamp < hi, al.c.id > after_id)
+        .order_by(al.c.id)
+        .limit(limit)
+    ).mappings().all()
+
+
+def _branch_device_ids(conn, branch_id):
+    return conn.execute(select(Device.id).where(Device.branch_id == branch_id)).scalars().all()
+
+
+def archive_month(archive_dir, month, branch_id, chunk_size=5000, sleep_seconds=0.0):
+    """
+    Move one closed month of one branch into the archive. Returns a result dict;
+    status is "archived", "empty" or "unexported" (left alone). Must run inside an app context.
+    """
+    lo, hi = month_bounds(month)
+    al = AttendanceLog.__table__
+    with db.engine.connect() as conn:
+        device_ids = _branch_device_ids(conn, branch_id)
+        if not device_ids:
+            return {"status": "empty"}
+        in_month = [al.c.device_id.in_(device_ids), al.c.timestamp >= lo, al.c.timestamp < hi]
+        pending = conn.execute(select(func.count()).select_from(al).where(*in_month, al.c.exported.is_(False))).scalar()
+        if pending:
+            return {"status": "unexported", "unexported": int(pending)}
+
+        key = _entry_key(month, branch_id)
+        already = load_manifest(archive_dir).get("files", {}).get(key)
+        if already is None:
+            rows, after_id = [], 0
+            while True:
+                chunk = _month_rows(conn, lo, hi, branch_id, after_id, int(chunk_size))
+                if not chunk:
+                    break
+                rows.extend(dict(r) for r in chunk)
+                after_id = chunk[-1]["id"]
+            if not rows:
+                return {"status": "empty"}
+    if already is None:
+        os.makedirs(archive_dir, exist_ok=True)
+        name = archive_file_name(month, branch_id)
+        path = os.path.join(archive_dir, name)
+        digest = write_archive_file(path, rows)
+        if len(load_archive_file(path)["id"]) != len(rows):
+            raise RuntimeError(f"archive verify failed for {name}")
+        ts = [r["timestamp"] for r in rows]
+        entry = {
+            "file": name, "branch_id": int(branch_id), "month": f"{month:%Y-%m}",
+            "month_start": lo.isoformat(), "month_end": hi.isoformat(),
+            "rows": len(rows), "min_id": rows[0]["id"], "max_id": rows[-1]["id"],
+            "min_ts": min(ts).isoformat(), "max_ts": max(ts).isoformat(),
+            "sha256": digest, "bytes": os.path.getsize(path), "created_at": datetime.utcnow().isoformat(),
+        }
+        with _MANIFEST_LOCK:
+            manifest = load_manifest(archive_dir)
+            manifest.setdefault("files", {})[key] = entry
+            _save_manifest(archive_dir, manifest)
+    else:
+        entry = already
+
+    # only ids recorded in the file are removed from the hot table
+    archived_ids = load_archive_file(os.path.join(archive_dir, entry["file"]))["id"]
+    deleted = 0
+    for i in range(0, len(archived_ids), int(chunk_size)):
+        ids = [int(x) for x in archived_ids[i:i + int(chunk_size)]]
+        with db.engine.begin() as conn:
+            res = conn.execute(delete(al).where(al.c.id.in_(ids), al.c.timestamp >= lo, al.c.timestamp < hi))
+        deleted += res.rowcount or 0
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+    return {"status": "archived", "file": entry["file"], "rows": entry["rows"], "deleted": deleted}
+
+
+def purge_device_rows(archive_dir, device_id):
+    """
+    Remove one device's rows from the archive: each file holding some is rewritten
+    without them (deleted when nothing is left) and its manifest entry updated.
+    Returns {"deleted": n, "first": ts, "last": ts}; first/last are None when the
+    archive had no rows of the device.
+    """
+    deleted, first, last = 0, None, None
+    with _MANIFEST_LOCK:
+        manifest = load_manifest(archive_dir)
+        files = manifest.get("files", {})
+        for key, entry in sorted(files.items()):
+            path = os.path.join(archive_dir, entry["file"])
+            if not os.path.exists(path):
+                continue
+            cols = load_archive_file(path)
+            hit = cols["device_id"] == int(device_id)
+            if not hit.any():
+                continue
+            ts = cols["timestamp"][hit]
+            lo, hi = ts.min().astype("datetime64[us]").item(), ts.max().astype("datetime64[us]").item()
+            first = lo if first is None else min(first, lo)
+            last = hi if last is None else max(last, hi)
+            deleted += int(hit.sum())
+            if hit.all():
+                os.remove(path)
+                del files[key]
+                continue
+            kept = {k: v[~hit] for k, v in cols.items()}
+            kept_ts = kept["timestamp"]
+            entry.update({
+                "rows": len(kept["id"]), "min_id": int(kept["id"].min()), "max_id": int(kept["id"].max()),
+                "min_ts": kept_ts.min().astype("datetime64[us]").item().isoformat(),
+                "max_ts": kept_ts.max().astype("datetime64[us]").item().isoformat(),
+                "sha256": _write_columns(path, kept), "bytes": os.path.getsize(path),
+            })
+        if deleted:
+            _save_manifest(archive_dir, manifest)
+    return {"deleted": deleted, "first": first, "last": last}
+
+
+def archive_candidates(after_months, today=None):
+    """(month, branch_id) pairs with hot rows in months closed more than `after_months` ago."""
+    cutoff = datetime.combine(add_months(month_start(today or date.today()), -int(after_months)), datetime.min.time())
+    al = AttendanceLog.__table__
+    dev = Device.__table__
+    with db.engine.connect() as conn:
+        oldest = conn.execute(select(func.min(al.c.timestamp)).where(al.c.timestamp < cutoff)).scalar()
+        if oldest is None:
+            return []
+        out = []
+        lo = month_bounds(oldest)[0]
+        while lo < cutoff:
+            hi = month_bounds(lo)[1]
+            branches = conn.execute(
+                select(dev.c.branch_id).select_from(al.join(dev, dev.c.id == al.c.device_id))
+                .where(al.c.timestamp >= lo, al.c.timestamp < hi).distinct()
+            ).scalars().all()
+            out.extend((lo.date(), b) for b in sorted(branches))
+            lo = hi
+    return out
+
+
+def run_archive(archive_dir, after_months, chunk_size=5000, sleep_seconds=0.0, today=None):
+    """Archive every eligible month/branch. Must run inside an app context."""
+    results = []
+    for month, branch_id in archive_candidates(after_months, today=today):
+        res = archive_month(archive_dir, month, branch_id, chunk_size=chunk_size, sleep_seconds=sleep_seconds)
+        res.update({"month": f"{month:%Y-%m}", "branch_id": branch_id})
+        results.append(res)
+    summary = {
+        "archived": sum(1 for r in results if r["status"] == "archived"),
+        "rows": sum(r.get("deleted", 0) for r in results),
+        "skipped_unexported": [f"{r['month']}/b{r['branch_id']}" for r in results if r["status"] == "unexported"],
+        "files": results,
+    }
+    return summary
+
+
+def archive_dir_for(app):
+    return app.config.get("ARCHIVE_DIR") or "archive"
+
+
+def run_archive_job(app):
+    """Scheduler entry point."""
+    with app.app_context():
+        t0 = time.time()
+        try:
+            res = run_archive(
+                archive_dir_for(app),
+                app.config.get("ARCHIVE_AFTER_MONTHS", 6),
+                chunk_size=app.config.get("ARCHIVE_CHUNK", 5000),
+                sleep_seconds=app.config.get("ARCHIVE_SLEEP_SECONDS", 0.0),
+            )
+            if res["archived"]:
+                print(Fore.CYAN + f"[ARCHIVE] moved {res['rows']} rows into {res['archived']} file(s) "
+                                  f"in {time.time() - t0:.2f}s")
+            if res["skipped_unexported"]:
+                print(Fore.YELLOW + f"[ARCHIVE] not archived (unexported rows): {res['skipped_unexported']}")
+            return res
+        except Exception as e:
+            print(Fore.RED + f"[ARCHIVE ERROR] {e}")
+            return {"error": str(e)}
+        finally:
+            db.session.remove()
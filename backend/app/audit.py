@@ -0,0 +1,301 @@
+# app/audit.py
+"""
+Background audit writer.
+
+Poll workers hand their per-poll audit data to one writer thread and return:
+
+  * insert audit rows go to gzip CSVs under SCHEDULER_LOG_DIR, one file per
+    stream/serial/day (access_inserts_<sn>_<YYYYMMDD>.csv.gz); each flush appends
+    a complete gzip member, so the file stays readable (zcat, pandas) at any time;
+  * unmapped badges are upserted into the unmapped_badges table
+    (badge, serial, first/last seen, count) and served by /api/logs/unmapped.
+
+Files older than AUDIT_RETENTION_DAYS are removed when the day rolls over (only
+the writer's own <stream>_*.csv.gz files; anything else in the directory is left
+alone). Unmapped badges whose upsert fails stay queued for the next flush.
+"""
+import io
+import os
+import csv
+import gzip
+import time
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+
+from colorama import Fore
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .extensions import db
+from .models import UnmappedBadge
+
+INSERTS_STREAM = "access_inserts"
+INSERTS_HEADER = ("record_id", "timestamp", "userid", "status", "sn")
+
+
+def _upsert_unmapped_stmt(dialect_name):
+    t = UnmappedBadge.__table__
+    if dialect_name == "mysql":
+        ins = mysql_insert(t)
+        return ins.on_duplicate_key_update(
+            first_seen=func.least(t.c.first_seen, ins.inserted.first_seen),
+            last_seen=func.greatest(t.c.last_seen, ins.inserted.last_seen),
+            seen_count=t.c.seen_count + ins.inserted.seen_count,
+            device_id=ins.inserted.device_id,
+        )
+    if dialect_name in ("sqlite", "postgresql"):
+        ins = (sqlite_insert if dialect_name == "sqlite" else pg_insert)(t)
+        lo, hi = (func.min, func.max) if dialect_name == "sqlite" else (func.least, func.greatest)
+        return ins.on_conflict_do_update(
+            index_elements=["sn", "badge"],
+            set_={
+                "first_seen": lo(t.c.first_seen, ins.excluded.first_seen),
+                "last_seen": hi(t.c.last_seen, ins.excluded.last_seen),
+                "seen_count": t.c.seen_count + ins.excluded.seen_count,
+                "device_id": ins.excluded.device_id,
+            },
+        )
+    return None
+
+
+def upsert_unmapped_badges(conn, rows):
+    """
+    rows: dicts with badge, sn, device_id, first_seen, last_seen, seen_count.
+    Merges into unmapped_badges inside the caller's transaction.
+    """
+    if not rows:
+        return 0
+    stmt = _upsert_unmapped_stmt(conn.dialect.name)
+    if stmt is not None:
+        conn.execute(stmt, rows)
+        return len(rows)
+    # generic fallback: read-modify-write
+    t = UnmappedBadge.__table__
+    for r in rows:
+        cur = conn.execute(db.select(t.c.id, t.c.first_seen, t.c.last_seen)
+                           .where(t.c.sn == r["sn"], t.c.badge == r["badge"])).first()
+        if cur is None:
+            conn.execute(t.insert().values(**r))
+        else:
+            conn.execute(t.update().where(t.c.id == cur.id).values(
+                first_seen=min(cur.first_seen, r["first_seen"]),
+                last_seen=max(cur.last_seen, r["last_seen"]),
+                seen_count=t.c.seen_count + r["seen_count"],
+                device_id=r["device_id"],
+            ))
+    return len(rows)
+
+
+class AuditWriter:
+    """
+    Single writer thread for audit output. `write_rows()` and `record_unmapped()`
+    only append to an in-memory queue; the thread flushes every
+    AUDIT_FLUSH_INTERVAL_SECONDS (or sooner once AUDIT_FLUSH_ROWS rows are queued).
+    """
+
+    def __init__(self, app, log_dir, flush_interval=2.0, flush_rows=20000, max_rows=500000, retention_days=30):
+        self.app = app
+        self.log_dir = log_dir
+        self.flush_interval = float(flush_interval)
+        self.flush_rows = int(flush_rows)
+        self.max_rows = int(max_rows)
+        self.retention_days = int(retention_days or 0)
+
+        self._files = deque()      # (stream, sn, day, header, rows)
+        self._unmapped = {}        # (sn, badge) -> row dict
+        self._streams = {INSERTS_STREAM}   # file name prefixes this writer owns (for pruning)
+        self._queued_rows = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()   # one flush at a time (gzip members must not interleave)
+        self._stop = threading.Event()
+        self._thread = None
+        self._day = None
+        self._stats = {"rows_written": 0, "files_written": 0, "rows_dropped": 0,
+                       "unmapped_upserts": 0, "flushes": 0, "last_error": None, "last_flush_at": None}
+
+    # ---- lifecycle ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self.flush()
+
+    # ---- producer side ----
+    def write_rows(self, stream, sn, rows, header=None, day=None):
+        """Queue CSV rows for <stream>_<sn>_<day>.csv.gz. Drops (and counts) rows when the queue is full."""
+        if not rows:
+            return
+        day = day or datetime.now().strftime("%Y%m%d")
+        with self._cond:
+            if self._queued_rows + len(rows) > self.max_rows:
+                self._stats["rows_dropped"] += len(rows)
+                return
+            self._files.append((stream, sn, day, header, rows))
+            self._streams.add(stream)
+            self._queued_rows += len(rows)
+            if self._queued_rows >= self.flush_rows:
+                self._cond.notify_all()
+
+    def record_unmapped(self, sn, device_id, badges):
+        """badges: {badge: (count, first_seen, last_seen)} from one poll."""
+        if not badges:
+            return
+        with self._cond:
+            for badge, (count, first, last) in badges.items():
+                self._merge_unmapped({"badge": badge, "sn": sn, "device_id": device_id,
+                                      "first_seen": first, "last_seen": last, "seen_count": count})
+
+    def _merge_unmapped(self, row):
+        """Fold one unmapped-badge row into the queue (caller holds self._cond)."""
+        key = (row["sn"], row["badge"])
+        cur = self._unmapped.get(key)
+        if cur is None:
+            self._unmapped[key] = dict(row)
+        else:
+            cur["first_seen"] = min(cur["first_seen"], row["first_seen"])
+            cur["last_seen"] = max(cur["last_seen"], row["last_seen"])
+            cur["seen_count"] += row["seen_count"]
+            cur["device_id"] = row["device_id"]
+
+    # ---- writer side ----
+    def _take(self):
+        with self._cond:
+            files, self._files = list(self._files), deque()
+            unmapped, self._unmapped = list(self._unmapped.values()), {}
+            self._queued_rows = 0
+        return files, unmapped
+
+    def _write_files(self, files):
+        grouped = {}
+        for stream, sn, day, header, rows in files:
+            g = grouped.setdefault((stream, sn, day), [header, []])
+            g[1].extend(rows)
+        os.makedirs(self.log_dir, exist_ok=True)
+        for (stream, sn, day), (header, rows) in grouped.items():
+            path = os.path.join(self.log_dir, f"{stream}_{sn}_{day}.csv.gz")
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            if header and not os.path.exists(path):
+                w.writerow(header)
+            w.writerows(rows)
+            with gzip.open(path, "ab") as fh:
+                fh.write(buf.getvalue().encode("utf-8"))
+            self._stats["rows_written"] += len(rows)
+            self._stats["files_written"] += 1
+
+    def _prune_old_files(self):
+        if not self.retention_days or not os.path.isdir(self.log_dir):
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        with self._cond:
+            prefixes = tuple(f"{stream}_" for stream in self._streams)
+        for name in os.listdir(self.log_dir):
+            if not (name.startswith(prefixes) and name.endswith(".csv.gz")):
+                continue
+            path = os.path.join(self.log_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        files, unmapped = self._take()
+        if not files and not unmapped:
+            return
+        try:
+            if files:
+                self._write_files(files)
+            if unmapped:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        self._stats["unmapped_upserts"] += upsert_unmapped_badges(conn, unmapped)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_at"] = datetime.utcnow().isoformat()
+        except Exception as e:
+            # the upsert was rolled back (or never ran): keep the badges, merged with anything
+            # recorded meanwhile, for the next flush
+            with self._cond:
+                for row in unmapped:
+                    self._merge_unmapped(row)
+            e = getattr(e, "orig", None) or e
+            self._stats["last_error"] = str(e)
+            print(Fore.RED + f"[AUDIT WRITER ERROR] {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                if self._queued_rows < self.flush_rows:
+                    self._cond.wait(timeout=self.flush_interval)
+            try:
+                self.flush()
+                day = datetime.now().strftime("%Y%m%d")
+                if day != self._day:
+                    self._day = day
+                    self._prune_old_files()
+            except Exception:
+                print(Fore.RED + f"[AUDIT WRITER ERROR] {traceback.format_exc()}")
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._stats)
+            out["queued_rows"] = self._queued_rows
+            out["queued_unmapped"] = len(self._unmapped)
+        out["running"] = bool(self._thread and self._thread.is_alive())
+        out["log_dir"] = self.log_dir
+        return out
+
+
+_AUDIT = None
+_AUDIT_LOCK = threading.Lock()
+
+
+def get_audit_writer(app=None):
+    """Return the process-wide AuditWriter, creating and starting it on first use."""
+    global _AUDIT
+    with _AUDIT_LOCK:
+        if _AUDIT is None:
+            if app is None:
+                from flask import current_app
+                app = current_app._get_current_object()
+            cfg = app.config
+            _AUDIT = AuditWriter(
+                app,
+                cfg.get("AUDIT_LOG_DIR") or cfg.get("SCHEDULER_LOG_DIR", "logs"),
+                flush_interval=cfg.get("AUDIT_FLUSH_INTERVAL_SECONDS", 2.0),
+                flush_rows=cfg.get("AUDIT_FLUSH_ROWS", 20000),
+                max_rows=cfg.get("AUDIT_QUEUE_MAX_ROWS", 500000),
+                retention_days=cfg.get("AUDIT_RETENTION_DAYS", 30),
+            )
+        _AUDIT.start()
+        return _AUDIT
+
+
+def audit_stats():
+    with _AUDIT_LOCK:
+        writer = _AUDIT
+    return writer.stats() if writer else None
+
+
+def flush_audit_writer():
+    with _AUDIT_LOCK:
+        writer = _AUDIT
+    if writer:
+        writer.flush()
@@ -0,0 +1,259 @@
+# app/counters.py
+"""
+Maintained log counters.
+
+    device_log_counters  device_id -> number of attendance logs
+    branch_log_counters  branch_id -> sum over the branch's devices
+
+Counts are logical rows: attendance_logs plus the cold archive, so moving a
+month into the archive leaves them unchanged. Every path that really adds or
+removes rows applies a delta inside its own transaction:
+
+  * ingest (`write_batches`, dead-letter retry)        + rows inserted per device
+  * DELETE /api/logs/device/<id>/logs[/today]            - rows deleted
+  * retention (chunked deletes / dropped partitions)     - rows deleted
+  * device delete, branch delete, device moved to another branch
+
+so GET /api/devices/ reads one row per branch instead of counting history.
+`reconcile_log_counters()` (reconcile_counters.py, POST /api/admin/counters/reconcile)
+recounts from the source and fixes any drift.
+
+Counter rows are always updated device first, then branch, each in id order,
+so concurrent writers take the row locks in the same order.
+"""
+from datetime import datetime
+
+import numpy as np
+from colorama import Fore
+from sqlalchemy import select, func, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .extensions import db
+from .db_helpers import dialect_name, insert_ignore_stmt
+from .models import AttendanceLog, Device, Branch, DeviceLogCounter, BranchLogCounter
+
+
+def _add_stmt(table, key, dialect_name):
+    """INSERT that adds `log_count` onto an existing row instead of failing; None when unsupported."""
+    if dialect_name == "mysql":
+        ins = mysql_insert(table)
+        return ins.on_duplicate_key_update(log_count=table.c.log_count + ins.inserted.log_count,
+                                           updated_at=ins.inserted.updated_at)
+    if dialect_name in ("sqlite", "postgresql"):
+        ins = (sqlite_insert if dialect_name == "sqlite" else pg_insert)(table)
+        return ins.on_conflict_do_update(index_elements=[key], set_={
+            "log_count": table.c.log_count + ins.excluded.log_count,
+            "updated_at": ins.excluded.updated_at,
+        })
+    return None
+
+
+def _add(conn, table, key, deltas):
+    """Add {key: delta} onto the counters in `table`, creating missing rows."""
+    deltas = {k: n for k, n in deltas.items() if n}
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    rows = [{key: k, "log_count": int(n), "updated_at": now} for k, n in sorted(deltas.items())]
+    stmt = _add_stmt(table, key, dialect_name(conn))
+    if stmt is not None:
+        conn.execute(stmt, rows)
+        return
+    col = table.c[key]
+    for r in rows:
+        res = conn.execute(table.update().where(col == r[key]).values(
+            log_count=table.c.log_count + r["log_count"], updated_at=now))
+        if not res.rowcount:
+            conn.execute(table.insert().values(**r))
+
+
+def _lock(conn, table, key, value):
+    """
+    Lock the counter row for `value` and return its count. A missing row is first
+    inserted (insert-ignore, log_count 0) so there is a row to lock; None is returned
+    when this call created it.
+    """
+    locked = select(table.c.log_count).where(table.c[key] == value).with_for_update()
+    cur = conn.execute(locked).scalar()
+    if cur is not None:
+        return cur
+    res = conn.execute(insert_ignore_stmt(table, dialect_name(conn)).values(
+        **{key: value, "log_count": 0, "updated_at": datetime.utcnow()}))
+    cur = conn.execute(locked).scalar()
+    return None if res.rowcount == 1 else cur
+
+
+def _set(conn, table, key, value, count):
+    conn.execute(table.update().where(table.c[key] == value).values(log_count=int(count), updated_at=datetime.utcnow()))
+
+
+# -------------------------
+# Deltas (called inside the writer's transaction)
+# -------------------------
+def apply_log_deltas(conn, deltas):
+    """Add {device_id: delta} to the device counters and their branches' counters."""
+    deltas = {int(d): int(n) for d, n in (deltas or {}).items() if d is not None and n}
+    if not deltas:
+        return
+    dev = Device.__table__
+    branch_of = dict(conn.execute(select(dev.c.id, dev.c.branch_id).where(dev.c.id.in_(list(deltas)))).all())
+    branch_deltas = {}
+    for device_id, n in deltas.items():
+        b = branch_of.get(device_id)
+        if b is not None:
+            branch_deltas[b] = branch_deltas.get(b, 0) + n
+    _add(conn, DeviceLogCounter.__table__, "device_id", deltas)
+    _add(conn, BranchLogCounter.__table__, "branch_id", branch_deltas)
+
+
+def count_logs_by_device(conn, *where):
+    """{device_id: rows} in attendance_logs matching `where` (taken before a delete)."""
+    al = AttendanceLog.__table__
+    q = select(al.c.device_id, func.count()).group_by(al.c.device_id)
+    if where:
+        q = q.where(*where)
+    return {int(d): int(n) for d, n in conn.execute(q).all()}
+
+
+def subtract_deleted(conn, *where):
+    """Count rows matching `where` per device and subtract them; call right before the DELETE."""
+    counts = count_logs_by_device(conn, *where)
+    apply_log_deltas(conn, {d: -n for d, n in counts.items()})
+    return counts
+
+
+def forget_device(conn, device_id):
+    """Device is being deleted together with its logs: drop its counter and take it off its branch."""
+    dc = DeviceLogCounter.__table__
+    n = conn.execute(select(dc.c.log_count).where(dc.c.device_id == device_id)).scalar()
+    if n is None:
+        return
+    apply_log_deltas(conn, {device_id: -int(n)})
+    conn.execute(dc.delete().where(dc.c.device_id == device_id))
+
+
+def forget_branch(conn, branch_id):
+    """Branch is being deleted with its devices and logs: drop all of its counters."""
+    dev = Device.__table__
+    device_ids = select(dev.c.id).where(dev.c.branch_id == branch_id)
+    conn.execute(DeviceLogCounter.__table__.delete().where(DeviceLogCounter.__table__.c.device_id.in_(device_ids)))
+    conn.execute(BranchLogCounter.__table__.delete().where(BranchLogCounter.__table__.c.branch_id == branch_id))
+
+
+def move_device(conn, device_id, old_branch_id, new_branch_id):
+    """Device moved to another branch: carry its count across."""
+    old_branch_id = int(old_branch_id) if old_branch_id is not None else None
+    new_branch_id = int(new_branch_id) if new_branch_id is not None else None
+    if old_branch_id == new_branch_id:
+        return
+    dc = DeviceLogCounter.__table__
+    n = conn.execute(select(dc.c.log_count).where(dc.c.device_id == device_id)).scalar() or 0
+    deltas = {}
+    if old_branch_id is not None:
+        deltas[old_branch_id] = -int(n)
+    if new_branch_id is not None:
+        deltas[new_branch_id] = deltas.get(new_branch_id, 0) + int(n)
+    _add(conn, BranchLogCounter.__table__, "branch_id", deltas)
+
+
+def branch_log_counts(conn):
+    """{branch_id: log_count} for the branch listing."""
+    bc = BranchLogCounter.__table__
+    return {int(b): int(n) for b, n in conn.execute(select(bc.c.branch_id, bc.c.log_count)).all()}
+
+
+# -------------------------
+# Reconcile
+# -------------------------
+class _ArchivedIds:
+    """Archived row ids per device, loaded once per branch."""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.branches = {}
+
+    def get(self, branch_id, device_id):
+        if not self.archive_dir:
+            return np.empty(0, dtype=np.int64), []
+        if branch_id not in self.branches:
+            from .archive import ArchiveReader
+            reader = ArchiveReader(self.archive_dir, branch_id=branch_id)
+            ranges = [(datetime.fromisoformat(e["month_start"]), datetime.fromisoformat(e["month_end"]))
+                      for e in reader.entries]
+            self.branches[branch_id] = (reader.cols["id"], reader.cols["device_id"], ranges)
+        ids, devices, ranges = self.branches[branch_id]
+        return ids[devices == int(device_id)], ranges
+
+
+def _actual_count(conn, device_id, archived_ids, ranges):
+    """Hot rows + archived rows, not counting hot leftovers of an archive run twice."""
+    al = AttendanceLog.__table__
+    hot = conn.execute(select(func.count()).select_from(al).where(al.c.device_id == device_id)).scalar() or 0
+    overlap = 0
+    if len(archived_ids) and ranges:
+        leftovers = conn.execute(select(al.c.id).where(
+            al.c.device_id == device_id,
+            or_(*[(al.c.timestamp >= lo) & (al.c.timestamp < hi) for lo, hi in ranges]),
+        )).scalars().all()
+        if leftovers:
+            overlap = int(np.isin(np.asarray(leftovers, dtype=np.int64), archived_ids).sum())
+    return int(hot) + len(archived_ids) - overlap
+
+
+def reconcile_log_counters(archive_dir=None, device_ids=None):
+    """
+    Recount every device (or the given ones) and its branch, fixing counters that drifted.
+    Each device is recounted in its own short transaction with its counter row locked,
+    so ingest keeps running. Must run inside an app context.
+    """
+    dev, dc, bc = Device.__table__, DeviceLogCounter.__table__, BranchLogCounter.__table__
+    with db.engine.connect() as conn:
+        q = select(dev.c.id, dev.c.branch_id).order_by(dev.c.id)
+        if device_ids:
+            q = q.where(dev.c.id.in_([int(d) for d in device_ids]))
+        devices = conn.execute(q).all()
+
+    archived = _ArchivedIds(archive_dir)
+    result = {"devices": 0, "branches": 0, "fixed_devices": {}, "fixed_branches": {}, "removed": 0}
+    for device_id, branch_id in devices:
+        ids, ranges = archived.get(branch_id, device_id)
+        with db.engine.begin() as conn:
+            cur = _lock(conn, dc, "device_id", device_id)
+            actual = _actual_count(conn, device_id, ids, ranges)
+            if cur != actual:
+                _set(conn, dc, "device_id", device_id, actual)
+                result["fixed_devices"][device_id] = {"was": cur, "now": actual}
+        result["devices"] += 1
+
+    with db.engine.begin() as conn:
+        if not device_ids:
+            res = conn.execute(dc.delete().where(dc.c.device_id.not_in(select(dev.c.id))))
+            result["removed"] += res.rowcount or 0
+            res = conn.execute(bc.delete().where(bc.c.branch_id.not_in(select(Branch.__table__.c.id))))
+            result["removed"] += res.rowcount or 0
+
+    if device_ids:
+        branch_ids = {b for _, b in devices}
+    else:
+        with db.engine.connect() as conn:
+            branch_ids = set(conn.execute(select(Branch.__table__.c.id)).scalars().all())
+    for branch_id in sorted(branch_ids):
+        with db.engine.begin() as conn:
+            cur = _lock(conn, bc, "branch_id", branch_id)
+            actual = conn.execute(
+                select(func.coalesce(func.sum(dc.c.log_count), 0))
+                .select_from(dc.join(dev, dev.c.id == dc.c.device_id))
+                .where(dev.c.branch_id == branch_id)
+            ).scalar()
+            actual = int(actual or 0)
+            if cur != actual:
+                _set(conn, bc, "branch_id", branch_id, actual)
+                result["fixed_branches"][branch_id] = {"was": cur, "now": actual}
+        result["branches"] += 1
+
+    colour = Fore.YELLOW if result["fixed_devices"] or result["fixed_branches"] else Fore.CYAN
+    print(colour + f"[COUNTERS] reconciled {result['devices']} device(s), {result['branches']} branch(es): "
+                   f"fixed {len(result['fixed_devices'])} device / {len(result['fixed_branches'])} branch counter(s)")
+    return result
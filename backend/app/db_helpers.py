@@ -0,0 +1,60 @@
+# app/db_helpers.py
+"""
+Small helpers shared by the Core write paths (ingest, spool, counters, rollups,
+dictionaries): dialect detection, insert-ignore statements, and the JSON-safe
+form of attendance row dicts used by the spool and the dead-letter table.
+"""
+from datetime import datetime
+
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# row keys holding datetimes (serialised as ISO strings)
+DATETIME_KEYS = ("timestamp", "created_at")
+
+
+def dialect_name(conn):
+    """Return the dialect name for a Connection, Engine or Session."""
+    try:
+        if hasattr(conn, "get_bind"):
+            return conn.get_bind().dialect.name
+        return conn.dialect.name
+    except Exception:
+        return ""
+
+
+def insert_ignore_stmt(table, dialect_name):
+    """
+    Build an INSERT for `table` that silently skips rows violating a unique constraint.
+    """
+    if dialect_name == "mysql":
+        return mysql_insert(table).prefix_with("IGNORE")
+    if dialect_name == "sqlite":
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect_name == "postgresql":
+        return pg_insert(table).on_conflict_do_nothing()
+    return table.insert()
+
+
+def encode_rows(rows):
+    """Copies of the row dicts with datetimes as ISO strings (for JSON)."""
+    out = []
+    for r in rows:
+        r = dict(r)
+        for k in DATETIME_KEYS:
+            v = r.get(k)
+            if isinstance(v, datetime):
+                r[k] = v.isoformat()
+        out.append(r)
+    return out
+
+
+def decode_rows(rows):
+    """Inverse of encode_rows, in place; returns `rows`."""
+    for r in rows:
+        for k in DATETIME_KEYS:
+            v = r.get(k)
+            if isinstance(v, str):
+                r[k] = datetime.fromisoformat(v)
+    return rows
@@ -0,0 +1,77 @@
+# app/dictionaries.py
+"""
+Dictionary tables for values repeated on every access_checkinout row.
+
+    device_serials            id -> device serial (access_checkinout.sn_id)
+    access_checkinout_texts   id -> (VERIFYCODE, SENSORID, Memoinfo, WorkCode) (access_checkinout.text_id)
+
+Ids are looked up (and created on first use) with an insert-ignore followed by a
+select in a short transaction of their own, so concurrent writers agree on one
+id per value and a caller's rollback never orphans a cached id. Call them
+before opening the transaction that writes the referencing rows. Both tables
+are tiny and the mappings never change, so resolved ids are cached per process.
+"""
+import threading
+
+from sqlalchemy import select, and_
+
+from .extensions import db
+from .db_helpers import dialect_name, insert_ignore_stmt
+from .models import DeviceSerial, CheckinOutText
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key):
+    with _cache_lock:
+        return _cache.get(key)
+
+
+def _remember(key, value):
+    with _cache_lock:
+        _cache[key] = value
+
+
+def serial_ids(serials):
+    """{sn: id} for the given serials, creating dictionary rows for new ones."""
+    wanted = {s for s in serials if s}
+    out = {}
+    for s in list(wanted):
+        hit = _cached(("sn", s))
+        if hit is not None:
+            out[s] = hit
+            wanted.discard(s)
+    if not wanted:
+        return out
+    t = DeviceSerial.__table__
+    with db.engine.begin() as conn:
+        conn.execute(insert_ignore_stmt(t, dialect_name(conn)), [{"sn": s} for s in sorted(wanted)])
+        found = conn.execute(select(t.c.id, t.c.sn).where(t.c.sn.in_(sorted(wanted)))).all()
+    for id_, sn in found:
+        _remember(("sn", sn), id_)
+        out[sn] = id_
+    return out
+
+
+def serial_id(sn):
+    return serial_ids([sn]).get(sn) if sn else None
+
+
+def checkinout_text_id(VERIFYCODE=None, SENSORID=None, Memoinfo=None, WorkCode=None):
+    """Id of the (VERIFYCODE, SENSORID, Memoinfo, WorkCode) tuple, creating it on first use."""
+    values = {"VERIFYCODE": VERIFYCODE, "SENSORID": SENSORID, "Memoinfo": Memoinfo, "WorkCode": WorkCode}
+    key = ("text",) + tuple(values.values())
+    hit = _cached(key)
+    if hit is not None:
+        return hit
+    t = CheckinOutText.__table__
+    cond = and_(*[t.c[k].is_(None) if v is None else t.c[k] == v for k, v in values.items()])
+    with db.engine.begin() as conn:
+        id_ = conn.execute(select(t.c.id).where(cond).order_by(t.c.id)).scalar()
+        if id_ is None:
+            # NULLs never collide in a unique index; tuples with a NULL may get a second id, which is harmless
+            conn.execute(insert_ignore_stmt(t, dialect_name(conn)).values(**values))
+            id_ = conn.execute(select(t.c.id).where(cond).order_by(t.c.id)).scalar()
+    _remember(key, id_)
+    return id_
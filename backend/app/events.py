@@ -0,0 +1,286 @@
+# app/events.py
+"""
+Console event bus for the poll path.
+
+Poll workers hand messages to the bus and return immediately; a single daemon
+thread prints them and does the socket emits. Per-record chatter ("new record",
+"upserting user") is not sent line by line: workers bump per-device counters and
+the bus sends one progress summary per device per flush (counts, rates, a few
+samples). Plain messages go through per-level rate limits, and anything over the
+limit is folded into a "suppressed" line instead of being emitted.
+"""
+import re
+import sys
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+from colorama import Fore
+
+from .extensions import socketio
+
+ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+COLOR_MAP = {
+    Fore.GREEN: 'green',
+    Fore.YELLOW: 'yellow',
+    Fore.CYAN: 'cyan',
+    Fore.BLUE: 'blue',
+    Fore.MAGENTA: 'magenta',
+    Fore.WHITE: 'white',
+    Fore.RED: 'red',
+}
+
+# messages per second per level; None = never suppressed
+DEFAULT_RATE_LIMITS = {"debug": 5, "info": 20, "new": 5, "warning": 20, "error": None}
+
+
+def strip_ansi(s: str) -> str:
+    return ANSI_RE.sub('', s) if s else s
+
+
+def deliver_console(raw_text_with_color, level="info", device_id=None, device_name=None, extra=None):
+    """Print one line and emit it on the 'console' socket event (the blocking part)."""
+    try:
+        print(raw_text_with_color)
+    except Exception:
+        print(strip_ansi(raw_text_with_color))
+
+    color_name = None
+    for code, name in COLOR_MAP.items():
+        if code and code in raw_text_with_color:
+            color_name = name
+            break
+    payload = {
+        "type": "console",
+        "level": level,
+        "text": strip_ansi(raw_text_with_color),
+        "color": color_name,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+    }
+    if device_id is not None or device_name is not None:
+        payload["device_id"] = device_id
+        payload["device_name"] = device_name
+    if extra:
+        payload["extra"] = extra
+
+    try:
+        socketio.emit("console", payload)
+    except Exception:
+        pass
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "tokens", "stamp")
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = float(rate)
+        self.stamp = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class _DeviceProgress:
+    __slots__ = ("device_id", "device_name", "counts", "totals", "samples", "started", "last_flush", "finished")
+
+    def __init__(self, device_id, device_name):
+        self.device_id = device_id
+        self.device_name = device_name
+        self.counts = {}     # since the last summary
+        self.totals = {}     # since the poll started
+        self.samples = {}
+        self.started = time.time()
+        self.last_flush = self.started
+        self.finished = False
+
+
+class ConsoleEventBus:
+    def __init__(self, flush_interval=1.0, rate_limits=None, max_queue=10000, samples=3):
+        self.flush_interval = float(flush_interval)
+        self.max_samples = int(samples)
+        limits = dict(DEFAULT_RATE_LIMITS)
+        limits.update(rate_limits or {})
+        self._buckets = {lvl: _TokenBucket(r) for lvl, r in limits.items() if r}
+        self._queue = deque(maxlen=int(max_queue))
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._suppressed = {}
+        self._overflow = 0
+        self.published = 0
+        self.delivered = 0
+
+    # ---- producer side (never blocks on I/O) ----
+    def publish(self, text, level="info", device=None, extra=None):
+        if len(self._queue) == self._queue.maxlen:
+            self._overflow += 1   # the deque drops the oldest message
+        self._queue.append((text, level, getattr(device, "id", None), getattr(device, "name", None), extra))
+        self.published += 1
+        if not self.running:
+            self.flush()
+
+    def count(self, device, kind, n=1, sample=None):
+        """Bump a per-device counter that is reported in the next progress summary."""
+        key = getattr(device, "id", None)
+        with self._lock:
+            p = self._progress.get(key)
+            if p is None or p.finished:
+                p = self._progress[key] = _DeviceProgress(key, getattr(device, "name", None))
+            p.counts[kind] = p.counts.get(kind, 0) + n
+            p.totals[kind] = p.totals.get(kind, 0) + n
+            if sample is not None:
+                s = p.samples.setdefault(kind, [])
+                if len(s) < self.max_samples:
+                    s.append(sample)
+
+    def finish(self, device):
+        """The device's poll is over: send its final summary on the next flush."""
+        with self._lock:
+            p = self._progress.get(getattr(device, "id", None))
+            if p is not None:
+                p.finished = True
+        if self.running:
+            self._wake.set()
+        else:
+            self.flush()
+
+    # ---- consumer side ----
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="console-event-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                try:
+                    sys.__stdout__.write(f"[event bus] flush error: {e}\n")
+                except Exception:
+                    pass
+
+    def flush(self):
+        """Deliver queued messages (rate limited) and due progress summaries."""
+        while True:
+            try:
+                text, level, device_id, device_name, extra = self._queue.popleft()
+            except IndexError:
+                break
+            bucket = self._buckets.get(level)
+            if bucket is not None and not bucket.take():
+                self._suppressed[level] = self._suppressed.get(level, 0) + 1
+                continue
+            deliver_console(text, level=level, device_id=device_id, device_name=device_name, extra=extra)
+            self.delivered += 1
+
+        for summary in self._due_summaries():
+            deliver_console(summary.pop("text"), level="progress",
+                            device_id=summary["device_id"], device_name=summary["device_name"], extra=summary)
+            self.delivered += 1
+
+        if self._suppressed or self._overflow:
+            parts = [f"{n} {lvl}" for lvl, n in sorted(self._suppressed.items())]
+            if self._overflow:
+                parts.append(f"{self._overflow} dropped (queue full)")
+            deliver_console(Fore.WHITE + f"[EVENTS] suppressed {', '.join(parts)} message(s)", level="debug",
+                            extra={"suppressed": dict(self._suppressed), "overflow": self._overflow})
+            self._suppressed = {}
+            self._overflow = 0
+
+    def _due_summaries(self):
+        now = time.time()
+        out = []
+        with self._lock:
+            for key, p in list(self._progress.items()):
+                if not p.counts and not p.finished:
+                    continue
+                elapsed = max(now - p.last_flush, 1e-6)
+                rates = {k: round(v / elapsed, 1) for k, v in p.counts.items()}
+                counts = ", ".join(f"{k}={v} ({rates[k]}/s)" for k, v in sorted(p.counts.items()))
+                label = "done" if p.finished else "progress"
+                out.append({
+                    "type": "progress",
+                    "device_id": p.device_id,
+                    "device_name": p.device_name,
+                    "finished": p.finished,
+                    "counts": dict(p.counts),
+                    "totals": dict(p.totals),
+                    "rates": rates,
+                    "samples": {k: list(v) for k, v in p.samples.items()},
+                    "elapsed_seconds": round(now - p.started, 3),
+                    "text": Fore.GREEN + f"    [{label.upper()}] {p.device_name}: {counts or 'no new events'}"
+                            + (f" (totals {p.totals})" if p.finished else ""),
+                })
+                p.counts = {}
+                p.samples = {}
+                p.last_flush = now
+                if p.finished:
+                    del self._progress[key]
+        return out
+
+    def stats(self):
+        with self._lock:
+            active = len(self._progress)
+        return {
+            "running": self.running,
+            "queued": len(self._queue),
+            "published": self.published,
+            "delivered": self.delivered,
+            "active_devices": active,
+        }
+
+
+_BUS = None
+_BUS_LOCK = threading.Lock()
+
+
+def get_event_bus():
+    global _BUS
+    with _BUS_LOCK:
+        if _BUS is None:
+            _BUS = ConsoleEventBus()
+        return _BUS
+
+
+def init_event_bus(app):
+    """Configure the process-wide bus from app.config and start its thread."""
+    global _BUS
+    with _BUS_LOCK:
+        if _BUS is not None and _BUS.running:
+            return _BUS
+        _BUS = ConsoleEventBus(
+            flush_interval=app.config.get("EVENT_BUS_FLUSH_INTERVAL_SECONDS", 1.0),
+            rate_limits=app.config.get("EVENT_BUS_RATE_LIMITS"),
+            max_queue=app.config.get("EVENT_BUS_MAX_QUEUE", 10000),
+            samples=app.config.get("EVENT_BUS_SAMPLES", 3),
+        )
+        if app.config.get("EVENT_BUS_ENABLED", True):
+            _BUS.start()
+        return _BUS
@@ -1,134 +1,692 @@
 # backend/app/exporter.py
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+"""
+Export attendance_logs rows into the end DB table (END_TARGET_TABLE).
+
+Each batch is handled set-wise so the cost is a few round trips per batch, not
+two per row:
+
+  1. build the end-DB row for every candidate log in Python;
+  2. find which (log_date, badge, log_time, access_device) keys already exist with
+     one composite-key IN query per EXPORT_INSERT_CHUNK keys;
+  3. write the new rows with multi-row INSERTs of EXPORT_INSERT_CHUNK rows, each in
+     a savepoint; a chunk the end DB rejects is retried row by row so one bad row
+     only costs itself.
+
+The app-DB side is a handful of statements per batch as well: device serials are
+read once per batch, and the exported flag is set with one UPDATE ... WHERE id IN
+(...) per chunk, staged before the end-DB commit and committed right after it. If
+the end DB fails nothing is flagged; if only the flag commit fails the rows are
+found as existing on the next run.
+
+Work is found by id, not by scanning for exported = 0: the exporter keeps a sync
+cursor ('enddb_export' in sync_cursors, like the access_checkinout projection) and
+reads the next rows past it by primary key, so finding a batch costs O(batch)
+whatever the table size. The cursor moves in the same app-DB transaction as the
+exported flags. Ids are not committed in id order (several poll workers, dead-letter
+retries), so a row can become visible after the cursor has passed it: a run's first
+fetch also picks up unexported rows up to EXPORT_GAP_RESCAN_IDS ids below the cursor
+that export_retries does not know about. A row that fails goes to export_retries and is retried with
+backoff (due retries lead each batch) until EXPORT_MAX_ATTEMPTS, then it is
+'dead'. Rows that can never be exported (no badge, or new rows older than the
+lookback window) are 'dead' at once instead of staying unexported unnoticed;
+the window does not apply to retries, so a requeued row is really tried again.
+
+`drain_export_backlog()` (the export job) keeps going batch after batch until the
+backlog is empty, fetching the next batch while the current one is written and
+sizing batches from the observed end-DB time and error rate.
+
+With EXPORT_PARALLEL_WORKERS > 1, `export_partitioned()` splits the rows by
+device_id % workers and drains every partition in its own thread, with its own
+end-DB connection and cursor ('enddb_export:<k>/<n>'); each partition is still
+delivered in id order. The main cursor then moves up to the slowest partition
+and a serial drain handles the retries. A device's rows always land in the same
+partition, whatever the number of devices.
+
+Bulk-file mode (`bulk=True`, the backfill job behind POST /api/admin/export/enddb/bulk)
+replaces step 3 for large catch-ups: the batch (EXPORT_BULK_FILE_ROWS rows) is written
+to a tab-separated file that MySQL loads with LOAD DATA LOCAL INFILE; other end DBs
+read the file back into chunked executemany INSERTs. The loaded row count and the
+keys are checked in the same end-DB transaction before the source rows are flagged;
+a mismatch rolls the whole file back.
+"""
+from datetime import datetime, timedelta, date, time as dt_time
+import csv
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+
+from sqlalchemy import create_engine, select, tuple_, table, column, text
+from sqlalchemy.engine import make_url
 from flask import current_app
 from app.extensions import db
-from app.models import AttendanceLog, Device
+from app.models import AttendanceLog, Device, SyncCursor, ExportRetry
 import logging
 
 logger = logging.getLogger(__name__)
 
+# (log_date, badge, log_time, access_device): how the end DB identifies a punch
+KEY_COLUMNS = ("log_date", "badge", "log_time", "access_device")
+
+EXPORT_CURSOR = "enddb_export"
+DEAD = "dead"   # (DEAD, reason) as a failure: not worth retrying
+
+# one attendance log to export: `row` is its end-DB row, `retry` marks a row taken from
+# export_retries, `problem` says why it cannot be exported at all (row is then None)
+ExportRow = namedtuple("ExportRow", "id timestamp row retry problem", defaults=(False, None))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _end_engine(uri, local_infile=False):
+    """
+    One pooled engine per end-DB URI, so each export does not pay for a fresh connection.
+    local_infile: a separate MySQL engine whose connections may send LOAD DATA LOCAL files.
+    """
+    local_infile = local_infile and make_url(uri).get_backend_name() == "mysql"
+    key = (uri, "local_infile") if local_infile else uri
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            connect_args = {"local_infile": True} if local_infile else {}
+            engine = _engines[key] = create_engine(uri, pool_pre_ping=True, connect_args=connect_args)
+        return engine
+
+
+# the end table's columns the exporter writes (id, created_at and source keep their defaults)
+END_COLUMNS = ("log_date", "badge", "badge_dup", "placeholder", "log_time", "flag", "access_door", "batch", "access_device")
+
+
+def _end_table(name):
+    return table(name, *[column(c) for c in END_COLUMNS])
+
+
+def _stage_exported(recs, chunk_size):
+    """
+    Flag `recs` as exported in the session's transaction (the caller commits), one
+    UPDATE per chunk of ids. The chunk's timestamp range is part of the WHERE clause
+    so MySQL only touches the month partitions involved.
+    """
+    logs = AttendanceLog.__table__
+    now = datetime.utcnow()
+    recs = sorted(recs, key=lambda r: r.id)
+    for chunk in _chunks(recs, chunk_size):
+        db.session.execute(
+            logs.update()
+            .where(logs.c.id.in_([r.id for r in chunk]),
+                   logs.c.timestamp >= min(r.timestamp for r in chunk),
+                   logs.c.timestamp <= max(r.timestamp for r in chunk))
+            .values(exported=True, exported_at=now)
+        )
+
+
+def _cursor_name(partition=None):
+    """Cursor of the whole table, or of partition (k, n) = rows with device_id % n == k."""
+    return EXPORT_CURSOR if partition is None else f"{EXPORT_CURSOR}:{partition[0]}/{partition[1]}"
 
-def export_attendance_direct(batch_size=1500, lookback_days=None, dry_run=False):
-   
-    end_db_uri = current_app.config.get("END_DB_URI") or current_app.config.get("ENDDB_DATABASE_URI")
-    if not end_db_uri:
-        raise RuntimeError("END_DB_URI (or ENDDB_DATABASE_URI) not configured")
 
-    engine = create_engine(end_db_uri, pool_pre_ping=True)
-    target_table = current_app.config.get("END_TARGET_TABLE", "att_raw_data_old")
+def _export_position(partition=None):
+    """
+    The export cursor, created on first use just before the oldest unexported row in the
+    lookback window. Partition cursors are created at the main cursor's position.
+    """
+    tbl = SyncCursor.__table__
+    name = _cursor_name(partition)
+    if partition is not None:
+        start = _export_position()
+    with db.engine.begin() as conn:
+        pos = conn.execute(select(tbl.c.position).where(tbl.c.name == name)).scalar()
+        if pos is None and partition is not None:
+            pos = start
+            conn.execute(tbl.insert().values(name=name, position=pos, updated_at=datetime.utcnow()))
+        elif pos is None:
+            al = AttendanceLog.__table__
+            lookback = current_app.config.get("EXPORT_LOOKBACK_DAYS")
+            q = select(db.func.min(al.c.id)).where(al.c.exported.is_(False))
+            if lookback is not None:
+                q = q.where(al.c.timestamp >= datetime.utcnow() - timedelta(days=int(lookback)))
+            first = conn.execute(q).scalar()
+            pos = int(first) - 1 if first is not None else int(conn.execute(select(db.func.max(al.c.id))).scalar() or 0)
+            conn.execute(tbl.insert().values(name=EXPORT_CURSOR, position=pos, updated_at=datetime.utcnow()))
+    return int(pos)
 
-    q = AttendanceLog.query.order_by(AttendanceLog.id)
-    if hasattr(AttendanceLog, "exported"):
-        q = q.filter_by(exported=False)
 
-    if lookback_days is not None:
-        cutoff = datetime.utcnow() - timedelta(days=int(lookback_days))
-        q = q.filter(AttendanceLog.timestamp >= cutoff)
+def _stage_position(position, partition=None):
+    """Move the cursor forward to `position` in the session's transaction."""
+    tbl = SyncCursor.__table__
+    db.session.execute(tbl.update().where(tbl.c.name == _cursor_name(partition), tbl.c.position < position)
+                       .values(position=position, updated_at=datetime.utcnow()))
 
-    rows = q.limit(batch_size).all()
-    if not rows:
-        return {"exported": 0, "skipped_existing": 0, "skipped_empty_user": 0, "errors": 0}
 
-    exported = 0
-    skipped_existing = 0
-    skipped_empty_user = 0
-    errors = 0
+def _align_cursors(n):
+    """
+    Before a partitioned run: no partition cursor behind the main cursor (which serial
+    runs may have moved meanwhile). Returns (partitions [(k, n), ...], newest log id now).
+    """
+    partitions = [(k, n) for k in range(n)]
+    main = _export_position()
+    tbl = SyncCursor.__table__
+    with db.engine.begin() as conn:
+        for p in partitions:
+            conn.execute(tbl.update().where(tbl.c.name == _cursor_name(p), tbl.c.position < main)
+                         .values(position=main, updated_at=datetime.utcnow()))
+    for p in partitions:
+        _export_position(p)
+    with db.engine.connect() as conn:
+        high = conn.execute(select(db.func.max(AttendanceLog.__table__.c.id))).scalar() or 0
+    return partitions, int(high)
 
-    dup_check_sql = text(
-        f"SELECT COUNT(1) FROM {target_table} "
-        "WHERE log_date = :logDate AND badge = :userId AND log_time = :logTime AND access_device = :accessDev"
-    )
+
+def _settle_cursors(partitions, high, failed):
+    """
+    After a partitioned run. A partition that drained without error has done all of its
+    rows up to `high` (the newest id when the run started), even if its own last row is
+    older, so its cursor moves up to `high`. The main cursor then moves to the slowest
+    partition; a failed partition's rows are left to the serial drain that follows.
+    """
+    tbl = SyncCursor.__table__
+    positions = []
+    with db.engine.begin() as conn:
+        for p in partitions:
+            name = _cursor_name(p)
+            if p not in failed:
+                conn.execute(tbl.update().where(tbl.c.name == name, tbl.c.position < high)
+                             .values(position=high, updated_at=datetime.utcnow()))
+            positions.append(conn.execute(select(tbl.c.position).where(tbl.c.name == name)).scalar())
+    _stage_position(int(min(positions)))
+    db.session.commit()
+
+
+def _due_retries(limit):
+    er = ExportRetry.__table__
+    return db.session.execute(
+        select(er.c.log_id).where(er.c.state == "retry", er.c.next_attempt_at <= datetime.utcnow())
+        .order_by(er.c.next_attempt_at, er.c.log_id).limit(int(limit))
+    ).scalars().all()
+
+
+def _stage_failures(failures):
+    """
+    {log_id: error} -> export_retries in the session's transaction: one more attempt with
+    exponential backoff, or 'dead' once EXPORT_MAX_ATTEMPTS is reached. An error of
+    (DEAD, reason) is dead right away. Returns the number of rows now dead.
+    """
+    if not failures:
+        return 0
+    cfg = current_app.config
+    max_attempts = int(cfg.get("EXPORT_MAX_ATTEMPTS", 5))
+    base = float(cfg.get("EXPORT_RETRY_BASE_SECONDS", 60))
+    cap = float(cfg.get("EXPORT_RETRY_MAX_SECONDS", 6 * 3600))
+    now = datetime.utcnow()
+    known = {r.log_id: r for r in ExportRetry.query.filter(ExportRetry.log_id.in_(list(failures))).all()}
+    dead = 0
+    for log_id, error in failures.items():
+        r = known.get(log_id)
+        if r is None:
+            r = ExportRetry(log_id=log_id, attempts=0, created_at=now)
+            db.session.add(r)
+        r.attempts += 1
+        r.error = str(error[1] if isinstance(error, tuple) else error)[:500]
+        if isinstance(error, tuple) or r.attempts >= max_attempts:
+            r.state, r.next_attempt_at = "dead", None
+            dead += 1
+        else:
+            r.state = "retry"
+            r.next_attempt_at = now + timedelta(seconds=min(base * 2 ** (r.attempts - 1), cap))
+    db.session.flush()
+    return dead
+
+
+def _stage_cleared(log_ids):
+    """Drop export_retries entries for rows that were exported (or no longer exist)."""
+    if log_ids:
+        er = ExportRetry.__table__
+        db.session.execute(er.delete().where(er.c.log_id.in_(list(log_ids))))
+
+
+def _device_serials(rows):
+    """{device_id: serial_no} for the batch, in one query."""
+    ids = {r.device_id for r in rows if r.device_id is not None}
+    if not ids:
+        return {}
+    return dict(db.session.query(Device.id, Device.serial_no).filter(Device.id.in_(ids)).all())
+
+
+def _end_row(rec, serials):
+    """The end-DB row for one attendance log, or None when it has no badge."""
+    # Get userId (badge)
+    raw_user = None
+    if getattr(rec, "user_id", None):
+        raw_user = str(rec.user_id).strip()
+    elif getattr(rec, "device_userid", None):
+        raw_user = str(rec.device_userid).strip()
+    if not raw_user:
+        return None
+
+    # log_date & log_time (subtract 10 min)
+    log_dt = rec.timestamp - timedelta(minutes=10)
+
+    # Device mapping (serial_no, falling back to the device id)
+    serial_no = serials.get(rec.device_id) or str(getattr(rec, "device_id", "") or "")
 
     # Match PHP exporter: column order (without id, created_at, source)
-    insert_sql = text(
-        f"INSERT INTO {target_table} "
-        "(log_date, badge, badge_dup, placeholder, log_time, flag, access_door, batch, access_device) "
-        "VALUES (:u_logDate, :u_userId, :u_userId, '', :u_logTime, '0', :u_accessDoor, '', :u_accessDev)"
-    )
-
-    with engine.begin() as conn:
-        for rec in rows:
-            try:
-                # Get userId (badge)
-                raw_user = None
-                if getattr(rec, "user_id", None):
-                    raw_user = str(rec.user_id).strip()
-                elif getattr(rec, "device_userid", None):
-                    raw_user = str(rec.device_userid).strip()
-                if not raw_user:
-                    skipped_empty_user += 1
-                    continue
+    return {
+        "log_date": log_dt.strftime("%Y-%m-%d"),
+        "badge": raw_user,
+        "badge_dup": raw_user,
+        "placeholder": "",
+        "log_time": log_dt.strftime("%H:%M:%S"),
+        "flag": "0",
+        "access_door": serial_no,
+        "batch": "",
+        "access_device": f"ZKT-FLASK-{serial_no}",
+    }
 
-                # log_date & log_time (subtract 10 min)
-                log_dt = rec.timestamp - timedelta(minutes=10)
-                u_logDate = log_dt.strftime("%Y-%m-%d")
-                u_logTime = log_dt.strftime("%H:%M:%S")
-
-                # Device mapping
-                dev_obj = getattr(rec, "device", None)
-                serial_no = None
-                if dev_obj:
-                    serial_no = getattr(dev_obj, "serial_no", None) or str(getattr(rec, "device_id", ""))
-                else:
-                    serial_no = str(getattr(rec, "device_id", "") or "")
-
-                u_accessDoor = serial_no
-                u_accessDev = f"ZKT-FLASK-{serial_no}"
-
-                # Duplicate check
-                dup_params = {
-                    "logDate": u_logDate,
-                    "userId": raw_user,
-                    "logTime": u_logTime,
-                    "accessDev": u_accessDev
-                }
-                dup_row = conn.execute(dup_check_sql, dup_params).scalar()
-                if dup_row and int(dup_row) > 0:
-                    skipped_existing += 1
-                    if hasattr(rec, "exported"):
-                        try:
-                            rec.exported = True
-                            rec.exported_at = datetime.utcnow()
-                            db.session.add(rec)
-                            db.session.commit()
-                        except Exception:
-                            db.session.rollback()
-                    continue
 
-                if dry_run:
-                    exported += 1
-                    continue
+def _key_part(v):
+    """End-DB value -> the string form the exporter writes (DATE/TIME come back as objects)."""
+    if isinstance(v, timedelta):  # MySQL TIME
+        secs = int(v.total_seconds())
+        return f"{secs // 3600:02d}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, date):
+        return v.strftime("%Y-%m-%d")
+    if isinstance(v, dt_time):
+        return v.strftime("%H:%M:%S")
+    return "" if v is None else str(v)
+
+
+def _row_key(row):
+    return tuple(_key_part(row[c]) for c in KEY_COLUMNS)
+
+
+def _chunks(seq, n):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
 
-                conn.execute(insert_sql, {
-                    "u_logDate": u_logDate,
-                    "u_userId": raw_user,
-                    "u_logTime": u_logTime,
-                    "u_accessDoor": u_accessDoor,
-                    "u_accessDev": u_accessDev,
-                })
-                exported += 1
-
-                if hasattr(rec, "exported"):
-                    try:
-                        rec.exported = True
-                        rec.exported_at = datetime.utcnow()
-                        db.session.add(rec)
-                        db.session.commit()
-                    except Exception:
-                        db.session.rollback()
 
+def _existing_keys(conn, target, keys, chunk_size):
+    """The subset of `keys` already present in the end table (one query per chunk)."""
+    cols = [target.c[c] for c in KEY_COLUMNS]
+    found = set()
+    for chunk in _chunks(sorted(keys), chunk_size):
+        for row in conn.execute(select(*cols).where(tuple_(*cols).in_(chunk))):
+            found.add(tuple(_key_part(v) for v in row))
+    return found & set(keys)
+
+
+def _insert_rows(conn, target, rows, chunk_size):
+    """
+    Multi-row INSERT of `rows`, chunk by chunk inside savepoints. A rejected chunk is
+    retried one row at a time. Returns {index into `rows`: error} for the rows that failed.
+    """
+    failed = {}
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with conn.begin_nested():
+                conn.execute(target.insert().values(chunk))
+            continue
+        except Exception as e:
+            logger.warning("Exporter chunk of %d rows rejected, retrying row by row: %s", len(chunk), e)
+        for i, row in enumerate(chunk, start):
+            try:
+                with conn.begin_nested():
+                    conn.execute(target.insert().values(row))
             except Exception as e:
-                errors += 1
+                failed[i] = f"{e.__class__.__name__}: {e}"
                 logger.exception("Exporter row error: %s", e)
+    return failed
+
+
+class _BulkDialect(csv.Dialect):
+    """Tab-separated, backslash-escaped lines: what LOAD DATA reads with the options in `_load_file`."""
+    delimiter = "\t"
+    quoting = csv.QUOTE_NONE
+    quotechar = '"'
+    escapechar = "\\"
+    doublequote = False
+    lineterminator = "\n"
+    skipinitialspace = False
+    strict = True
+
+
+def _write_bulk_file(rows):
+    """The rows as a temporary bulk file (in EXPORT_BULK_DIR, else the system temp dir); returns its path."""
+    fd, path = tempfile.mkstemp(prefix="enddb-export-", suffix=".tsv", dir=current_app.config.get("EXPORT_BULK_DIR"))
+    with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, dialect=_BulkDialect)
+        for row in rows:
+            writer.writerow([row[c] for c in END_COLUMNS])
+    return path
+
+
+def _load_file(conn, target, path, chunk_size):
+    """Load a bulk file into `target` on this connection; returns the number of rows loaded."""
+    if conn.dialect.name == "mysql":
+        quote = conn.dialect.identifier_preparer.quote
+        res = conn.execute(text(
+            f"LOAD DATA LOCAL INFILE :path INTO TABLE {quote(target.name)} CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+            f"({', '.join(quote(c) for c in END_COLUMNS)})"), {"path": path})
+        return res.rowcount
+    loaded = 0
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = (dict(zip(END_COLUMNS, line)) for line in csv.reader(f, dialect=_BulkDialect))
+        for chunk in _chunks(list(rows), chunk_size):
+            conn.execute(target.insert(), chunk)
+            loaded += len(chunk)
+    return loaded
+
+
+def _bulk_insert_rows(conn, target, rows, chunk_size):
+    """
+    `_insert_rows` for bulk mode: all rows through one bulk file, then the count and the
+    keys are checked. Any mismatch raises, so the caller's end-DB transaction rolls the
+    file back and the batch is retried as a whole. Returns {} (no per-row failures).
+    """
+    path = _write_bulk_file(rows)
+    try:
+        loaded = _load_file(conn, target, path, chunk_size)
+    finally:
+        os.remove(path)
+    if loaded != len(rows):
+        raise RuntimeError(f"bulk load wrote {loaded} of {len(rows)} rows")
+    keys = {_row_key(r) for r in rows}
+    found = _existing_keys(conn, target, keys, chunk_size)
+    if len(found) != len(keys):
+        raise RuntimeError(f"bulk load verification: {len(keys) - len(found)} of {len(keys)} keys missing")
+    return {}
+
+
+def _gap_rows(position, limit, partition=None):
+    """Unexported rows just below the cursor that were committed after it passed them."""
+    window = int(current_app.config.get("EXPORT_GAP_RESCAN_IDS", 50000))
+    if not window or limit <= 0:
+        return []
+    er = ExportRetry.__table__
+    query = AttendanceLog.query.filter(
+        AttendanceLog.exported.is_(False), AttendanceLog.id <= position, AttendanceLog.id > position - window,
+        ~select(er.c.log_id).where(er.c.log_id == AttendanceLog.id).exists())
+    if partition is not None:
+        query = query.filter(AttendanceLog.device_id % partition[1] == partition[0])
+    return query.order_by(AttendanceLog.id).limit(limit).all()
+
+
+def fetch_export_batch(batch_size, lookback_days=None, after_id=None, retries=True, new_rows=True, partition=None):
+    """
+    The next batch as ExportRows: due export_retries first (when `retries`), then up to
+    `batch_size` rows past the export cursor (or past `after_id`) in id order (when
+    `new_rows`), only those of `partition` (k, n) when given. Without `after_id` the rows
+    below the cursor that were committed late come first (see module docstring); with it
+    (a fetch ahead of an unwritten batch) they are left for the next run, which keeps
+    them out of two batches at once. Device serials are resolved once. Read-only, so it
+    can run in another thread's app context while the previous batch is being written.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=int(lookback_days)) if lookback_days is not None else None
+    due = _due_retries(batch_size) if retries else []
+    recs = AttendanceLog.query.filter(AttendanceLog.id.in_(due)).all() if due else []
+    if new_rows and len(due) < batch_size:
+        position = _export_position(partition)
+        if after_id is None:
+            recs += _gap_rows(position, batch_size - len(recs), partition)
+        else:
+            # after_id is below the cursor when the batch ahead held only late rows
+            position = max(position, after_id)
+        query = AttendanceLog.query.filter(AttendanceLog.id > position)
+        if partition is not None:
+            query = query.filter(AttendanceLog.device_id % partition[1] == partition[0])
+        recs += query.order_by(AttendanceLog.id).limit(batch_size - len(recs)).all()
+
+    serials = _device_serials(recs)
+    due_ids = set(due)
+    out = []
+    for rec in recs:
+        retry = rec.id in due_ids
+        if rec.exported and not retry:
+            # flagged before the cursor existed: only moves the cursor
+            out.append(ExportRow(rec.id, rec.timestamp, None, False, "exported"))
+            continue
+        if cutoff is not None and rec.timestamp < cutoff and not retry:
+            # the window only bounds new rows; a retry (e.g. a requeued dead row) is exported whatever its age
+            out.append(ExportRow(rec.id, rec.timestamp, None, False, "older than the lookback window"))
+            continue
+        row = _end_row(rec, serials)
+        out.append(ExportRow(rec.id, rec.timestamp, row, retry, None if row is not None else "no badge"))
+    # retries whose log row is gone (retention, device delete) are cleared
+    out += [ExportRow(i, None, None, True, "gone") for i in due_ids - {rec.id for rec in recs}]
+    return out
+
+
+def write_export_batch(batch, dry_run=False, partition=None, bulk=False):
+    """Write one fetched batch to the end DB (as a bulk file when `bulk`) and flag what made it (see module docstring)."""
+    end_db_uri = current_app.config.get("END_DB_URI") or current_app.config.get("ENDDB_DATABASE_URI")
+    if not end_db_uri:
+        raise RuntimeError("END_DB_URI (or ENDDB_DATABASE_URI) not configured")
+
+    engine = _end_engine(end_db_uri, local_infile=bulk)
+    target = _end_table(current_app.config.get("END_TARGET_TABLE", "att_raw_data_old"))
+    chunk_size = int(current_app.config.get("EXPORT_INSERT_CHUNK", 500))
+
+    skipped_empty_user = skipped_stale = 0
+    failures, cleared = {}, []  # {log_id: error} for export_retries / retries to drop
+    candidates = []  # (rec, end row, key)
+    for rec in batch:
+        if rec.problem == "exported":
+            continue
+        if rec.problem == "gone":
+            cleared.append(rec.id)
+        elif rec.problem:
+            failures[rec.id] = (DEAD, rec.problem)
+            if rec.row is None and rec.problem == "no badge":
+                skipped_empty_user += 1
+            else:
+                skipped_stale += 1
+        else:
+            candidates.append((rec, rec.row, _row_key(rec.row)))
+
+    new, done = [], []  # rows to insert (first of each key) / recs to flag exported
+    try:
+        with engine.begin() as conn:
+            existing = _existing_keys(conn, target, {k for _, _, k in candidates}, chunk_size) if candidates else set()
+            seen = set()
+            skipped_existing = 0
+            for rec, row, key in candidates:
+                if key in existing or key in seen:
+                    # already in the end DB, or a second log mapping onto the same end row in this batch
+                    skipped_existing += 1
+                    done.append(rec)
+                    continue
+                seen.add(key)
+                new.append((rec, row))
+
+            if dry_run:
+                return {"exported": len(new), "skipped_existing": skipped_existing,
+                        "skipped_empty_user": skipped_empty_user, "skipped_stale": skipped_stale,
+                        "errors": 0, "dead": 0}
+
+            insert = _bulk_insert_rows if bulk and new else _insert_rows
+            failed = insert(conn, target, [row for _, row in new], chunk_size)
+            done.extend(rec for i, (rec, _) in enumerate(new) if i not in failed)
+            failures.update({new[i][0].id: err for i, err in failed.items()})
+            _stage_exported(done, chunk_size)
+            _stage_cleared(cleared + [rec.id for rec in done if rec.retry])
+            dead = _stage_failures(failures)
+            fresh = [rec.id for rec in batch if not rec.retry]
+            if fresh:
+                _stage_position(max(fresh), partition)
+        # end-DB rows are committed; commit their flags (and the cursor) right behind them
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
 
     return {
-        "exported": exported,
+        "exported": len(new) - len(failed),
         "skipped_existing": skipped_existing,
         "skipped_empty_user": skipped_empty_user,
-        "errors": errors
+        "skipped_stale": skipped_stale,
+        "errors": len(failed),
+        "dead": dead,
     }
 
 
+def export_attendance_direct(batch_size=1500, lookback_days=None, dry_run=False):
+    """Export one batch of at most `batch_size` rows."""
+    batch = fetch_export_batch(batch_size, lookback_days)
+    if not batch:
+        return {"exported": 0, "skipped_existing": 0, "skipped_empty_user": 0, "skipped_stale": 0,
+                "errors": 0, "dead": 0}
+    return write_export_batch(batch, dry_run=dry_run)
+
+
+class _BatchSizer:
+    """
+    Batch size for the drain: grows while batches finish well under the target time,
+    shrinks when they take longer, and halves on a high error rate or a failed batch.
+    """
+
+    def __init__(self, size, min_size, max_size, target_seconds, max_error_rate):
+        self.min_size, self.max_size = int(min_size), int(max_size)
+        self.size = max(self.min_size, min(int(size), self.max_size))
+        self.target_seconds = float(target_seconds)
+        self.max_error_rate = float(max_error_rate)
+
+    def _set(self, size):
+        self.size = max(self.min_size, min(int(size), self.max_size))
+
+    def observe(self, rows, seconds, errors):
+        if rows and errors / rows > self.max_error_rate:
+            self._set(self.size / 2)
+        elif seconds > self.target_seconds:
+            self._set(self.size * max(self.target_seconds / seconds, 0.5))
+        elif seconds < self.target_seconds / 2 and rows >= self.size:
+            self._set(self.size * 1.5)
+
+    def failed(self):
+        self._set(self.size / 2)
+
+
+def drain_export_backlog(app, lookback_days=None, progress=None, partition=None, bulk=False):
+    """
+    Export batches until the cursor reaches the newest row (including anything
+    ingested meanwhile), then the export_retries that are due. With `partition`
+    (k, n) only that partition's rows and cursor, and no retries. With `bulk`,
+    every batch is one bulk file of EXPORT_BULK_FILE_ROWS rows. The next batch is
+    fetched in a second thread while the current one is written; the batch size
+    follows `_BatchSizer`. A batch that fails is retried after a pause, up to
+    EXPORT_DRAIN_MAX_FAILURES times in a row. Rows that fail individually go to
+    export_retries and come back once their backoff has passed.
+    `progress(totals)` is called after every batch. Must run inside an app context;
+    the caller holds the export lock.
+    """
+    cfg = app.config
+    sizer = _BatchSizer(cfg.get("EXPORT_BATCH_SIZE", 1500), cfg.get("EXPORT_MIN_BATCH_SIZE", 200),
+                        cfg.get("EXPORT_MAX_BATCH_SIZE", 10000), cfg.get("EXPORT_TARGET_BATCH_SECONDS", 2.0),
+                        cfg.get("EXPORT_MAX_ERROR_RATE", 0.05))
+    if bulk:
+        rows = int(cfg.get("EXPORT_BULK_FILE_ROWS", 50000))
+        sizer = _BatchSizer(rows, rows, rows, sizer.target_seconds, sizer.max_error_rate)
+    max_failures = int(cfg.get("EXPORT_DRAIN_MAX_FAILURES", 3))
+    totals = {"exported": 0, "skipped_existing": 0, "skipped_empty_user": 0, "skipped_stale": 0,
+              "errors": 0, "dead": 0, "batches": 0, "batch_size": sizer.size}
+
+    def fetch(after_id, size, retries=False):
+        with app.app_context():
+            return fetch_export_batch(size, lookback_days, after_id=after_id,
+                                      retries=retries, new_rows=not retries, partition=partition)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-fetch") as pool:
+        pending = pool.submit(fetch, None, sizer.size)
+        failures = 0
+        retrying = False
+        while True:
+            batch = pending.result()
+            if not batch:
+                if retrying or partition is not None:
+                    break
+                # new rows done; now the retries that are due (each is rescheduled or
+                # cleared when written, so this ends)
+                retrying = True
+                pending = pool.submit(fetch, None, sizer.size, True)
+                continue
+            if not retrying:
+                pending = pool.submit(fetch, batch[-1].id, sizer.size)
+            while True:
+                t0 = time.monotonic()
+                try:
+                    res = write_export_batch(batch, partition=partition, bulk=bulk)
+                    break
+                except Exception as e:
+                    failures += 1
+                    sizer.failed()
+                    logger.warning("Export batch of %d rows failed (%d/%d): %s", len(batch), failures, max_failures, e)
+                    if failures >= max_failures:
+                        pending.cancel()
+                        raise
+                    time.sleep(min(2 ** failures, 30))
+            failures = 0
+            if retrying:
+                pending = pool.submit(fetch, None, sizer.size, True)
+            sizer.observe(len(batch), time.monotonic() - t0, res["errors"])
+            for k in ("exported", "skipped_existing", "skipped_empty_user", "skipped_stale", "errors", "dead"):
+                totals[k] += res[k]
+            totals["batches"] += 1
+            totals["batch_size"] = sizer.size
+            if progress:
+                progress(dict(totals))
+    return totals
+
+
+def export_partitioned(app, workers, lookback_days=None, progress=None):
+    """
+    Drain the backlog with `workers` partitions in parallel (see module docstring),
+    then settle the main cursor and drain serially for what is left and the retries.
+    Each partition's failure is reported in its "error"; the others carry on. Must run
+    inside an app context; the caller holds the export lock.
+    """
+    workers = int(workers)
+    partitions, high = _align_cursors(workers)
+    keys = ("exported", "skipped_existing", "skipped_empty_user", "skipped_stale", "errors", "dead", "batches")
+    parts = {p: {"partition": f"{p[0]}/{p[1]}", "error": None} for p in partitions}
+    lock = threading.Lock()
+
+    def report():
+        if progress:
+            with lock:
+                totals = {k: sum(r.get(k, 0) for r in parts.values()) for k in keys}
+                totals["partitions"] = [dict(r) for r in parts.values()]
+            progress(totals)
+
+    def run(p):
+        def _progress(totals):
+            with lock:
+                parts[p].update(totals)
+            report()
+        with app.app_context():
+            try:
+                drain_export_backlog(app, lookback_days, progress=_progress, partition=p)
+            except Exception as e:
+                with lock:
+                    parts[p]["error"] = f"{e.__class__.__name__}: {e}"
+                logger.exception("Export partition %d/%d failed", *p)
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export-part") as pool:
+        list(pool.map(run, partitions))
+
+    _settle_cursors(partitions, high, {p for p, r in parts.items() if r["error"]})
+    rest = drain_export_backlog(app, lookback_days)
+    totals = {k: sum(r.get(k, 0) for r in parts.values()) + rest[k] for k in keys}
+    totals["batch_size"] = rest["batch_size"]
+    totals["partitions"] = list(parts.values())
+    return totals
+
+
 # Alias for scheduler compatibility
 export_attendance_to_enddb_noaccess = export_attendance_direct
@@ -20,6 +20,7 @@ from sqlalchemy import create_engine, text
 # Adjust imports to match your project layout
 from .extensions import db
 from .models import Branch, Device, AccessUserInfo, CheckinOut
+from .dictionaries import serial_id, checkinout_text_id
 
 # importer of exporter
 from .exporter import export_to_enddb
@@ -94,8 +95,10 @@ def seed_sample_data(app):
         # Two rows: one that will be exported, and one duplicate we pre-create in end DB to test skipping.
         t1 = datetime.utcnow()
         t2 = datetime.utcnow() - timedelta(minutes=1)
-        c1 = CheckinOut(USERID='122', CHECKTIME=t1, CHECKTYPE='IN', WorkCode='FLASK', sn=dev.serial_no)
-        c2 = CheckinOut(USERID='311', CHECKTIME=t2, CHECKTYPE='IN', WorkCode='FLASK', sn=dev.serial_no)
+        text_id = checkinout_text_id(WorkCode='FLASK')
+        sn_id = serial_id(dev.serial_no)
+        c1 = CheckinOut(USERID='122', CHECKTIME=t1, CHECKTYPE='IN', text_id=text_id, sn_id=sn_id)
+        c2 = CheckinOut(USERID='311', CHECKTIME=t2, CHECKTYPE='IN', text_id=text_id, sn_id=sn_id)
         db.session.add_all([c1, c2])
         db.session.commit()
 
@@ -2,8 +2,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_socketio import SocketIO
+from .replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 socketio = SocketIO(cors_allowed_origins="*", async_mode='eventlet', logger=False, engineio_logger=False)
 
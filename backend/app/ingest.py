@@ -0,0 +1,744 @@
+# app/ingest.py
+"""
+Bulk write path for device punches.
+
+Rows are plain dicts (no ORM hydration) written with SQLAlchemy Core executemany
+INSERTs, which PyMySQL rewrites into multi-row VALUES statements. Duplicates are
+dropped by the database through the unique constraints on the target table
+(INSERT IGNORE on MySQL, ON CONFLICT DO NOTHING on SQLite/PostgreSQL) instead
+of being filtered in Python.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import calendar
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+
+from colorama import Fore
+from sqlalchemy import or_, func
+from sqlalchemy.exc import DataError, IntegrityError, StatementError, DBAPIError
+
+from .extensions import db
+from .db_helpers import dialect_name, insert_ignore_stmt, encode_rows, decode_rows
+from .models import AttendanceLog, Device, IngestDeadLetter
+from .seen_index import mark_seen
+from .rollups import refresh_rollups_for_rows, rollup_archive_dir
+from .counters import apply_log_deltas, subtract_deleted
+
+# rows per INSERT statement; keeps SQLite below its bound-parameter limit
+# and MySQL statements well under max_allowed_packet
+DEFAULT_INSERT_CHUNK = 1000
+
+
+def bulk_insert_rows(conn, table, rows, chunk_size=DEFAULT_INSERT_CHUNK, ignore_duplicates=True):
+    """
+    Write `rows` (list of dicts, all with the same keys) into `table` in chunks.
+    A compiled statement is reused for every chunk (executemany), which is an order
+    of magnitude cheaper than compiling a literal multi-VALUES clause per chunk.
+    `conn` may be a Session or a Connection; the caller owns the transaction.
+    Returns the number of rows the database actually inserted.
+    """
+    if not rows:
+        return 0
+    base = insert_ignore_stmt(table, dialect_name(conn)) if ignore_duplicates else table.insert()
+    chunk_size = max(1, int(chunk_size or DEFAULT_INSERT_CHUNK))
+
+    inserted = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        res = conn.execute(base, chunk)
+        if res.rowcount is not None and res.rowcount >= 0:
+            inserted += res.rowcount
+        else:
+            inserted += len(chunk)
+    return inserted
+
+
+def natural_key(sn, device_userid, timestamp, status):
+    """
+    Content key of a punch: sha1 hex of serial|device USERID|timestamp|status.
+    Stable across device record-id resets, so re-reading a device is exact.
+    `sn` is always the device's key serial (see `device_key_serial`).
+    """
+    ts = timestamp.strftime("%Y-%m-%d %H:%M:%S") if hasattr(timestamp, "strftime") else str(timestamp)
+    raw = f"{sn or ''}|{device_userid or ''}|{ts}|{status if status is not None else ''}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def device_key_serial(key_serial, serial_no, ip_address):
+    """
+    The serial a device's natural keys are built from. Ingest, the key backfill, the
+    seen index and the access_checkinout projection all go through this (or
+    `key_serial_expr`), so their keys agree. It is devices.key_serial, stored on the
+    device's first contact and never changed, so filling in serial_no later re-keys
+    nothing; a device not contacted yet (no rows) falls back to serial_no / IP.
+    """
+    return key_serial or serial_no or ip_address
+
+
+def key_serial_expr(devs):
+    """SQL form of `device_key_serial` over the devices table."""
+    return func.coalesce(devs.c.key_serial, func.nullif(devs.c.serial_no, ""), devs.c.ip_address)
+
+
+def claim_key_serial(device_id, sn):
+    """First contact: store `sn` as the device's key serial unless it has one; returns the one in effect."""
+    tbl = Device.__table__
+    with db.engine.begin() as conn:
+        conn.execute(tbl.update().where(tbl.c.id == device_id, tbl.c.key_serial.is_(None)).values(key_serial=sn))
+        return conn.execute(db.select(tbl.c.key_serial).where(tbl.c.id == device_id)).scalar()
+
+
+def natural_key_int(nk):
+    """Signed 64-bit prefix of a natural key, as stored in the in-memory seen index."""
+    v = int(nk[:16], 16)
+    return v - (1 << 64) if v >= (1 << 63) else v
+
+
+def timestamp_order(ts):
+    """Seconds since epoch for a naive device timestamp (the seen-index watermark)."""
+    return calendar.timegm(ts.timetuple())
+
+
+def attendance_row(device_id, record_id, device_userid, badge_id, timestamp, status, sn=None, created_at=None):
+    """Plain dict matching the attendance_logs columns written at ingest."""
+    return {
+        "device_id": device_id,
+        "record_id": record_id,
+        "user_id": device_userid,
+        "device_userid": device_userid,
+        "badge_id": badge_id,
+        "access_userid": None,
+        "timestamp": timestamp,
+        "status": status,
+        "natural_key": natural_key(sn, device_userid, timestamp, status),
+        "created_at": created_at or datetime.utcnow(),
+        "exported": False,
+    }
+
+
+def insert_attendance_rows(conn, rows, chunk_size=DEFAULT_INSERT_CHUNK):
+    """Insert AttendanceLog rows; punches already stored are dropped by the unique natural_key."""
+    return bulk_insert_rows(conn, AttendanceLog.__table__, rows, chunk_size=chunk_size, ignore_duplicates=True)
+
+
+def update_device_serial(conn, device_id, sn):
+    """Persist a resolved serial on a device that doesn't have one yet (no-op otherwise)."""
+    tbl = Device.__table__
+    res = conn.execute(
+        tbl.update()
+        .where(tbl.c.id == device_id)
+        .where(or_(tbl.c.serial_no.is_(None), tbl.c.serial_no == ""))
+        .values(serial_no=sn)
+    )
+    return res.rowcount or 0
+
+
+def backfill_natural_keys(chunk_size=5000, max_chunks=None, sleep_seconds=0.0, rollups=False, archive_dir=None):
+    """
+    Fill attendance_logs.natural_key for rows written before it existed.
+    Walks the table in id ranges, one short transaction per chunk. A row whose key
+    already belongs to another row (a punch re-imported after a device reset) is
+    deleted and counted as a duplicate; counters (and with `rollups` the daily
+    rollups) follow in the same transaction.
+    """
+    logs = AttendanceLog.__table__
+    devs = Device.__table__
+    chunk_size = max(1, int(chunk_size))
+    with db.engine.connect() as conn:
+        lo, top = conn.execute(
+            db.select(db.func.min(logs.c.id), db.func.max(logs.c.id)).where(logs.c.natural_key.is_(None))
+        ).one()
+    result = {"chunks": 0, "updated": 0, "duplicates": 0, "last_id": None}
+    if lo is None:
+        return result
+
+    while lo <= top:
+        hi = lo + chunk_size
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                db.select(logs.c.id, logs.c.device_id, logs.c.user_id, logs.c.device_userid, logs.c.timestamp,
+                          logs.c.status, key_serial_expr(devs).label("key_sn"))
+                .select_from(logs.join(devs, devs.c.id == logs.c.device_id))
+                .where(logs.c.id >= lo, logs.c.id < hi, logs.c.natural_key.is_(None))
+                .order_by(logs.c.id)
+            ).all()
+            keyed, dupes = {}, []
+            for r in rows:
+                if r.timestamp is None:
+                    continue
+                nk = natural_key(r.key_sn, r.device_userid, r.timestamp, r.status)
+                if nk in keyed:
+                    dupes.append(r)
+                    continue
+                keyed[nk] = r
+            if keyed:
+                taken = set(conn.execute(
+                    db.select(logs.c.natural_key).where(logs.c.natural_key.in_(list(keyed)))
+                ).scalars())
+                dupes += [keyed.pop(nk) for nk in taken]
+                params = [{"b_id": r.id, "b_ts": r.timestamp, "b_nk": nk} for nk, r in keyed.items()]
+                if params:
+                    conn.execute(
+                        # the timestamp lets MySQL prune to the row's month partition
+                        logs.update()
+                        .where(logs.c.id == db.bindparam("b_id"), logs.c.timestamp == db.bindparam("b_ts"))
+                        .values(natural_key=db.bindparam("b_nk")),
+                        params,
+                    )
+                    result["updated"] += len(params)
+            if dupes:
+                # the same punch is already stored under its key: drop the copy
+                ids = logs.c.id.in_([r.id for r in dupes])
+                subtract_deleted(conn, ids)
+                conn.execute(logs.delete().where(ids))
+                if rollups:
+                    refresh_rollups_for_rows(conn, [r._asdict() for r in dupes], archive_dir=archive_dir)
+                result["duplicates"] += len(dupes)
+        result["chunks"] += 1
+        result["last_id"] = hi - 1
+        lo = hi
+        if max_chunks and result["chunks"] >= max_chunks:
+            break
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+    return result
+
+
+# -------------------------
+# Ingest batch (one device poll)
+# -------------------------
+class IngestBatch:
+    """Decoded, resolved rows from one device poll, ready to be written."""
+    __slots__ = ("device_id", "device_name", "sn", "attendance_rows",
+                 "set_serial", "enqueued_at", "done", "inserted", "quarantined", "error")
+
+    def __init__(self, device_id, device_name=None, sn=None, attendance_rows=None, set_serial=False):
+        self.device_id = device_id
+        self.device_name = device_name
+        self.sn = sn
+        self.attendance_rows = attendance_rows or []
+        self.set_serial = set_serial
+        self.enqueued_at = None
+        self.done = threading.Event()
+        self.inserted = 0
+        self.quarantined = 0
+        self.error = None
+
+    @property
+    def size(self):
+        return len(self.attendance_rows)
+
+
+def is_row_error(exc):
+    """
+    True when a failed statement was caused by the rows themselves (oversize value,
+    bad type, FK/NOT NULL violation), so retrying a subset can succeed. Connection
+    loss, lock timeouts and other OperationalErrors are not: the whole group is retried.
+    """
+    if isinstance(exc, (DataError, IntegrityError)):
+        return True
+    return isinstance(exc, StatementError) and not isinstance(exc, DBAPIError)
+
+
+def _begin_sqlite_txn(conn):
+    """
+    pysqlite only opens a transaction at the first DML, so a leading SAVEPOINT would run
+    outside it (and survive an outer rollback). Open the transaction explicitly first.
+    """
+    try:
+        raw = (conn.connection() if callable(getattr(conn, "connection", None)) else conn.connection).dbapi_connection
+    except Exception:
+        return
+    if isinstance(raw, sqlite3.Connection) and not raw.in_transaction:
+        raw.execute("BEGIN")
+
+
+def _insert_bisect(conn, table, rows, quarantine):
+    """Insert `rows` under a savepoint; on a row error split in halves until the bad rows are alone."""
+    try:
+        with conn.begin_nested():
+            return bulk_insert_rows(conn, table, rows, chunk_size=len(rows), ignore_duplicates=True)
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(rows) == 1:
+            quarantine(rows[0], e)
+            return 0
+        mid = len(rows) // 2
+        return _insert_bisect(conn, table, rows[:mid], quarantine) + _insert_bisect(conn, table, rows[mid:], quarantine)
+
+
+def insert_rows_isolated(conn, table, rows, savepoint_rows=DEFAULT_INSERT_CHUNK, quarantine=None):
+    """
+    Insert rows in savepoint-protected chunks of `savepoint_rows`. A chunk that fails
+    on bad data is bisected; rows that fail alone are passed to quarantine(row, exc)
+    and the rest of the batch still goes in. Returns rows inserted.
+    """
+    savepoint_rows = max(1, int(savepoint_rows or DEFAULT_INSERT_CHUNK))
+    _begin_sqlite_txn(conn)
+    inserted = 0
+    for i in range(0, len(rows), savepoint_rows):
+        inserted += _insert_bisect(conn, table, rows[i:i + savepoint_rows], quarantine)
+    return inserted
+
+
+def dead_letter_row(row, exc, device_id=None, sn=None, target_table="attendance_logs"):
+    err = getattr(exc, "orig", None) or exc
+    now = datetime.utcnow()
+    return {
+        "target_table": target_table,
+        "device_id": device_id if device_id is not None else row.get("device_id"),
+        "sn": sn,
+        "natural_key": row.get("natural_key"),
+        "payload": json.dumps(encode_rows([row])[0], default=str),
+        "error": f"{type(err).__name__}: {err}"[:1000],
+        "attempts": 1,
+        "created_at": now,
+        "last_attempt_at": now,
+    }
+
+
+def write_batches(conn, batches, chunk_size=DEFAULT_INSERT_CHUNK, savepoint_rows=None, rollups=False, archive_dir=None):
+    """
+    Write several IngestBatch objects inside the caller's transaction.
+    With `savepoint_rows`, rows go in under savepoints and rows the database rejects
+    are moved to ingest_dead_letters instead of failing the whole group.
+    With `rollups`, the daily rollups for the days/badges/devices the batches touched
+    are recomputed in the same transaction.
+    The per-device log counters are always updated in the same transaction.
+    Sets `batch.inserted` / `batch.quarantined` and returns the total AttendanceLog rows inserted.
+    """
+    total = 0
+    deltas = {}
+    for b in batches:
+        if savepoint_rows:
+            dead = []
+            b.inserted = insert_rows_isolated(
+                conn, AttendanceLog.__table__, b.attendance_rows, savepoint_rows=savepoint_rows,
+                quarantine=lambda row, e, b=b: dead.append(dead_letter_row(row, e, device_id=b.device_id, sn=b.sn)),
+            )
+            if dead:
+                bulk_insert_rows(conn, IngestDeadLetter.__table__, dead, ignore_duplicates=False)
+            b.quarantined = len(dead)
+        else:
+            b.inserted = insert_attendance_rows(conn, b.attendance_rows, chunk_size=chunk_size)
+        if b.set_serial and b.sn:
+            if savepoint_rows:
+                try:
+                    with conn.begin_nested():
+                        update_device_serial(conn, b.device_id, b.sn)
+                except Exception as e:
+                    if not is_row_error(e):
+                        raise
+            else:
+                update_device_serial(conn, b.device_id, b.sn)
+        total += b.inserted
+        deltas[b.device_id] = deltas.get(b.device_id, 0) + b.inserted
+    apply_log_deltas(conn, deltas)
+    if rollups and total:
+        refresh_rollups_for_rows(conn, [r for b in batches if b.inserted for r in b.attendance_rows],
+                                 archive_dir=archive_dir)
+    return total
+
+
+def retry_dead_letters(ids=None, limit=1000, rollups=False, archive_dir=None):
+    """
+    Re-insert quarantined rows (all, or the given ids). Rows that go in are removed from
+    ingest_dead_letters; rows that still fail get their attempt count and error updated.
+    """
+    dl = IngestDeadLetter.__table__
+    q = db.select(dl).where(dl.c.target_table == "attendance_logs").order_by(dl.c.id).limit(int(limit))
+    if ids:
+        q = q.where(dl.c.id.in_(list(ids)))
+    result = {"retried": 0, "inserted": 0, "failed": 0}
+    inserted = {}  # device_id -> rows
+    with db.engine.begin() as conn:
+        for r in conn.execute(q).all():
+            row = decode_rows([json.loads(r.payload)])[0]
+            result["retried"] += 1
+            failed = []
+            insert_rows_isolated(conn, AttendanceLog.__table__, [row], savepoint_rows=1,
+                                 quarantine=lambda row, e: failed.append(e))
+            if failed:
+                err = getattr(failed[0], "orig", None) or failed[0]
+                conn.execute(dl.update().where(dl.c.id == r.id).values(
+                    attempts=dl.c.attempts + 1, last_attempt_at=datetime.utcnow(),
+                    error=f"{type(err).__name__}: {err}"[:1000]))
+                result["failed"] += 1
+            else:
+                conn.execute(dl.delete().where(dl.c.id == r.id))
+                result["inserted"] += 1
+                inserted[row["device_id"]] = inserted.get(row["device_id"], 0) + 1
+                apply_log_deltas(conn, {row["device_id"]: 1})
+                if rollups:
+                    refresh_rollups_for_rows(conn, [row], archive_dir=archive_dir)
+    if inserted:
+        from flask import current_app
+        batches = []
+        for device_id, n in inserted.items():
+            b = IngestBatch(device_id)
+            b.inserted = n
+            batches.append(b)
+        notify_live_export(current_app._get_current_object(), batches)
+    return result
+
+
+def notify_live_export(app, batches):
+    """
+    Hand committed batches to the live exporter (EXPORT_LIVE_ENABLED). The ingest writer
+    does this through its commit hook; paths that commit on their own (inline writes with
+    INGEST_WRITE_BEHIND off, dead-letter retries) call it after their commit.
+    """
+    if not app.config.get("EXPORT_LIVE_ENABLED", False):
+        return
+    try:
+        from .live_export import get_live_exporter
+        get_live_exporter(app).notify(batches)
+    except Exception as e:
+        print(Fore.RED + f"[LIVE EXPORT ERROR] notify failed: {e}")
+
+
+def mark_batches_seen(batches):
+    """After commit: record the batches' natural keys in the per-device seen index."""
+    for b in batches:
+        if b.attendance_rows:
+            mark_seen(b.device_id, [(natural_key_int(r["natural_key"]), timestamp_order(r["timestamp"]))
+                                    for r in b.attendance_rows if r.get("natural_key")])
+
+
+# -------------------------
+# Write-behind writer
+# -------------------------
+class MemoryIngestQueue:
+    """
+    Bounded in-process queue of IngestBatch objects (take/ack/release protocol).
+    A failed commit drops its batches; the rows aren't marked seen so the next poll re-reads them.
+    """
+    kind = "memory"
+    durable = False
+
+    def __init__(self, max_rows=50000):
+        self.max_rows = int(max_rows)
+        self._items = deque()
+        self._pending_rows = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def put(self, batch, timeout=300):
+        deadline = time.time() + float(timeout)
+        waited = 0.0
+        with self._cond:
+            # admit an oversize batch once the queue is empty so it can't block forever
+            while self._pending_rows and self._pending_rows + batch.size > self.max_rows:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"ingest queue full ({self._pending_rows} rows pending)")
+                t0 = time.time()
+                self._cond.wait(timeout=min(remaining, 1.0))
+                waited += time.time() - t0
+            batch.enqueued_at = time.time()
+            self._items.append(batch)
+            self._pending_rows += batch.size
+            self._cond.notify_all()
+        return waited
+
+    def take(self, flush_rows, flush_interval, max_txn_rows, stop_event):
+        with self._cond:
+            while not stop_event.is_set():
+                if self._items:
+                    age = time.time() - (self._items[0].enqueued_at or time.time())
+                    if self._pending_rows >= flush_rows or age >= flush_interval:
+                        break
+                    self._cond.wait(timeout=max(0.01, flush_interval - age))
+                else:
+                    self._cond.wait(timeout=1.0)
+            group, rows = [], 0
+            while self._items and (not group or rows + self._items[0].size <= max_txn_rows):
+                b = self._items.popleft()
+                group.append(b)
+                rows += b.size
+            self._pending_rows -= rows
+            self._in_flight += len(group)
+            self._cond.notify_all()
+            return None, group
+
+    def ack(self, token, batches):
+        mark_batches_seen(batches)
+        for b in batches:
+            b.done.set()
+        with self._cond:
+            self._in_flight -= len(batches)
+            self._cond.notify_all()
+
+    def release(self, token, batches, error):
+        for b in batches:
+            b.error = str(error)
+            b.done.set()
+        with self._cond:
+            self._in_flight -= len(batches)
+            self._cond.notify_all()
+        return True  # dropped
+
+    def is_drained(self):
+        with self._cond:
+            return not self._items and not self._in_flight
+
+    def depth(self):
+        with self._cond:
+            return {
+                "queue_batches": len(self._items),
+                "queue_rows": self._pending_rows,
+                "in_flight_batches": self._in_flight,
+                "oldest_wait_seconds": round(time.time() - self._items[0].enqueued_at, 3) if self._items else 0.0,
+            }
+
+
+class IngestWriter:
+    """
+    Single writer thread draining a batch source (MemoryIngestQueue or IngestSpool).
+
+    Pollers `submit()` batches and return immediately; the writer groups batches from
+    all devices into one transaction once INGEST_FLUSH_ROWS rows are pending or the
+    oldest batch has waited INGEST_FLUSH_INTERVAL_SECONDS. When the source is over its
+    row bound, `submit()` blocks (backpressure), so pollers slow down instead of piling
+    up memory while the DB lags. With the spool, failed commits are retried with
+    exponential backoff instead of being dropped. `on_commit(batches)` is called
+    after every commit that inserted rows (the live exporter's trigger).
+    """
+
+    def __init__(self, app, source, flush_rows=5000, flush_interval=1.0, max_txn_rows=20000,
+                 submit_timeout=300, chunk_size=DEFAULT_INSERT_CHUNK, retry_backoff=1.0, max_backoff=60.0,
+                 savepoint_rows=DEFAULT_INSERT_CHUNK, rollups=False, archive_dir=None, on_commit=None):
+        self.app = app
+        self.source = source
+        self.flush_rows = int(flush_rows)
+        self.flush_interval = float(flush_interval)
+        self.max_txn_rows = int(max_txn_rows)
+        self.submit_timeout = float(submit_timeout)
+        self.chunk_size = int(chunk_size)
+        self.retry_backoff = float(retry_backoff)
+        self.max_backoff = float(max_backoff)
+        self.savepoint_rows = int(savepoint_rows or 0)
+        self.rollups = bool(rollups)
+        self.archive_dir = archive_dir
+        self.on_commit = on_commit
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._backoff = 0.0
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "batches_submitted": 0,
+            "rows_submitted": 0,
+            "commits": 0,
+            "rows_committed": 0,
+            "rows_inserted": 0,
+            "rows_quarantined": 0,
+            "failed_commits": 0,
+            "rows_dropped": 0,
+            "last_commit_rows": 0,
+            "last_commit_seconds": None,
+            "avg_commit_seconds": None,
+            "max_commit_seconds": 0.0,
+            "backpressure_waits": 0,
+            "backpressure_seconds": 0.0,
+            "last_error": None,
+            "last_commit_at": None,
+        }
+
+    # ---- lifecycle ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        self.flush(timeout=timeout)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    # ---- producer side ----
+    def submit(self, batch, wait=False, timeout=None):
+        """
+        Queue a batch for writing. Blocks while the source is over its row bound.
+        With wait=True, also blocks until the batch is committed and returns rows inserted.
+        """
+        if not batch.attendance_rows and not batch.set_serial:
+            batch.done.set()
+            return 0
+
+        timeout = self.submit_timeout if timeout is None else float(timeout)
+        deadline = time.time() + timeout
+        waited = self.source.put(batch, timeout=timeout)
+        if self.source.durable:
+            # the batch is on disk and will be replayed until committed
+            mark_batches_seen([batch])
+
+        with self._stats_lock:
+            self._stats["batches_submitted"] += 1
+            self._stats["rows_submitted"] += batch.size
+            if waited:
+                self._stats["backpressure_waits"] += 1
+                self._stats["backpressure_seconds"] += waited
+
+        if wait:
+            batch.done.wait(timeout=max(0.0, deadline - time.time()))
+            if batch.error:
+                raise RuntimeError(batch.error)
+            return batch.inserted
+        return batch.size
+
+    def flush(self, timeout=60):
+        """Block until everything queued so far has been written (or timeout). Returns True when drained."""
+        deadline = time.time() + float(timeout)
+        while not self.source.is_drained():
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    # ---- writer side ----
+    def _commit_group(self, token, group):
+        rows = sum(b.size for b in group)
+        t0 = time.time()
+        try:
+            with db.engine.begin() as conn:
+                inserted = write_batches(conn, group, chunk_size=self.chunk_size, savepoint_rows=self.savepoint_rows,
+                                         rollups=self.rollups, archive_dir=self.archive_dir)
+            quarantined = sum(b.quarantined for b in group)
+            elapsed = time.time() - t0
+            self.source.ack(token, group)
+            self._backoff = 0.0
+            with self._stats_lock:
+                st = self._stats
+                st["commits"] += 1
+                st["rows_committed"] += rows
+                st["rows_inserted"] += inserted
+                st["rows_quarantined"] += quarantined
+                st["last_commit_rows"] = rows
+                st["last_commit_seconds"] = round(elapsed, 4)
+                st["avg_commit_seconds"] = round(elapsed if st["avg_commit_seconds"] is None
+                                                 else 0.8 * st["avg_commit_seconds"] + 0.2 * elapsed, 4)
+                st["max_commit_seconds"] = round(max(st["max_commit_seconds"], elapsed), 4)
+                st["last_commit_at"] = datetime.utcnow().isoformat()
+            print(Fore.WHITE + f"[INGEST WRITER] Committed {inserted}/{rows} rows from {len(group)} device batch(es) in {elapsed:.2f}s")
+            if quarantined:
+                print(Fore.YELLOW + f"[INGEST WRITER] Quarantined {quarantined} rejected row(s) in ingest_dead_letters")
+            if inserted and self.on_commit:
+                try:
+                    self.on_commit(group)
+                except Exception as hook_error:
+                    print(Fore.RED + f"[INGEST WRITER ERROR] commit hook failed: {hook_error}")
+        except Exception as e:
+            e = getattr(e, "orig", None) or e   # keep the driver message, not the full SQL dump
+            dropped = self.source.release(token, group, e)
+            with self._stats_lock:
+                self._stats["failed_commits"] += 1
+                if dropped:
+                    self._stats["rows_dropped"] += rows
+                self._stats["last_error"] = str(e)
+            if dropped:
+                print(Fore.RED + f"[INGEST WRITER ERROR] Commit of {rows} rows failed and was dropped: {e}")
+            else:
+                self._backoff = min(self.max_backoff, (self._backoff * 2) or self.retry_backoff)
+                print(Fore.RED + f"[INGEST WRITER ERROR] Commit of {rows} rows failed; kept in spool, retry in {self._backoff:.0f}s: {e}")
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    token, group = self.source.take(self.flush_rows, self.flush_interval, self.max_txn_rows, self._stop)
+                    if group:
+                        self._commit_group(token, group)
+                except Exception:
+                    print(Fore.RED + f"[INGEST WRITER ERROR] {traceback.format_exc()}")
+                    self._backoff = min(self.max_backoff, (self._backoff * 2) or self.retry_backoff)
+                finally:
+                    try:
+                        db.session.remove()
+                    except Exception:
+                        pass
+                if self._backoff:
+                    self._stop.wait(self._backoff)
+
+    # ---- metrics ----
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+        out.update(self.source.depth())
+        out["source"] = self.source.kind
+        out["max_rows"] = self.source.max_rows
+        out["retry_backoff_seconds"] = self._backoff
+        out["running"] = bool(self._thread and self._thread.is_alive())
+        return out
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def _make_source(app):
+    cfg = app.config
+    if cfg.get("INGEST_SPOOL_ENABLED", True):
+        from .spool import IngestSpool
+        path = cfg.get("INGEST_SPOOL_PATH") or os.path.join(cfg.get("INGEST_SPOOL_DIR", "spool"), "ingest_spool.sqlite3")
+        return IngestSpool(path,
+                           max_rows=cfg.get("INGEST_SPOOL_MAX_ROWS", 2000000),
+                           synchronous=cfg.get("INGEST_SPOOL_SYNCHRONOUS", "NORMAL"))
+    return MemoryIngestQueue(max_rows=cfg.get("INGEST_QUEUE_MAX_ROWS", 50000))
+
+
+def get_ingest_writer(app=None):
+    """Return the process-wide IngestWriter, creating and starting it on first use."""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            if app is None:
+                from flask import current_app
+                app = current_app._get_current_object()
+            cfg = app.config
+            on_commit = None
+            if cfg.get("EXPORT_LIVE_ENABLED", False):
+                from .live_export import get_live_exporter
+                on_commit = get_live_exporter(app).notify
+            _WRITER = IngestWriter(
+                app,
+                _make_source(app),
+                flush_rows=cfg.get("INGEST_FLUSH_ROWS", 5000),
+                flush_interval=cfg.get("INGEST_FLUSH_INTERVAL_SECONDS", 1.0),
+                max_txn_rows=cfg.get("INGEST_MAX_TXN_ROWS", 20000),
+                submit_timeout=cfg.get("INGEST_SUBMIT_TIMEOUT_SECONDS", 300),
+                chunk_size=cfg.get("INGEST_INSERT_CHUNK", DEFAULT_INSERT_CHUNK),
+                retry_backoff=cfg.get("INGEST_RETRY_BACKOFF_SECONDS", 1.0),
+                max_backoff=cfg.get("INGEST_MAX_BACKOFF_SECONDS", 60.0),
+                savepoint_rows=cfg.get("INGEST_SAVEPOINT_ROWS", DEFAULT_INSERT_CHUNK),
+                rollups=cfg.get("ROLLUPS_ENABLED", True),
+                archive_dir=rollup_archive_dir(app),
+                on_commit=on_commit,
+            )
+        _WRITER.start()
+        return _WRITER
+
+
+def ingest_stats():
+    """Writer metrics, or None when the write-behind writer hasn't been started."""
+    with _WRITER_LOCK:
+        writer = _WRITER
+    return writer.stats() if writer else None
+
+
+def flush_ingest_writer(timeout=60):
+    """Drain the writer if it exists; used before exports so they see committed rows."""
+    with _WRITER_LOCK:
+        writer = _WRITER
+    return writer.flush(timeout=timeout) if writer else True
@@ -0,0 +1,190 @@
+# app/live_export.py
+"""
+Near-real-time export of freshly ingested punches.
+
+With EXPORT_LIVE_ENABLED, every commit that inserted attendance rows notifies the
+live exporter: the ingest writer's commits, inline writes (INGEST_WRITE_BEHIND off)
+and dead-letter retries (`ingest.notify_live_export`). Notifications are coalesced across devices and
+debounced: the exporter waits until commits have been quiet for
+EXPORT_LIVE_DEBOUNCE_SECONDS, but never longer than EXPORT_LIVE_MAX_DELAY_SECONDS
+after the first one, then exports what lies past the export cursor (the rows just
+committed, once the backlog is caught up) in one or a few micro-batches.
+
+It goes through the same cursor, exported flags, duplicate check and export lock
+as the export job, so it stays idempotent with the regular sweep: whichever runs
+first exports a row, the other moves past it. When the export job holds the lock
+the trigger is kept and tried again on the next round; so it is when the export
+fails (counted in `errors`, the rows stay past the cursor). A backlog larger than
+EXPORT_LIVE_MAX_ROWS is left to the sweep; due retries are always left to it.
+"""
+import time
+import threading
+import traceback
+from datetime import datetime
+
+from colorama import Fore
+
+from .extensions import db
+
+
+class LiveExporter:
+    """Single thread turning ingest commits into debounced, coalesced micro-batch exports."""
+
+    def __init__(self, app, debounce=2.0, max_delay=10.0, batch_size=1000, max_rows=5000, lookback_days=None):
+        self.app = app
+        self.debounce = float(debounce)
+        self.max_delay = float(max_delay)
+        self.batch_size = int(batch_size)
+        self.max_rows = int(max_rows)
+        self.lookback_days = lookback_days
+
+        self._cond = threading.Condition()
+        self._pending = {}          # device_id -> rows committed since the last export
+        self._first_at = None       # monotonic time of the first pending commit
+        self._last_at = None        # ... and of the latest one
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"triggers": 0, "exports": 0, "rows_exported": 0, "lock_busy": 0, "errors": 0,
+                       "left_to_sweep": 0, "last_latency_seconds": None, "last_error": None, "last_export_at": None}
+
+    # ---- lifecycle ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="live-export", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    # ---- producer side ----
+    def notify(self, batches):
+        """Commit hook: `batches` were just committed (see module docstring)."""
+        counts = {b.device_id: b.inserted for b in batches if b.inserted}
+        if not counts:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for device_id, n in counts.items():
+                self._pending[device_id] = self._pending.get(device_id, 0) + n
+            if self._first_at is None:
+                self._first_at = now
+            self._last_at = now
+            self._stats["triggers"] += 1
+            self._cond.notify_all()
+
+    # ---- exporter side ----
+    def _due_in(self):
+        """Seconds until the pending trigger is due (None = nothing pending)."""
+        if self._first_at is None:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(self._last_at + self.debounce, self._first_at + self.max_delay) - now)
+
+    def _export(self):
+        from .scheduler import _EXPORT_LOCK
+        from .exporter import fetch_export_batch, write_export_batch
+
+        if not _EXPORT_LOCK.acquire(blocking=False):
+            return None
+        try:
+            with self.app.app_context():
+                try:
+                    exported = rows = 0
+                    while rows < self.max_rows:
+                        batch = fetch_export_batch(min(self.batch_size, self.max_rows - rows), self.lookback_days,
+                                                   retries=False)
+                        if not batch:
+                            return exported, False
+                        exported += write_export_batch(batch)["exported"]
+                        rows += len(batch)
+                    return exported, True
+                finally:
+                    db.session.remove()
+        finally:
+            _EXPORT_LOCK.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                wait = self._due_in()
+                if wait is None or wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                pending, first_at = self._pending, self._first_at
+                self._pending, self._first_at, self._last_at = {}, None, None
+            try:
+                res = self._export()
+                if res is None:
+                    self._stats["lock_busy"] += 1
+            except Exception as e:
+                res = None
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(getattr(e, "orig", None) or e)
+                print(Fore.RED + f"[LIVE EXPORT ERROR] {e}\n{traceback.format_exc()}")
+            if res is None:
+                # export job running (or export failed): keep the trigger and try again after another debounce
+                self._requeue(pending, first_at)
+                self._stop.wait(self.debounce)
+                continue
+            exported, more = res
+            self._stats["exports"] += 1
+            self._stats["rows_exported"] += exported
+            self._stats["last_latency_seconds"] = round(time.monotonic() - first_at, 3)
+            self._stats["last_export_at"] = datetime.utcnow().isoformat()
+            if more:
+                self._stats["left_to_sweep"] += 1
+                print(Fore.YELLOW + f"[LIVE EXPORT] backlog over {self.max_rows} rows, leaving the rest to the export job")
+            if exported:
+                print(Fore.CYAN + f"[LIVE EXPORT] exported {exported} row(s) from {len(pending)} device(s)")
+
+    def _requeue(self, pending, first_at):
+        with self._cond:
+            for device_id, n in pending.items():
+                self._pending[device_id] = self._pending.get(device_id, 0) + n
+            self._first_at = min(first_at, self._first_at) if self._first_at is not None else first_at
+            self._last_at = self._last_at or time.monotonic()
+
+    def stats(self):
+        with self._cond:
+            out = dict(self._stats)
+            out["pending_devices"] = len(self._pending)
+            out["pending_rows"] = sum(self._pending.values())
+        out["running"] = bool(self._thread and self._thread.is_alive())
+        return out
+
+
+_LIVE = None
+_LIVE_LOCK = threading.Lock()
+
+
+def get_live_exporter(app=None):
+    """Return the process-wide LiveExporter, creating and starting it on first use."""
+    global _LIVE
+    with _LIVE_LOCK:
+        if _LIVE is None:
+            if app is None:
+                from flask import current_app
+                app = current_app._get_current_object()
+            cfg = app.config
+            _LIVE = LiveExporter(
+                app,
+                debounce=cfg.get("EXPORT_LIVE_DEBOUNCE_SECONDS", 2.0),
+                max_delay=cfg.get("EXPORT_LIVE_MAX_DELAY_SECONDS", 10.0),
+                batch_size=cfg.get("EXPORT_BATCH_SIZE", 1500),
+                max_rows=cfg.get("EXPORT_LIVE_MAX_ROWS", 5000),
+                lookback_days=cfg.get("EXPORT_LOOKBACK_DAYS"),
+            )
+        _LIVE.start()
+        return _LIVE
+
+
+def live_export_stats():
+    with _LIVE_LOCK:
+        exporter = _LIVE
+    return exporter.stats() if exporter else None
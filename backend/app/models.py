@@ -2,6 +2,30 @@
 from .extensions import db
 from datetime import datetime
 
+# BIGINT primary keys only autoincrement on SQLite when declared as INTEGER
+BigIntPK = db.BigInteger().with_variant(db.Integer, "sqlite")
+SmallIntPK = db.SmallInteger().with_variant(db.Integer, "sqlite")
+
+
+class StatusCode(db.TypeDecorator):
+    """
+    Punch status stored as SMALLINT and read back as the string the API has always
+    returned ("0", "1", ...). Non-numeric values are rejected at bind time.
+    Compare against it with cast(col, String) for substring searches.
+    """
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(value)
+
 class Branch(db.Model):
     __tablename__ = 'branches'
     id          = db.Column(db.Integer, primary_key=True)
@@ -19,11 +43,13 @@ class Branch(db.Model):
 class Device(db.Model):
     __tablename__ = 'devices'
     id          = db.Column(db.Integer, primary_key=True)
-    branch_id   = db.Column(db.Integer, db.ForeignKey('branches.id'), nullable=False)
+    branch_id   = db.Column(db.Integer, db.ForeignKey('branches.id'), nullable=False, index=True)
     name        = db.Column(db.String(128), nullable=False)  # e.g. "K40-1"
     ip_address  = db.Column(db.String(45), nullable=False)
     port        = db.Column(db.Integer, default=4370)
     serial_no   = db.Column(db.String(128), nullable=True, index=True)
+    # serial natural keys are built from: stored on first contact, never changed (see ingest.claim_key_serial)
+    key_serial  = db.Column(db.String(128), nullable=True)
     last_seen   = db.Column(db.DateTime, nullable=True)
     created_at  = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -102,10 +128,16 @@ class AttendanceLog(db.Model):
     # normalized FK to central Badge if resolved (nullable)
     badge_id = db.Column(db.Integer, db.ForeignKey('badges.id'), nullable=True, index=True)
 
+    # USERID for access_checkinout, resolved at ingest (see projection.py)
+    access_userid = db.Column(db.String(64), nullable=True)
+
     timestamp = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(32), nullable=False)
+    status = db.Column(StatusCode, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # sha1(serial|device USERID|timestamp|status): dedupe key that survives device record-id resets
+    natural_key = db.Column(db.String(40), nullable=True)
+
     # ✅ New export tracking fields
     exported = db.Column(db.Boolean, default=False, nullable=False)
     exported_at = db.Column(db.DateTime, nullable=True)
@@ -115,7 +147,18 @@ class AttendanceLog(db.Model):
     badge = db.relationship('Badge')
 
     __table_args__ = (
-        db.UniqueConstraint('device_id', 'record_id', name='_device_record_uc'),
+        # record_id is the device's internal uid and restarts when a device is cleared/replaced,
+        # so it is only indexed; uniqueness is enforced on natural_key
+        db.Index('ix_attendance_logs_device_record', 'device_id', 'record_id'),
+        # hot query shapes checked by explain_queries.py:
+        # listings/stats/retention by time range, per-device listings newest first,
+        # and the exporter's `exported = 0 ORDER BY id` scan
+        db.Index('ix_attendance_logs_timestamp', 'timestamp'),
+        db.Index('ix_attendance_logs_device_timestamp', 'device_id', 'timestamp'),
+        db.Index('ix_attendance_logs_exported_id', 'exported', 'id'),
+        # natural_key already hashes the timestamp; the column is included because MySQL
+        # requires every unique key of the monthly-partitioned table to contain it
+        db.Index('uix_attendance_logs_natural_key', 'natural_key', 'timestamp', unique=True),
     )
 
     def __repr__(self):
@@ -133,12 +176,12 @@ class AccessUserInfo(db.Model):
     Keep Badgenumber canonical and include sn (device serial).
     """
     __tablename__ = 'access_userinfo'
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
     USERID = db.Column(db.String(64), nullable=False)   # device-local user id (string)
     Badgenumber = db.Column(db.String(128), nullable=False)  # canonical badge string
     Name = db.Column(db.String(255), nullable=True)
     SSN = db.Column(db.String(64), nullable=True)
-    sn = db.Column(db.String(128), nullable=True, index=True)  # device serial - important
+    sn = db.Column(db.String(128), nullable=True)  # device serial - important (indexed below)
     source = db.Column(db.String(64), default='access')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -156,22 +199,236 @@ class AccessUserInfo(db.Model):
 class CheckinOut(db.Model):
     """
     Replica of Access CHECKINOUT table (replicated into Flask DB).
+    The device serial and the constant VERIFYCODE/SENSORID/Memoinfo/WorkCode text are
+    stored once in device_serials / access_checkinout_texts and referenced by small ids;
+    the properties below read them back under the original column names.
     """
     __tablename__ = 'access_checkinout'
-    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
     USERID = db.Column(db.String(64), nullable=False, index=True)
     CHECKTIME = db.Column(db.DateTime, nullable=False, index=True)
     CHECKTYPE = db.Column(db.String(16), nullable=True)
+    text_id = db.Column(db.SmallInteger, nullable=True)
+    sn_id = db.Column(db.SmallInteger, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # no foreign keys: the table is partitioned on MySQL
+    serial = db.relationship('DeviceSerial', primaryjoin='foreign(CheckinOut.sn_id) == DeviceSerial.id',
+                             lazy='joined', viewonly=True)
+    text = db.relationship('CheckinOutText', primaryjoin='foreign(CheckinOut.text_id) == CheckinOutText.id',
+                           lazy='joined', viewonly=True)
+
+    __table_args__ = (
+        db.Index('ix_access_checkinout_user_time_sn', 'USERID', 'CHECKTIME', 'sn_id'),
+    )
+
+    @property
+    def sn(self):
+        return self.serial.sn if self.serial else None
+
+    @property
+    def VERIFYCODE(self):
+        return self.text.VERIFYCODE if self.text else None
+
+    @property
+    def SENSORID(self):
+        return self.text.SENSORID if self.text else None
+
+    @property
+    def Memoinfo(self):
+        return self.text.Memoinfo if self.text else None
+
+    @property
+    def WorkCode(self):
+        return self.text.WorkCode if self.text else None
+
+    def __repr__(self):
+        return f"<CheckinOut {self.USERID}@{self.CHECKTIME} sn={self.sn}>"
+
+
+class DeviceSerial(db.Model):
+    """Dictionary of device serials referenced by access_checkinout.sn_id."""
+    __tablename__ = 'device_serials'
+    id = db.Column(SmallIntPK, primary_key=True, autoincrement=True)
+    sn = db.Column(db.String(128), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<DeviceSerial {self.id}={self.sn}>"
+
+
+class CheckinOutText(db.Model):
+    """Distinct (VERIFYCODE, SENSORID, Memoinfo, WorkCode) tuples referenced by access_checkinout.text_id."""
+    __tablename__ = 'access_checkinout_texts'
+    id = db.Column(SmallIntPK, primary_key=True, autoincrement=True)
     VERIFYCODE = db.Column(db.String(16), nullable=True)
     SENSORID = db.Column(db.String(32), nullable=True)
     Memoinfo = db.Column(db.String(255), nullable=True)
     WorkCode = db.Column(db.String(64), nullable=True)
-    sn = db.Column(db.String(128), nullable=True, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('VERIFYCODE', 'SENSORID', 'Memoinfo', 'WorkCode', name='uix_access_checkinout_texts'),
+    )
+
+    def __repr__(self):
+        return f"<CheckinOutText {self.id} {self.VERIFYCODE}/{self.SENSORID}/{self.Memoinfo}/{self.WorkCode}>"
+
+
+# ---------------- Background job cursors ----------------
+class SyncCursor(db.Model):
+    """
+    Named high-water mark for background jobs that consume attendance_logs in id order
+    (e.g. the access_checkinout projection). `position` is the last id processed.
+    """
+    __tablename__ = 'sync_cursors'
+    name = db.Column(db.String(64), primary_key=True)
+    position = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SyncCursor {self.name}={self.position}>"
+
+
+# ---------------- Export retries ----------------
+class ExportRetry(db.Model):
+    """
+    attendance_logs rows the exporter could not write to the end DB. The exporter walks
+    attendance_logs by id behind its sync cursor ('enddb_export'); a row that fails is
+    parked here and retried with backoff until EXPORT_MAX_ATTEMPTS, then left as 'dead'.
+    Rows that cannot be exported at all (no badge, older than the lookback) go straight
+    to 'dead'. Requeue via POST /api/sync/export-retries/requeue.
+    """
+    __tablename__ = 'export_retries'
+    log_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # attendance_logs.id (partitioned: no FK)
+    state = db.Column(db.String(8), nullable=False, default='retry')  # 'retry' | 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     __table_args__ = (
-        db.Index('ix_access_checkinout_user_time_sn', 'USERID', 'CHECKTIME', 'sn'),
+        db.Index('ix_export_retries_state_next', 'state', 'next_attempt_at'),
     )
 
     def __repr__(self):
-        return f"<CheckinOut {self.USERID}@{self.CHECKTIME} sn={self.sn}>"
+        return f"<ExportRetry {self.log_id} {self.state} x{self.attempts}>"
+
+
+# ---------------- Unmapped badges ----------------
+class UnmappedBadge(db.Model):
+    """
+    Device USERIDs that punched but resolved to neither a Badge nor an access_userinfo row.
+    One row per (sn, badge); maintained by the audit writer (see audit.py).
+    """
+    __tablename__ = 'unmapped_badges'
+    id = db.Column(db.Integer, primary_key=True)
+    badge = db.Column(db.String(64), nullable=False)
+    sn = db.Column(db.String(128), nullable=False)
+    device_id = db.Column(db.Integer, nullable=True)  # last device that reported it (informational)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False, index=True)
+    seen_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('sn', 'badge', name='uix_unmapped_badges_sn_badge'),
+        db.Index('ix_unmapped_badges_badge', 'badge'),
+    )
+
+    def __repr__(self):
+        return f"<UnmappedBadge {self.badge} sn={self.sn} x{self.seen_count}>"
+
+
+# ---------------- Ingest dead letters ----------------
+class IngestDeadLetter(db.Model):
+    """
+    Rows the ingest writer could not insert (e.g. oversize value, FK violation).
+    Isolated by bisecting the failing chunk, so the rest of the device batch commits.
+    `payload` is the row as JSON; retry via POST /api/sync/dead-letters/retry ({"ids": [...]}, empty for all).
+    """
+    __tablename__ = 'ingest_dead_letters'
+    id = db.Column(db.Integer, primary_key=True)
+    target_table = db.Column(db.String(64), nullable=False, default='attendance_logs')
+    device_id = db.Column(db.Integer, nullable=True, index=True)
+    sn = db.Column(db.String(128), nullable=True)
+    natural_key = db.Column(db.String(40), nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    error = db.Column(db.String(1000), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<IngestDeadLetter {self.id} {self.target_table} device={self.device_id}>"
+
+
+# ---------------- Daily rollups ----------------
+class BadgeDailyRollup(db.Model):
+    """
+    One row per badge (attendance_logs.user_id) per day: first/last punch, punch count
+    and distinct devices. Recomputed for the affected days/badges on every ingest commit
+    (app/rollups.py); feeds /api/logs/stats and /api/logs/daily.
+    """
+    __tablename__ = 'rollup_badge_daily'
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False)
+    badge = db.Column(db.String(64), nullable=True)
+    badge_id = db.Column(db.Integer, nullable=True)
+    first_punch = db.Column(db.DateTime, nullable=False)
+    last_punch = db.Column(db.DateTime, nullable=False)
+    punches = db.Column(db.Integer, nullable=False, default=0)
+    devices = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # refreshed rows are upserted on this key (a NULL badge is not covered by it)
+        db.UniqueConstraint('day', 'badge', name='uix_rollup_badge_daily_day_badge'),
+        db.Index('ix_rollup_badge_daily_badge_day', 'badge', 'day'),
+    )
+
+    def __repr__(self):
+        return f"<BadgeDailyRollup {self.badge}@{self.day} x{self.punches}>"
+
+
+class DeviceDailyRollup(db.Model):
+    """Punch count per device per day, maintained alongside BadgeDailyRollup."""
+    __tablename__ = 'rollup_device_daily'
+    id = db.Column(BigIntPK, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False)
+    device_id = db.Column(db.Integer, nullable=False)
+    punches = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'device_id', name='uix_rollup_device_daily_day_device'),
+        db.Index('ix_rollup_device_daily_device_day', 'device_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f"<DeviceDailyRollup device={self.device_id}@{self.day} x{self.punches}>"
+
+
+# ---------------- Log counters ----------------
+class DeviceLogCounter(db.Model):
+    """
+    Number of attendance logs per device (hot rows plus the cold archive), kept in step
+    by the ingest, delete and retention paths (app/counters.py); drift is fixed by
+    reconcile_counters.py.
+    """
+    __tablename__ = 'device_log_counters'
+    device_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    log_count = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<DeviceLogCounter device={self.device_id} x{self.log_count}>"
+
+
+class BranchLogCounter(db.Model):
+    """Sum of DeviceLogCounter over a branch's devices; feeds GET /api/devices/."""
+    __tablename__ = 'branch_log_counters'
+    branch_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    log_count = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BranchLogCounter branch={self.branch_id} x{self.log_count}>"
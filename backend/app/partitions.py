@@ -0,0 +1,249 @@
+# app/partitions.py
+"""
+Monthly range partitions for the two time-series tables.
+
+On MySQL, attendance_logs and access_checkinout are PARTITION BY RANGE
+(TO_DAYS(<time column>)) with one partition per calendar month (pYYYYMM) and a
+catch-all `pmax`. The maintenance job:
+
+  * splits pmax so there are always PARTITION_MONTHS_AHEAD empty months ahead;
+  * drops whole partitions older than the table's retention (PARTITION_RETENTION_MONTHS),
+    which is a metadata operation instead of a multi-million row DELETE.
+
+SQLite has no partitioning. There the same retention policy is applied as
+month-bounded chunked DELETEs on the time column (which is indexed), so the
+tables keep one layout and the ORM mapping does not change per dialect.
+
+Queries only benefit when they constrain the partition column directly with
+half-open ranges (col >= start AND col < end); see `month_bounds()`.
+"""
+import time
+from datetime import date, datetime
+
+from colorama import Fore
+from sqlalchemy import text, select, delete
+
+from .extensions import db
+from .models import AttendanceLog, CheckinOut
+from .counters import apply_log_deltas, subtract_deleted
+
+# table -> partition column
+PARTITIONED_TABLES = {
+    "attendance_logs": "timestamp",
+    "access_checkinout": "CHECKTIME",
+}
+MAXVALUE_PARTITION = "pmax"
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, n):
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def month_bounds(d):
+    """[start, end) datetimes of the month containing d."""
+    start = month_start(d)
+    return datetime.combine(start, datetime.min.time()), datetime.combine(add_months(start, 1), datetime.min.time())
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def _partition_def(month):
+    upper = add_months(month, 1)
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))"
+
+
+def partition_clause(column, first_month, last_month):
+    """`PARTITION BY RANGE` clause covering first_month..last_month plus pmax."""
+    parts = []
+    m = month_start(first_month)
+    while m <= last_month:
+        parts.append(_partition_def(m))
+        m = add_months(m, 1)
+    parts.append(f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE")
+    return f"PARTITION BY RANGE (TO_DAYS(`{column}`)) (\n  " + ",\n  ".join(parts) + "\n)"
+
+
+def list_partitions(conn, table):
+    """[(name, rows)] in partition order; empty when the table is not partitioned (or not MySQL)."""
+    if conn.dialect.name != "mysql":
+        return []
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, TABLE_ROWS FROM INFORMATION_SCHEMA.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"t": table}).all()
+    return [(r[0], int(r[1] or 0)) for r in rows]
+
+
+def _month_of(name):
+    try:
+        return datetime.strptime(name[1:], "%Y%m").date()
+    except ValueError:
+        return None
+
+
+def ensure_future_partitions(conn, table, months_ahead=3, today=None):
+    """
+    Split pmax so every month up to today + months_ahead has its own partition.
+    Returns the names of the partitions created.
+    """
+    parts = list_partitions(conn, table)
+    if not parts:
+        return []
+    months = [m for m in (_month_of(n) for n, _ in parts) if m]
+    target = add_months(month_start(today or date.today()), int(months_ahead))
+    m = add_months(max(months), 1) if months else month_start(today or date.today())
+    new = []
+    while m <= target:
+        new.append(m)
+        m = add_months(m, 1)
+    if not new:
+        return []
+    defs = ",\n  ".join([_partition_def(x) for x in new] + [f"PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN MAXVALUE"])
+    conn.execute(text(f"ALTER TABLE `{table}` REORGANIZE PARTITION {MAXVALUE_PARTITION} INTO (\n  {defs}\n)"))
+    return [partition_name(x) for x in new]
+
+
+def _has_unexported(conn, table, partition):
+    if table != "attendance_logs":
+        return False
+    return conn.execute(text(
+        f"SELECT 1 FROM `{table}` PARTITION ({partition}) WHERE exported = 0 LIMIT 1"
+    )).first() is not None
+
+
+def drop_expired_partitions(conn, table, keep_months, today=None):
+    """
+    MySQL: drop month partitions that end on or before the retention cutoff.
+    attendance_logs partitions that still hold unexported rows are kept; the log
+    counters are reduced by what the dropped partitions held.
+    Returns {"dropped": [...], "kept_unexported": [...]}.
+    """
+    cutoff = add_months(month_start(today or date.today()), -int(keep_months))
+    dropped, kept = [], []
+    for name, _rows in list_partitions(conn, table):
+        m = _month_of(name)
+        if m is None or add_months(m, 1) > cutoff:
+            continue
+        if _has_unexported(conn, table, name):
+            kept.append(name)
+            continue
+        dropped.append(name)
+    if dropped:
+        gone = {}
+        if table == "attendance_logs":
+            # DROP PARTITION commits implicitly, so count first and apply after
+            for name in dropped:
+                for device_id, n in conn.execute(text(
+                    f"SELECT device_id, COUNT(*) FROM `{table}` PARTITION ({name}) GROUP BY device_id"
+                )).all():
+                    gone[device_id] = gone.get(device_id, 0) - int(n)
+        conn.execute(text(f"ALTER TABLE `{table}` DROP PARTITION {', '.join(dropped)}"))
+        apply_log_deltas(conn, gone)
+    return {"dropped": dropped, "kept_unexported": kept}
+
+
+def _model_for(table):
+    return {"attendance_logs": AttendanceLog, "access_checkinout": CheckinOut}[table]
+
+
+def delete_expired_rows(table, keep_months, chunk_size=5000, sleep_seconds=0.0, today=None):
+    """
+    Retention for databases without partitioning: delete rows older than the cutoff
+    one month at a time in id chunks (oldest month first). attendance_logs rows that
+    have not been exported are kept. Must run inside an app context.
+    """
+    model = _model_for(table)
+    col = getattr(model, PARTITIONED_TABLES[table])
+    cutoff = datetime.combine(add_months(month_start(today or date.today()), -int(keep_months)), datetime.min.time())
+    with db.engine.connect() as conn:
+        oldest = conn.execute(select(db.func.min(col)).where(col < cutoff)).scalar()
+    deleted = 0
+    if oldest is None:
+        return {"deleted": 0, "cutoff": cutoff.isoformat()}
+    lo = month_bounds(oldest)[0]
+    while lo < cutoff:
+        hi = min(month_bounds(lo)[1], cutoff)
+        while True:
+            cond = [col >= lo, col < hi]
+            if model is AttendanceLog:
+                cond.append(AttendanceLog.exported.is_(True))
+            with db.engine.begin() as conn:
+                ids = conn.execute(select(model.id).where(*cond).limit(int(chunk_size))).scalars().all()
+                if not ids:
+                    break
+                if model is AttendanceLog:
+                    subtract_deleted(conn, AttendanceLog.__table__.c.id.in_(ids))
+                res = conn.execute(delete(model.__table__).where(model.__table__.c.id.in_(ids)))
+            deleted += res.rowcount or 0
+            if sleep_seconds:
+                time.sleep(sleep_seconds)
+        lo = hi
+    return {"deleted": deleted, "cutoff": cutoff.isoformat()}
+
+
+def maintain_partitions(months_ahead=3, retention=None, chunk_size=5000, today=None):
+    """
+    One maintenance pass over PARTITIONED_TABLES. `retention` maps table -> months to
+    keep (None/0 = keep everything). Must run inside an app context.
+    """
+    retention = retention or {}
+    out = {}
+    for table in PARTITIONED_TABLES:
+        res = {}
+        keep = retention.get(table)
+        if db.engine.dialect.name == "mysql":
+            with db.engine.begin() as conn:
+                if not list_partitions(conn, table):
+                    res["partitioned"] = False
+                else:
+                    res["partitioned"] = True
+                    res["created"] = ensure_future_partitions(conn, table, months_ahead, today=today)
+                    if keep:
+                        res.update(drop_expired_partitions(conn, table, keep, today=today))
+            if keep and not res["partitioned"]:
+                res.update(delete_expired_rows(table, keep, chunk_size=chunk_size, today=today))
+        elif keep:
+            res.update(delete_expired_rows(table, keep, chunk_size=chunk_size, today=today))
+        out[table] = res
+    return out
+
+
+def retention_cutoff(app, table, today=None):
+    """Oldest timestamp still kept for `table`, or None when retention is off."""
+    keep = (app.config.get("PARTITION_RETENTION_MONTHS") or {}).get(table)
+    if not keep:
+        return None
+    return datetime.combine(add_months(month_start(today or date.today()), -int(keep)), datetime.min.time())
+
+
+def run_partition_maintenance(app):
+    """Scheduler entry point."""
+    with app.app_context():
+        t0 = time.time()
+        try:
+            res = maintain_partitions(
+                months_ahead=app.config.get("PARTITION_MONTHS_AHEAD", 3),
+                retention=app.config.get("PARTITION_RETENTION_MONTHS"),
+                chunk_size=app.config.get("PARTITION_RETENTION_CHUNK", 5000),
+            )
+            for table, r in res.items():
+                if r.get("created") or r.get("dropped") or r.get("deleted"):
+                    print(Fore.CYAN + f"[PARTITIONS] {table}: created={r.get('created', [])} "
+                                      f"dropped={r.get('dropped', [])} deleted={r.get('deleted', 0)}")
+                if r.get("kept_unexported"):
+                    print(Fore.YELLOW + f"[PARTITIONS] {table}: kept {r['kept_unexported']} (unexported rows)")
+            print(Fore.CYAN + f"[PARTITIONS] maintenance done in {time.time() - t0:.2f}s")
+            return res
+        except Exception as e:
+            print(Fore.RED + f"[PARTITIONS ERROR] {e}")
+            return {"error": str(e)}
+        finally:
+            db.session.remove()
@@ -0,0 +1,164 @@
+# app/projection.py
+"""
+access_checkinout as a projection of attendance_logs.
+
+Ingest only writes AttendanceLog. This job copies rows past a watermark into the
+CHECKINOUT replica with one set-based INSERT ... SELECT per batch, advancing the
+watermark in the same transaction so every log row is projected exactly once.
+The serial and the constant text columns are written as dictionary ids
+(app/dictionaries.py), resolved once per run before the batch transactions.
+USERID is the one ingest resolved and stored on the row (access_userid), the
+same value the insert audit CSV carries.
+
+Ids are not committed in id order (several poll workers, dead-letter retries), so
+a row can become visible after the watermark has passed it. Like the exporter,
+each run first rescans CHECKINOUT_PROJECTION_GAP_RESCAN_IDS ids below the
+watermark and projects the rows that have no replica row yet.
+"""
+import time
+from datetime import datetime
+
+from colorama import Fore
+from flask import current_app
+from sqlalchemy import select, func, literal, and_
+
+from .extensions import db
+from .models import AttendanceLog, CheckinOut, Device, Badge, AccessUserInfo, SyncCursor, DeviceSerial
+from .dictionaries import serial_ids, checkinout_text_id
+from .ingest import key_serial_expr
+
+CHECKINOUT_CURSOR = "checkinout_projection"
+# VERIFYCODE / SENSORID / Memoinfo / WorkCode written on every projected row
+PROJECTED_TEXT = {"VERIFYCODE": "1", "SENSORID": "1", "Memoinfo": "FLASK", "WorkCode": "FLASK"}
+
+
+def _initial_position(conn):
+    """
+    Where to start when no cursor exists yet: rows created before the newest replica row
+    were already written to access_checkinout by the old inline path.
+    """
+    last_co = conn.execute(select(func.max(CheckinOut.created_at))).scalar()
+    if last_co is None:
+        return 0
+    return conn.execute(
+        select(func.max(AttendanceLog.id)).where(AttendanceLog.created_at <= last_co)
+    ).scalar() or 0
+
+
+def _get_position(conn, name):
+    tbl = SyncCursor.__table__
+    pos = conn.execute(select(tbl.c.position).where(tbl.c.name == name)).scalar()
+    if pos is None:
+        pos = _initial_position(conn)
+        conn.execute(tbl.insert().values(name=name, position=pos, updated_at=datetime.utcnow()))
+    return int(pos)
+
+
+def _set_position(conn, name, position):
+    tbl = SyncCursor.__table__
+    conn.execute(tbl.update().where(tbl.c.name == name).values(position=position, updated_at=datetime.utcnow()))
+
+
+def _projection_select(lo, hi, now, text_id, missing=False):
+    """
+    attendance_logs (lo, hi] shaped as access_checkinout rows; with `missing`, only the
+    rows without a replica row for the same (USERID, CHECKTIME, serial) yet.
+    """
+    al = AttendanceLog.__table__
+    dev = Device.__table__
+    b = Badge.__table__
+    ai = AccessUserInfo.__table__
+    ds = DeviceSerial.__table__
+    co = CheckinOut.__table__
+    # the serial natural keys are built from, so it does not change with serial_no
+    sn = key_serial_expr(dev)
+    # rows written before access_userid existed resolve it as the hot path did: via the
+    # canonical badge, else the device USERID
+    userid = func.coalesce(al.c.access_userid, ai.c.USERID, al.c.device_userid, al.c.user_id, literal(""))
+    query = (
+        select(
+            userid,
+            al.c.timestamp,
+            al.c.status,
+            literal(text_id),
+            ds.c.id,
+            literal(now),
+        )
+        .select_from(
+            al.join(dev, dev.c.id == al.c.device_id)
+              .outerjoin(b, b.c.id == al.c.badge_id)
+              # Badgenumber is unique, so this never fans out
+              .outerjoin(ai, and_(al.c.access_userid.is_(None),
+                                  ai.c.Badgenumber == func.coalesce(b.c.badge_number, al.c.device_userid),
+                                  ai.c.sn == sn))
+              .outerjoin(ds, ds.c.sn == sn)
+        )
+        .where(al.c.id > lo, al.c.id <= hi)
+    )
+    if missing:
+        query = query.where(~select(co.c.id).where(
+            co.c.USERID == userid, co.c.CHECKTIME == al.c.timestamp,
+            func.coalesce(co.c.sn_id, 0) == func.coalesce(ds.c.id, 0)).exists())
+    return query
+
+
+def _resolve_dictionaries():
+    """Make sure every device serial has a dictionary id; return the projected text id."""
+    dev = Device.__table__
+    with db.engine.connect() as conn:
+        serials = conn.execute(select(key_serial_expr(dev)).distinct()).scalars().all()
+    serial_ids(serials)
+    return checkinout_text_id(**PROJECTED_TEXT)
+
+
+def project_checkinout(batch_size=5000, max_batches=None):
+    """
+    Copy new attendance_logs rows into access_checkinout until caught up, after the
+    rows committed below the watermark since it passed them (see module docstring).
+    Must run inside an app context. Returns {"projected": n, "batches": b, "position": id}.
+    """
+    co = CheckinOut.__table__
+    cols = [co.c.USERID, co.c.CHECKTIME, co.c.CHECKTYPE, co.c.text_id, co.c.sn_id, co.c.created_at]
+    text_id = _resolve_dictionaries()
+    window = int(current_app.config.get("CHECKINOUT_PROJECTION_GAP_RESCAN_IDS", 50000))
+    projected = 0
+    batches = 0
+    position = None
+    if window:
+        with db.engine.begin() as conn:
+            position = _get_position(conn, CHECKINOUT_CURSOR)
+            res = conn.execute(co.insert().from_select(
+                cols, _projection_select(max(position - window, 0), position, datetime.utcnow(), text_id, missing=True)))
+        projected += res.rowcount or 0
+    while max_batches is None or batches < max_batches:
+        with db.engine.begin() as conn:
+            position = _get_position(conn, CHECKINOUT_CURSOR)
+            hi = conn.execute(
+                select(func.max(AttendanceLog.id)).where(AttendanceLog.id > position)
+            ).scalar()
+            if not hi:
+                break
+            hi = min(int(hi), position + int(batch_size))
+            res = conn.execute(co.insert().from_select(cols, _projection_select(position, hi, datetime.utcnow(), text_id)))
+            _set_position(conn, CHECKINOUT_CURSOR, hi)
+        projected += res.rowcount or 0
+        batches += 1
+        position = hi
+    return {"projected": projected, "batches": batches, "position": position}
+
+
+def run_checkinout_projection(app):
+    """Scheduler entry point."""
+    with app.app_context():
+        t0 = time.time()
+        try:
+            res = project_checkinout(batch_size=app.config.get("CHECKINOUT_PROJECTION_BATCH", 5000))
+            if res["projected"]:
+                print(Fore.CYAN + f"[PROJECTION] access_checkinout +{res['projected']} rows in {res['batches']} batch(es) "
+                                  f"({time.time() - t0:.2f}s, position={res['position']})")
+            return res
+        except Exception as e:
+            print(Fore.RED + f"[PROJECTION ERROR] access_checkinout: {e}")
+            return {"error": str(e)}
+        finally:
+            db.session.remove()
@@ -0,0 +1,283 @@
+# app/query_plans.py
+"""
+EXPLAIN harness for the hot SQL paths.
+
+Every entry in `_hot_queries()` builds one query shape the app runs (the log listing
+filters from views/logs.py through the real `_build_query`, the exporter's
+cursor read, the poller's access_userinfo lookups from tasks.py, ...).
+`check_plans()` runs EXPLAIN for each on the current database and reports a
+failure when the plan reads a whole table (or walks a whole index without that
+feeding an ORDER BY ... LIMIT) that holds more than `max_scan_rows` rows. A shape that cannot avoid a scan (substring search with a leading
+wildcard) is marked `scan_ok` with the reason, and reported but not failed.
+
+Run it with explain_queries.py, which seeds a scratch SQLite database first.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from .extensions import db
+from .models import (AttendanceLog, AccessUserInfo, Badge, BadgeDailyRollup,
+                     DeviceDailyRollup, CheckinOut, ExportRetry)
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN <statement>, with the statement's bind parameters passed through."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+# scan_ok: why a full scan is accepted for this shape (None = it must use an index)
+HotQuery = namedtuple("HotQuery", "name source build scan_ok", defaults=(None,))
+
+
+# -------------------------
+# Query shapes
+# -------------------------
+def _logs_query(**args):
+    """The ORM query views/logs.py builds for ?<args> (ordered, first page)."""
+    from flask import current_app
+    from .views.logs import _extract_common_params, _build_query
+    with current_app.test_request_context("/api/logs/", query_string=args):
+        params = _extract_common_params()
+        query = _build_query(params)[0]
+        return query.limit(params["per_page"]).statement
+
+
+def _recent_window():
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return (end - timedelta(days=7)).date().isoformat(), end.date().isoformat()
+
+
+def _exporter_next_rows():
+    return select(AttendanceLog.__table__).where(AttendanceLog.id > 1000).order_by(AttendanceLog.id).limit(1500)
+
+
+def _exporter_partition_rows():
+    return (select(AttendanceLog.__table__).where(AttendanceLog.id > 1000, AttendanceLog.device_id % 4 == 1)
+            .order_by(AttendanceLog.id).limit(1500))
+
+
+def _exporter_due_retries():
+    return (select(ExportRetry.log_id)
+            .where(ExportRetry.state == "retry", ExportRetry.next_attempt_at <= datetime.utcnow())
+            .order_by(ExportRetry.next_attempt_at, ExportRetry.log_id).limit(1500))
+
+
+def _stats_by_date():
+    frm, to = _recent_window()
+    day = func.date(AttendanceLog.timestamp)
+    return (select(day, func.count()).where(AttendanceLog.timestamp >= frm, AttendanceLog.timestamp < to)
+            .group_by(day))
+
+
+def _stats_top_devices():
+    frm, to = _recent_window()
+    return (select(AttendanceLog.device_id, func.count())
+            .where(AttendanceLog.timestamp >= frm, AttendanceLog.timestamp < to)
+            .group_by(AttendanceLog.device_id))
+
+
+def _daily_for_badge():
+    frm, to = _recent_window()
+    return (select(BadgeDailyRollup.__table__)
+            .where(BadgeDailyRollup.badge == "105", BadgeDailyRollup.day >= frm, BadgeDailyRollup.day <= to)
+            .order_by(BadgeDailyRollup.day))
+
+
+def _rollup_devices():
+    frm, to = _recent_window()
+    return (select(DeviceDailyRollup.device_id, func.sum(DeviceDailyRollup.punches))
+            .where(DeviceDailyRollup.day >= frm, DeviceDailyRollup.day <= to)
+            .group_by(DeviceDailyRollup.device_id))
+
+
+def _device_log_count():
+    return select(func.count()).select_from(AttendanceLog.__table__).where(AttendanceLog.device_id == 1)
+
+
+def _seen_index_rebuild():
+    return (select(AttendanceLog.natural_key, AttendanceLog.device_userid, AttendanceLog.timestamp,
+                   AttendanceLog.status).where(AttendanceLog.device_id == 1))
+
+
+def _retention_chunk():
+    cutoff = datetime.utcnow() - timedelta(days=365)
+    return (select(AttendanceLog.id)
+            .where(AttendanceLog.timestamp >= cutoff - timedelta(days=31), AttendanceLog.timestamp < cutoff,
+                   AttendanceLog.exported.is_(True))
+            .limit(5000))
+
+
+def _userinfo_by_sn():
+    return select(AccessUserInfo.USERID, AccessUserInfo.Badgenumber).where(AccessUserInfo.sn == "SN1")
+
+
+def _userinfo_by_badge_sn():
+    return select(AccessUserInfo.__table__).where(AccessUserInfo.Badgenumber == "105", AccessUserInfo.sn == "SN1")
+
+
+def _userinfo_by_userid():
+    return select(AccessUserInfo.__table__).where(AccessUserInfo.USERID == "105")
+
+
+def _badge_by_number():
+    return select(Badge.__table__).where(Badge.badge_number == "105")
+
+
+def _checkinout_user_range():
+    frm, to = _recent_window()
+    return (select(CheckinOut.__table__)
+            .where(CheckinOut.USERID == "105", CheckinOut.CHECKTIME >= frm, CheckinOut.CHECKTIME < to))
+
+
+def _hot_queries():
+    frm, to = _recent_window()
+    substring = "substring search ('%x%') cannot use a B-tree index"
+    return [
+        HotQuery("logs: newest first", "views/logs.py", lambda: _logs_query()),
+        HotQuery("logs: date range", "views/logs.py", lambda: _logs_query(**{"from": frm, "to": to})),
+        HotQuery("logs: device + date range", "views/logs.py",
+                 lambda: _logs_query(device_id=1, **{"from": frm, "to": to})),
+        HotQuery("logs: device, newest first", "views/logs.py", lambda: _logs_query(device_id=1)),
+        HotQuery("logs: branch + date range", "views/logs.py",
+                 lambda: _logs_query(branch_id=1, **{"from": frm, "to": to})),
+        HotQuery("logs: badge search", "views/logs.py", lambda: _logs_query(user_id="105"), scan_ok=substring),
+        HotQuery("logs: badge search + date range", "views/logs.py",
+                 lambda: _logs_query(user_id="105", **{"from": frm, "to": to})),
+        HotQuery("logs: month typed in q", "views/logs.py", lambda: _logs_query(q=frm[:7])),
+        HotQuery("stats: punches per day", "views/logs.py", _stats_by_date),
+        HotQuery("stats: top devices", "views/logs.py", _stats_top_devices),
+        HotQuery("daily: badge days", "views/logs.py", _daily_for_badge),
+        HotQuery("stats: rollup devices", "views/logs.py", _rollup_devices),
+        HotQuery("exporter: rows past the cursor", "exporter.py", _exporter_next_rows),
+        HotQuery("exporter: partition rows past its cursor", "exporter.py", _exporter_partition_rows),
+        HotQuery("exporter: due retries", "exporter.py", _exporter_due_retries),
+        HotQuery("tasks: access_userinfo by sn", "tasks.py", _userinfo_by_sn),
+        HotQuery("tasks: access_userinfo by badge + sn", "tasks.py", _userinfo_by_badge_sn),
+        HotQuery("tasks: access_userinfo by USERID", "access_helpers.py", _userinfo_by_userid),
+        HotQuery("tasks: badge by number", "access_helpers.py", _badge_by_number),
+        HotQuery("seen index: device rebuild", "seen_index.py", _seen_index_rebuild),
+        HotQuery("counters: device recount", "counters.py", _device_log_count),
+        HotQuery("retention: expired chunk", "partitions.py", _retention_chunk),
+        HotQuery("checkinout: user + range", "projection.py", _checkinout_user_range),
+    ]
+
+
+# -------------------------
+# Plan inspection
+# -------------------------
+def _table_sizes(conn):
+    sizes = {}
+    for table in db.metadata.sorted_tables:
+        try:
+            sizes[table.name] = int(conn.execute(select(func.count()).select_from(table)).scalar() or 0)
+        except Exception:
+            sizes[table.name] = 0
+    return sizes
+
+
+def _aliases(statement):
+    """alias / table name -> base table name for every FROM in the statement."""
+    out = {}
+    for f in statement.get_final_froms() if hasattr(statement, "get_final_froms") else []:
+        for t in _walk_from(f):
+            base = getattr(t, "element", t)
+            name = getattr(base, "name", None)
+            if name:
+                out[getattr(t, "name", name)] = name
+    return out
+
+
+def _walk_from(f):
+    if hasattr(f, "left") and hasattr(f, "right"):
+        yield from _walk_from(f.left)
+        yield from _walk_from(f.right)
+    else:
+        yield f
+
+
+def _sqlite_scans(rows, aliases, limited):
+    """
+    Tables read in full. 'SCAN t' is a table scan; 'SCAN t USING [COVERING] INDEX' walks a
+    whole index and only passes when it supplies the ORDER BY of a LIMITed query.
+    """
+    scans, notes = [], []
+    sorts = any("TEMP B-TREE FOR ORDER BY" in r["detail"] for r in rows)
+    for r in rows:
+        detail = r["detail"]
+        if detail.startswith("SCAN ") and (" INDEX " not in detail or not limited or sorts):
+            name = detail.split()[1]
+            scans.append(aliases.get(name, name))
+        if "TEMP B-TREE" in detail:
+            notes.append(detail)
+    return scans, notes
+
+
+def _mysql_scans(rows, limited):
+    """type=ALL is a table scan; type=index walks a whole index (fine only for an ordered LIMIT)."""
+    scans, notes = [], []
+    sorts = any("filesort" in (m.get("Extra") or "") for m in rows)
+    for m in rows:
+        if m.get("type") == "ALL" or (m.get("type") == "index" and (not limited or sorts)):
+            scans.append((m.get("table"), int(m.get("rows") or 0)))
+        extra = m.get("Extra") or ""
+        if "filesort" in extra or "temporary" in extra:
+            notes.append(f"{m.get('table')}: {extra}")
+    return scans, notes
+
+
+def explain(conn, statement):
+    """
+    EXPLAIN rows (as dicts) for a Core/ORM statement on this connection. Read from the
+    DBAPI cursor: the statement's own result types do not apply to plan rows.
+    """
+    res = conn.execute(Explain(statement))
+    names = [d[0] for d in res.cursor.description]
+    rows = [dict(zip(names, r)) for r in res.cursor.fetchall()]
+    res.close()
+    return rows
+
+
+def check_plans(max_scan_rows=10000, only=None):
+    """
+    EXPLAIN every hot query. Returns a list of result dicts:
+    {"name", "source", "plan", "scans", "notes", "ok", "reason"}. Must run inside an app context.
+    """
+    results = []
+    with db.engine.connect() as conn:
+        sizes = _table_sizes(conn)
+        dialect = conn.dialect.name
+        for hq in _hot_queries():
+            if only and not any(o.lower() in hq.name.lower() for o in only):
+                continue
+            stmt = hq.build()
+            rows = explain(conn, stmt)
+            limited = " LIMIT " in str(stmt.compile(dialect=conn.dialect)).upper()
+            if dialect == "mysql":
+                scanned, notes = _mysql_scans(rows, limited)
+                big = [t for t, est in scanned if max(est, sizes.get(t, 0)) > max_scan_rows]
+                plan = [" | ".join(f"{k}={v}" for k, v in r.items() if v is not None) for r in rows]
+            else:
+                scanned, notes = _sqlite_scans(rows, _aliases(stmt), limited)
+                big = [t for t in scanned if sizes.get(t, 0) > max_scan_rows]
+                plan = [r["detail"] for r in rows]
+            ok = not big or bool(hq.scan_ok)
+            reason = None
+            if big:
+                reason = (f"full scan of {', '.join(big)} accepted: {hq.scan_ok}" if hq.scan_ok
+                          else f"full scan of {', '.join(f'{t} ({sizes.get(t, 0)} rows)' for t in big)}")
+            results.append({"name": hq.name, "source": hq.source, "plan": plan, "scans": big,
+                            "notes": notes, "ok": ok, "reason": reason})
+    return results
@@ -0,0 +1,188 @@
+# app/replica.py
+"""
+Read-replica routing for the reporting endpoints.
+
+When REPLICA_DATABASE_URI is set, it is registered as the "replica" engine bind
+and views decorated with `@reads_from_replica` run their db.session reads there,
+so large reports no longer share the primary's pool with the ingest writers.
+Everything else (pollers, writer, exporter, admin jobs, any flush) stays on the
+primary.
+
+A request is only routed to the replica while it is healthy: reachable and no
+more than REPLICA_MAX_LAG_SECONDS behind. Health is probed at most every
+REPLICA_CHECK_INTERVAL_SECONDS, and lag is measured two ways, keeping the larger:
+
+  * watermark: age (created_at) of the oldest attendance_logs row the replica
+    does not have yet, found by primary key; works for any pair of databases,
+    including a copied SQLite file used as a test replica
+  * MySQL only: Seconds_Behind_Source from SHOW REPLICA STATUS, when readable;
+    a stopped replication thread (NULL) marks the replica unhealthy
+
+A routed request that fails on the replica marks it unhealthy and is re-run
+once on the primary. Responses carry X-Read-Source: replica|primary.
+"""
+import threading
+import time as _time
+from datetime import datetime
+from functools import wraps
+
+from colorama import Fore
+from flask import g, has_app_context, current_app, make_response
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+REPLICA_BIND = "replica"
+
+_state = {"ok": False, "lag_seconds": None, "checked_at": 0.0, "error": None, "source": None}
+_state_lock = threading.Lock()
+
+
+def configure_replica_bind(app):
+    """Add the replica to SQLALCHEMY_BINDS (call before db.init_app)."""
+    uri = app.config.get("REPLICA_DATABASE_URI")
+    if not uri:
+        return
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    binds[REPLICA_BIND] = {"url": uri, "pool_pre_ping": True}
+    app.config["SQLALCHEMY_BINDS"] = binds
+
+
+class RoutingSession(Session):
+    """db.session that sends reads to the replica while the current request opted in."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get("read_from_replica"):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# -------------------------
+# Health / lag
+# -------------------------
+def _watermark_lag(primary, replica):
+    """Seconds since the oldest attendance_logs row missing on the replica was written (0 = caught up)."""
+    with replica.connect() as conn:
+        replica_max = conn.execute(text("SELECT MAX(id) FROM attendance_logs")).scalar() or 0
+    with primary.connect() as conn:
+        missing = conn.execute(text("SELECT created_at FROM attendance_logs WHERE id > :id ORDER BY id LIMIT 1"),
+                               {"id": replica_max}).scalar()
+    if missing is None:
+        return 0.0
+    if isinstance(missing, str):
+        missing = datetime.fromisoformat(missing)
+    return max((datetime.utcnow() - missing).total_seconds(), 0.0)
+
+
+def _mysql_seconds_behind(replica):
+    """
+    (seconds, running) from SHOW REPLICA STATUS / SHOW SLAVE STATUS; (None, True) when the
+    status cannot be read (no privilege, not a replica) so the watermark decides alone.
+    """
+    for stmt, key in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"), ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+        try:
+            with replica.connect() as conn:
+                row = conn.execute(text(stmt)).mappings().first()
+        except Exception:
+            continue
+        if row is None:
+            return None, True
+        value = row.get(key)
+        return (float(value), True) if value is not None else (None, False)
+    return None, True
+
+
+def probe_replica(app=None):
+    """Measure reachability and lag now and store the result; returns replica_status()."""
+    from .extensions import db
+    app = app or current_app
+    replica = db.engines.get(REPLICA_BIND)
+    if replica is None:
+        return replica_status()
+    max_lag = float(app.config.get("REPLICA_MAX_LAG_SECONDS", 30))
+    ok, lag, error, source = False, None, None, "watermark"
+    try:
+        lag = _watermark_lag(db.engine, replica)
+        if replica.dialect.name == "mysql":
+            behind, running = _mysql_seconds_behind(replica)
+            if not running:
+                error = "replication is not running"
+            elif behind is not None and behind >= lag:
+                lag, source = behind, "replica_status"
+        if error is None and lag > max_lag:
+            error = f"{lag:.0f}s behind (limit {max_lag:.0f}s)"
+        ok = error is None
+    except Exception as e:
+        error = f"unreachable: {e.__class__.__name__}: {e}"
+
+    with _state_lock:
+        was_ok = _state["ok"]
+        _state.update(ok=ok, lag_seconds=lag, checked_at=_time.monotonic(), error=error, source=source)
+    if was_ok != ok:
+        print((Fore.CYAN + "[REPLICA] healthy again, routing reports to it") if ok
+              else (Fore.YELLOW + f"[REPLICA] falling back to the primary: {error}"))
+    return replica_status()
+
+
+def _mark_unhealthy(error):
+    with _state_lock:
+        _state.update(ok=False, error=error, checked_at=_time.monotonic())
+    print(Fore.YELLOW + f"[REPLICA] falling back to the primary: {error}")
+
+
+def replica_status():
+    from .extensions import db
+    with _state_lock:
+        out = {k: v for k, v in _state.items() if k != "checked_at"}
+        checked_at = _state["checked_at"]
+    out["configured"] = db.engines.get(REPLICA_BIND) is not None
+    out["checked_seconds_ago"] = round(_time.monotonic() - checked_at, 1) if checked_at else None
+    return out
+
+
+def replica_usable():
+    """True when the replica is configured and was healthy at the last probe (re-probing when due)."""
+    from .extensions import db
+    if db.engines.get(REPLICA_BIND) is None:
+        return False
+    with _state_lock:
+        due = _time.monotonic() - _state["checked_at"] >= float(current_app.config.get("REPLICA_CHECK_INTERVAL_SECONDS", 5))
+        ok = _state["ok"]
+    if due:
+        ok = probe_replica()["ok"]
+    return ok
+
+
+# -------------------------
+# View decorator
+# -------------------------
+def reads_from_replica(view):
+    """Run a read-only view against the replica when it is usable, else (or on failure) the primary."""
+    from .extensions import db
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replica_usable():
+            resp = make_response(view(*args, **kwargs))
+            resp.headers["X-Read-Source"] = "primary"
+            return resp
+        g.read_from_replica = True
+        try:
+            resp = make_response(view(*args, **kwargs))
+            failed = resp.status_code >= 500
+            error = f"{view.__name__} returned {resp.status_code} on the replica"
+        except Exception as e:
+            failed, error = True, f"{view.__name__} failed on the replica: {e}"
+        finally:
+            g.read_from_replica = False
+            db.session.rollback()
+        if not failed:
+            resp.headers["X-Read-Source"] = "replica"
+            return resp
+        _mark_unhealthy(error)
+        resp = make_response(view(*args, **kwargs))
+        resp.headers["X-Read-Source"] = "primary"
+        return resp
+
+    return wrapper
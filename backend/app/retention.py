@@ -0,0 +1,213 @@
+# app/retention.py
+"""
+Throttled, chunked row removal.
+
+`purge_rows()` deletes the rows matching a condition in primary-key chunks: each
+chunk selects at most `chunk_size` ids, deletes them by id in its own short
+transaction and then sleeps `sleep_seconds`, so locks are held for one chunk
+at a time and the ingest writer gets the table between chunks. attendance_logs
+chunks keep the log counters in step (app/counters.py).
+
+The scheduled retention job applies RETENTION_POLICIES (table -> days to keep,
+optional per-table chunk / sleep) to:
+
+    attendance_logs      timestamp    only rows already exported
+    access_checkinout    CHECKTIME
+    ingest_dead_letters  created_at
+    unmapped_badges      last_seen
+
+It registers itself in the job registry (GET /api/sync/job/<id>) and updates
+one result entry per table after every chunk. RETENTION_MAX_RUN_SECONDS bounds
+a run; whatever is left is picked up by the next one. The DELETE endpoints in
+views/logs.py use `purge_rows()` as well.
+
+This complements the month-granular partition drops in app/partitions.py.
+"""
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from colorama import Fore
+from sqlalchemy import select
+
+from .extensions import db
+from .models import AttendanceLog, CheckinOut, IngestDeadLetter, UnmappedBadge
+from .counters import subtract_deleted
+
+# table -> (model, time column)
+RETENTION_TABLES = {
+    "attendance_logs": (AttendanceLog, "timestamp"),
+    "access_checkinout": (CheckinOut, "CHECKTIME"),
+    "ingest_dead_letters": (IngestDeadLetter, "created_at"),
+    "unmapped_badges": (UnmappedBadge, "last_seen"),
+}
+
+_RETENTION_LOCK = threading.Lock()   # one retention run at a time
+
+
+def purge_rows(table, *where, chunk_size=2000, sleep_seconds=0.0, progress=None, deadline=None):
+    """
+    Delete rows of `table` matching `where`, `chunk_size` ids per transaction.
+    `progress(deleted, chunks)` is called after each chunk; stops early once
+    time.monotonic() passes `deadline`. Returns {"deleted", "chunks", "complete"}.
+    Must run inside an app context.
+    """
+    t = RETENTION_TABLES[table][0].__table__
+    deleted = chunks = 0
+    while True:
+        if deadline is not None and time.monotonic() >= deadline:
+            return {"deleted": deleted, "chunks": chunks, "complete": False}
+        with db.engine.begin() as conn:
+            ids = conn.execute(select(t.c.id).where(*where).limit(int(chunk_size))).scalars().all()
+            if not ids:
+                break
+            if table == "attendance_logs":
+                subtract_deleted(conn, t.c.id.in_(ids))
+            res = conn.execute(t.delete().where(t.c.id.in_(ids)))
+        deleted += res.rowcount if res.rowcount is not None and res.rowcount >= 0 else len(ids)
+        chunks += 1
+        if progress:
+            progress(deleted, chunks)
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+    return {"deleted": deleted, "chunks": chunks, "complete": True}
+
+
+def _policy(app, table):
+    """{"keep_days", "chunk", "sleep_seconds"} for `table`; keep_days None = keep everything."""
+    p = dict((app.config.get("RETENTION_POLICIES") or {}).get(table) or {})
+    return {
+        "keep_days": p.get("keep_days"),
+        "chunk": int(p.get("chunk") or app.config.get("RETENTION_CHUNK", 2000)),
+        "sleep_seconds": float(p.get("sleep_seconds", app.config.get("RETENTION_SLEEP_SECONDS", 0.0)) or 0.0),
+    }
+
+
+def purge_settings(app, table):
+    """(chunk_size, sleep_seconds) of `table`'s policy, for ad-hoc deletes."""
+    p = _policy(app, table)
+    return p["chunk"], p["sleep_seconds"]
+
+
+def retention_cutoff(app, table, today=None):
+    """
+    Oldest time still kept for `table` under the partition retention and the
+    retention policy (the later of the two), or None when neither applies.
+    """
+    from .partitions import retention_cutoff as partition_cutoff
+    cutoffs = [c for c in (partition_cutoff(app, table, today=today),) if c is not None]
+    keep_days = _policy(app, table)["keep_days"]
+    if keep_days:
+        day = today or datetime.utcnow().date()
+        cutoffs.append(datetime.combine(day - timedelta(days=int(keep_days)), datetime.min.time()))
+    return max(cutoffs) if cutoffs else None
+
+
+def _expired(table, cutoff):
+    model, column = RETENTION_TABLES[table]
+    cond = [getattr(model, column) < cutoff]
+    if model is AttendanceLog:
+        cond.append(AttendanceLog.exported.is_(True))
+    return cond
+
+
+def apply_retention(app, job_id=None, tables=None, today=None):
+    """
+    One retention pass over the configured policies (or just `tables`). Progress goes
+    into the job registry entry `job_id` when given. Must run inside an app context.
+    Returns {table: {"cutoff", "deleted", "chunks", "complete"}}.
+    """
+    from .tasks import _JOB_LOCK, _JOB_REGISTRY
+
+    max_run = app.config.get("RETENTION_MAX_RUN_SECONDS")
+    deadline = time.monotonic() + float(max_run) if max_run else None
+    out = {}
+    for table in tables or RETENTION_TABLES:
+        p = _policy(app, table)
+        if not p["keep_days"]:
+            continue
+        day = today or datetime.utcnow().date()
+        cutoff = datetime.combine(day - timedelta(days=int(p["keep_days"])), datetime.min.time())
+        entry = {"table": table, "cutoff": cutoff.isoformat(), "deleted": 0, "chunks": 0, "status": "running"}
+        if job_id:
+            with _JOB_LOCK:
+                job = _JOB_REGISTRY.get(job_id)
+                if job:
+                    job["results"].append(entry)
+
+        def progress(deleted, chunks, entry=entry):
+            with _JOB_LOCK:
+                entry.update(deleted=deleted, chunks=chunks)
+
+        res = purge_rows(table, *_expired(table, cutoff), chunk_size=p["chunk"],
+                         sleep_seconds=p["sleep_seconds"], progress=progress, deadline=deadline)
+        with _JOB_LOCK:
+            entry.update(deleted=res["deleted"], chunks=res["chunks"],
+                         status="done" if res["complete"] else "time_limit")
+            if job_id and job_id in _JOB_REGISTRY:
+                _JOB_REGISTRY[job_id]["done"] += 1
+        out[table] = {"cutoff": entry["cutoff"], "deleted": res["deleted"], "chunks": res["chunks"],
+                      "complete": res["complete"]}
+        if res["deleted"]:
+            print(Fore.CYAN + f"[RETENTION] {table}: deleted {res['deleted']} row(s) older than "
+                              f"{cutoff:%Y-%m-%d} in {res['chunks']} chunk(s)")
+        if not res["complete"]:
+            print(Fore.YELLOW + f"[RETENTION] {table}: stopped at RETENTION_MAX_RUN_SECONDS, continuing next run")
+            break
+    return out
+
+
+def start_retention_job(app, tables=None, background=True):
+    """
+    Register a 'retention' job and run apply_retention() for it (in a daemon thread
+    when background=True). Returns the job id, or None when a run is already going.
+    """
+    from .tasks import _set_job, _now_iso, _JOB_LOCK, _JOB_REGISTRY
+
+    if not _RETENTION_LOCK.acquire(blocking=False):
+        print(Fore.YELLOW + "[RETENTION] already running, skipped")
+        return None
+    job_id = str(uuid.uuid4())
+    configured = [t for t in (tables or RETENTION_TABLES) if _policy(app, t)["keep_days"]]
+    _set_job(job_id, {
+        'job_id': job_id,
+        'type': 'retention',
+        'status': 'running',
+        'started_at': _now_iso(),
+        'finished_at': None,
+        'total': len(configured),
+        'done': 0,
+        'results': [],
+        'error': None,
+    })
+
+    def _worker():
+        status, error = 'finished', None
+        try:
+            with app.app_context():
+                try:
+                    apply_retention(app, job_id=job_id, tables=configured)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            status, error = 'failed', str(e)
+            print(Fore.RED + f"[RETENTION ERROR] {e}\n{traceback.format_exc()}")
+        finally:
+            _RETENTION_LOCK.release()
+            with _JOB_LOCK:
+                job = _JOB_REGISTRY.get(job_id)
+                if job:
+                    job.update(status=status, error=error, finished_at=_now_iso())
+
+    if background:
+        threading.Thread(target=_worker, name="retention", daemon=True).start()
+    else:
+        _worker()
+    return job_id
+
+
+def run_retention_job(app):
+    """Scheduler entry point."""
+    return start_retention_job(app, background=False)
@@ -0,0 +1,349 @@
+# app/rollups.py
+"""
+Daily rollups of attendance_logs.
+
+    rollup_badge_daily   (day, badge) -> first punch, last punch, punches, distinct devices
+    rollup_device_daily  (day, device) -> punches
+
+Rollups are maintained by region: `refresh_rollups()` recomputes every rollup
+row for a set of days x badges (and days x devices) from the source rows and
+replaces that region in one transaction. The ingest writer calls it inside the
+transaction that inserts a batch, day by day for the badges/devices the batch
+touched on that day, so rollups are exact even when the insert drops duplicates;
+delete paths call it for what they removed; `rebuild_rollups()` (rebuild_rollups.py,
+POST /api/admin/rollups/rebuild) runs it month by month over a historical range.
+
+Both tables are unique on (day, key) and refreshed rows are upserted, so two
+writers refreshing the same region leave one row per key, not two.
+
+Rollups only cover history once they have been rebuilt: a full `rebuild_rollups()`
+records ROLLUPS_REBUILT in sync_cursors, and /api/logs/stats reads the base tables
+until it exists (`rollups_ready()`).
+
+Months moved to the cold archive (app/archive.py) are aggregated from the
+archive files, so a rebuild over archived history gives the same rollups. Ids
+still in the hot table are dropped from the archived side, and distinct devices
+of a (day, badge) found on both sides are counted over the union.
+"""
+import time as _time
+from datetime import date, datetime, time, timedelta
+
+from colorama import Fore
+from sqlalchemy import select, delete, func, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .extensions import db
+from .db_helpers import dialect_name
+from .models import AttendanceLog, BadgeDailyRollup, DeviceDailyRollup, SyncCursor
+from .partitions import add_months, month_start
+
+IN_CHUNK = 500
+# sync_cursors row written by a full rebuild; position = newest log id when it started
+ROLLUPS_REBUILT = "rollups_rebuild"
+
+
+def _as_day(v):
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    return date.fromisoformat(str(v)[:10])
+
+
+def _chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _in_or_null(col, values):
+    """col IN (values), matching NULL when None is among them."""
+    present = [v for v in values if v is not None]
+    conds = [col.in_(present)] if present else []
+    if len(present) != len(values):
+        conds.append(col.is_(None))
+    return or_(*conds)
+
+
+def _key_filters(col, keys):
+    """None = whole region; otherwise one IN (...) condition per chunk."""
+    if keys is None:
+        return [None]
+    return [_in_or_null(col, chunk) for chunk in _chunks(keys)]
+
+
+def rollups_ready():
+    """True once a full rebuild has been recorded (before that the rollups miss older history)."""
+    tbl = SyncCursor.__table__
+    return db.session.execute(select(tbl.c.position).where(tbl.c.name == ROLLUPS_REBUILT)).first() is not None
+
+
+def rollup_archive_dir(app):
+    """Archive directory to aggregate archived months from, or None when the archive is off."""
+    if not app.config.get("ARCHIVE_ENABLED", False):
+        return None
+    return app.config.get("ARCHIVE_DIR") or "archive"
+
+
+# -------------------------
+# Aggregation
+# -------------------------
+def _hot_badge_groups(conn, lo, hi, badges):
+    al = AttendanceLog.__table__
+    day = func.date(al.c.timestamp)
+    out = []
+    for cond in _key_filters(al.c.user_id, badges):
+        q = (
+            select(day.label("day"), al.c.user_id.label("key"), func.max(al.c.badge_id).label("badge_id"),
+                   func.min(al.c.timestamp).label("first_punch"), func.max(al.c.timestamp).label("last_punch"),
+                   func.count().label("punches"), func.count(func.distinct(al.c.device_id)).label("devices"))
+            .where(al.c.timestamp >= lo, al.c.timestamp < hi)
+            .group_by(day, al.c.user_id)
+        )
+        if cond is not None:
+            q = q.where(cond)
+        out.extend(dict(r) for r in conn.execute(q).mappings())
+    return out
+
+
+def _hot_device_groups(conn, lo, hi, device_ids):
+    al = AttendanceLog.__table__
+    day = func.date(al.c.timestamp)
+    out = []
+    for cond in _key_filters(al.c.device_id, device_ids):
+        q = (
+            select(day.label("day"), al.c.device_id.label("key"), func.count().label("punches"))
+            .where(al.c.timestamp >= lo, al.c.timestamp < hi)
+            .group_by(day, al.c.device_id)
+        )
+        if cond is not None:
+            q = q.where(cond)
+        out.extend(dict(r) for r in conn.execute(q).mappings())
+    return out
+
+
+def _hot_badge_devices(conn, lo, hi, badges):
+    """{(day, badge): {device ids}} of the hot rows, for badges also found in the archive."""
+    al = AttendanceLog.__table__
+    day = func.date(al.c.timestamp)
+    out = {}
+    for cond in _key_filters(al.c.user_id, badges):
+        q = select(day, al.c.user_id, al.c.device_id).distinct().where(al.c.timestamp >= lo, al.c.timestamp < hi)
+        if cond is not None:
+            q = q.where(cond)
+        for d, key, device_id in conn.execute(q):
+            out.setdefault((_as_day(d), key), set()).add(device_id)
+    return out
+
+
+def _archive_reader(conn, archive_dir, lo, hi, key, keys):
+    """
+    Archived rows in [lo, hi) for `keys`, without the ids still in the hot table (an
+    interrupted archive run leaves rows in both; readers serve those from the hot side).
+    """
+    if not archive_dir:
+        return None
+    from .archive import ArchiveReader
+    reader = ArchiveReader(archive_dir, lo, hi)
+    if not reader.entries:
+        return None
+    reader.filter_range(lo, hi)
+    if keys is not None:
+        reader.filter_values(key, keys)
+    al = AttendanceLog.__table__
+    reader.exclude_ids(conn.execute(select(al.c.id).where(
+        al.c.id.between(min(e["min_id"] for e in reader.entries), max(e["max_id"] for e in reader.entries)),
+        al.c.timestamp >= lo, al.c.timestamp < hi)).scalars().all())
+    return reader
+
+
+def _merge(groups, badge=True, devices=None):
+    """
+    Combine hot and archived groups for the same (day, key). Distinct devices can't be
+    summed: `devices` gives the union of device ids for keys found on both sides.
+    """
+    out = {}
+    for g in groups:
+        k = (_as_day(g["day"]), g["key"])
+        cur = out.get(k)
+        if cur is None:
+            out[k] = dict(g, day=k[0])
+            continue
+        cur["punches"] += g["punches"]
+        if badge:
+            cur["first_punch"] = min(cur["first_punch"], g["first_punch"])
+            cur["last_punch"] = max(cur["last_punch"], g["last_punch"])
+            if g.get("badge_id") is not None:
+                cur["badge_id"] = max(cur.get("badge_id") or 0, g["badge_id"])
+    for k, ids in (devices or {}).items():
+        if k in out:
+            out[k]["devices"] = len(ids)
+    return out
+
+
+def _badge_groups(conn, lo, hi, badges, archive_dir):
+    hot = _hot_badge_groups(conn, lo, hi, badges)
+    reader = _archive_reader(conn, archive_dir, lo, hi, "user_id", badges)
+    if reader is None or not len(reader):
+        return _merge(hot)
+    archived = reader.daily_groups("user_id")
+    both = {(_as_day(g["day"]), g["key"]) for g in hot} & {(g["day"], g["key"]) for g in archived}
+    devices = {}
+    if both:
+        shared = {key for _, key in both}
+        devices = _hot_badge_devices(conn, lo, hi, shared)
+        reader.filter_values("user_id", shared)
+        for k, ids in reader.daily_device_sets("user_id").items():
+            devices.setdefault(k, set()).update(ids)
+    return _merge(hot + archived, devices={k: devices.get(k, set()) for k in both})
+
+
+def _device_groups(conn, lo, hi, device_ids, archive_dir):
+    hot = _hot_device_groups(conn, lo, hi, device_ids)
+    reader = _archive_reader(conn, archive_dir, lo, hi, "device_id", device_ids)
+    archived = reader.daily_groups("device_id") if reader is not None else []
+    return _merge(hot + archived, badge=False)
+
+
+def _upsert_stmt(table, keys, dialect_name):
+    """INSERT that overwrites the row with the same `keys` instead of failing; None when unsupported."""
+    if dialect_name == "mysql":
+        ins = mysql_insert(table)
+        return ins.on_duplicate_key_update({c.name: ins.inserted[c.name] for c in table.c
+                                            if c.name not in keys and not c.primary_key})
+    if dialect_name in ("sqlite", "postgresql"):
+        ins = (sqlite_insert if dialect_name == "sqlite" else pg_insert)(table)
+        return ins.on_conflict_do_update(index_elements=list(keys), set_={
+            c.name: ins.excluded[c.name] for c in table.c if c.name not in keys and not c.primary_key})
+    return None
+
+
+def _write(conn, table, keys, rows):
+    """Upsert rollup rows on their (day, key) unique constraint."""
+    if not rows:
+        return
+    stmt = _upsert_stmt(table, keys, dialect_name(conn))
+    conn.execute(stmt if stmt is not None else table.insert(), rows)
+
+
+def refresh_rollups(conn, start_day, end_day, badges=None, device_ids=None, archive_dir=None,
+                    refresh_badges=True, refresh_devices=True):
+    """
+    Recompute rollup rows for days [start_day, end_day] inside the caller's transaction.
+    `badges` / `device_ids` limit the region (None = every badge / device on those days).
+    Returns {"badge_rows": n, "device_rows": n}.
+    """
+    lo = datetime.combine(_as_day(start_day), time.min)
+    hi = datetime.combine(_as_day(end_day) + timedelta(days=1), time.min)
+    now = datetime.utcnow()
+    result = {"badge_rows": 0, "device_rows": 0}
+
+    if refresh_badges:
+        groups = _badge_groups(conn, lo, hi, badges, archive_dir)
+        t = BadgeDailyRollup.__table__
+        for cond in _key_filters(t.c.badge, badges):
+            stmt = delete(t).where(t.c.day >= lo.date(), t.c.day < hi.date())
+            conn.execute(stmt if cond is None else stmt.where(cond))
+        rows = [{"day": day, "badge": key, "badge_id": g.get("badge_id"), "first_punch": g["first_punch"],
+                 "last_punch": g["last_punch"], "punches": int(g["punches"]), "devices": int(g["devices"]),
+                 "updated_at": now} for (day, key), g in groups.items()]
+        _write(conn, t, ("day", "badge"), rows)
+        result["badge_rows"] = len(rows)
+
+    if refresh_devices:
+        groups = _device_groups(conn, lo, hi, device_ids, archive_dir)
+        t = DeviceDailyRollup.__table__
+        for cond in _key_filters(t.c.device_id, device_ids):
+            stmt = delete(t).where(t.c.day >= lo.date(), t.c.day < hi.date())
+            conn.execute(stmt if cond is None else stmt.where(cond))
+        rows = [{"day": day, "device_id": key, "punches": int(g["punches"]), "updated_at": now}
+                for (day, key), g in groups.items()]
+        _write(conn, t, ("day", "device_id"), rows)
+        result["device_rows"] = len(rows)
+    return result
+
+
+def refresh_rollups_for_rows(conn, rows, archive_dir=None):
+    """
+    Refresh the rollups touched by a set of attendance_logs row dicts (ingest path):
+    per day, only the badges and devices that have rows on that day.
+    """
+    by_day = {}
+    for r in rows:
+        if r.get("timestamp") is None:
+            continue
+        badges, device_ids = by_day.setdefault(_as_day(r["timestamp"]), (set(), set()))
+        badges.add(r.get("user_id"))
+        device_ids.add(r["device_id"])
+    if not by_day:
+        return None
+    result = {"badge_rows": 0, "device_rows": 0}
+    for day, (badges, device_ids) in sorted(by_day.items()):
+        res = refresh_rollups(conn, day, day, badges=badges, device_ids=device_ids, archive_dir=archive_dir)
+        result["badge_rows"] += res["badge_rows"]
+        result["device_rows"] += res["device_rows"]
+    return result
+
+
+# -------------------------
+# Rebuild
+# -------------------------
+def rebuild_rollups(start_day=None, end_day=None, archive_dir=None, sleep_seconds=0.0):
+    """
+    Recompute all rollups for [start_day, end_day] one month per transaction.
+    Defaults cover everything in attendance_logs (and the archive); such a full run is
+    recorded as ROLLUPS_REBUILT. Must run inside an app context.
+    """
+    al = AttendanceLog.__table__
+    full = start_day is None and end_day is None
+    with db.engine.connect() as conn:
+        high = conn.execute(select(func.max(al.c.id))).scalar() or 0
+    if start_day is None or end_day is None:
+        with db.engine.connect() as conn:
+            lo, hi = conn.execute(select(func.min(al.c.timestamp), func.max(al.c.timestamp))).one()
+        if archive_dir:
+            from .archive import manifest_entries
+            entries = manifest_entries(archive_dir)
+            if entries:
+                a_lo = datetime.fromisoformat(entries[0]["min_ts"])
+                a_hi = max(datetime.fromisoformat(e["max_ts"]) for e in entries)
+                lo = min(lo, a_lo) if lo else a_lo
+                hi = max(hi, a_hi) if hi else a_hi
+        if lo is None:
+            if full:
+                _record_rebuild(high)
+            return {"months": 0, "badge_rows": 0, "device_rows": 0}
+        start_day = _as_day(start_day or lo)
+        end_day = _as_day(end_day or hi)
+    start_day, end_day = _as_day(start_day), _as_day(end_day)
+
+    result = {"months": 0, "badge_rows": 0, "device_rows": 0,
+              "start": start_day.isoformat(), "end": end_day.isoformat()}
+    m = month_start(start_day)
+    while m <= end_day:
+        lo = max(m, start_day)
+        hi = min(add_months(m, 1) - timedelta(days=1), end_day)
+        with db.engine.begin() as conn:
+            res = refresh_rollups(conn, lo, hi, archive_dir=archive_dir)
+        result["months"] += 1
+        result["badge_rows"] += res["badge_rows"]
+        result["device_rows"] += res["device_rows"]
+        if sleep_seconds:
+            _time.sleep(sleep_seconds)
+        m = add_months(m, 1)
+    if full:
+        _record_rebuild(high)
+    print(Fore.CYAN + f"[ROLLUPS] rebuilt {result['start']}..{result['end']}: "
+                      f"{result['badge_rows']} badge-days, {result['device_rows']} device-days")
+    return result
+
+
+def _record_rebuild(high):
+    tbl = SyncCursor.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        if not conn.execute(tbl.update().where(tbl.c.name == ROLLUPS_REBUILT)
+                            .values(position=int(high), updated_at=now)).rowcount:
+            conn.execute(tbl.insert().values(name=ROLLUPS_REBUILT, position=int(high), updated_at=now))
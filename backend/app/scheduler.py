@@ -91,20 +91,21 @@ def _resolve_app(maybe_proxy_or_app):
 # Export job globals (use same registry)
 _EXPORT_LOCK = threading.Lock()   # protects concurrent exporter runs
 
-def start_export_job(app, batch_size=1000, background=True):
+def start_export_job(app, batch_size=1000, background=True, bulk=False):
     """
     Start an export job that calls export_attendance_direct (exporter).
-    Runs in a daemon thread when background=True.
+    Runs in a daemon thread when background=True. bulk=True drains the backlog
+    through bulk files (backfill after an outage or into a new target table).
     """
     real_app = _resolve_app(app)
     job_id = str(uuid.uuid4())
     payload = {
         'job_id': job_id,
-        'type': 'export_enddb',
+        'type': 'export_enddb_bulk' if bulk else 'export_enddb',
         'status': 'running',
         'started_at': _now_iso(),
         'finished_at': None,
-        'total': 1,
+        'total': None if bulk or real_app.config.get("EXPORT_DRAIN", True) else 1,  # drain: batch count not known upfront
         'done': 0,
         'results': [],
         'error': None
@@ -115,14 +116,30 @@ def start_export_job(app, batch_size=1000, background=True):
         try:
             with resolved_app.app_context():
                 # import the exporter function name you have in exporter.py
-                from .exporter import export_attendance_direct
+                from .exporter import export_attendance_direct, drain_export_backlog, export_partitioned
                 # Acquire simple export lock so two exports can't run at once
                 got = _EXPORT_LOCK.acquire(blocking=False)
                 if not got:
                     raise RuntimeError("Export already running")
                 try:
                     lookback = resolved_app.config.get("EXPORT_LOOKBACK_DAYS", None)
-                    res = export_attendance_direct(batch_size=batch_size_inner, lookback_days=lookback, dry_run=False)
+                    if bulk or resolved_app.config.get("EXPORT_DRAIN", True):
+                        # keep exporting until the backlog is empty; progress is visible on the job
+                        def _progress(totals):
+                            with _JOB_LOCK:
+                                job = _JOB_REGISTRY.get(job_id_inner)
+                                if job:
+                                    job['done'] = totals['batches']
+                                    job['results'] = [totals]
+                        workers = int(resolved_app.config.get("EXPORT_PARALLEL_WORKERS", 1) or 1)
+                        if bulk:
+                            res = drain_export_backlog(resolved_app, lookback_days=lookback, progress=_progress, bulk=True)
+                        elif workers > 1:
+                            res = export_partitioned(resolved_app, workers, lookback_days=lookback, progress=_progress)
+                        else:
+                            res = drain_export_backlog(resolved_app, lookback_days=lookback, progress=_progress)
+                    else:
+                        res = export_attendance_direct(batch_size=batch_size_inner, lookback_days=lookback, dry_run=False)
                 finally:
                     _EXPORT_LOCK.release()
 
@@ -139,8 +156,8 @@ def start_export_job(app, batch_size=1000, background=True):
                 with _JOB_LOCK:
                     job = _JOB_REGISTRY.get(job_id_inner)
                     if job:
-                        job['results'].append(res)
-                        job['done'] = 1
+                        job['results'] = [res]
+                        job['done'] = res.get('batches', 1)
                         job['status'] = 'finished'
                         job['finished_at'] = _now_iso()
         except Exception as e:
@@ -576,6 +593,14 @@ def _poll_all_for_scheduler(app):
         print(Fore.RED + f"[SCHEDULER RUN ERROR] {e}\n{tb}")
         exceptions.append(("scheduler_run", str(e)))
 
+    # make sure queued device batches are committed before exporting / summarising
+    try:
+        from .ingest import flush_ingest_writer
+        if not flush_ingest_writer(timeout=real_app.config.get("INGEST_FLUSH_TIMEOUT_SECONDS", 300)):
+            print(Fore.YELLOW + "[SCHEDULER] Ingest writer still draining; export may miss the newest rows.")
+    except Exception as e:
+        print(Fore.RED + f"[SCHEDULER] Ingest flush failed: {e}")
+
     run_end = time.time()
     run_elapsed = run_end - run_start
 
@@ -608,6 +633,11 @@ def _poll_all_for_scheduler(app):
             "exceptions": exceptions,
             "logfile": logfile
         }
+        try:
+            from .ingest import ingest_stats
+            summary["ingest"] = ingest_stats()
+        except Exception:
+            pass
         if _RUN_FH:
             with _RUN_LOCK:
                 _RUN_FH.write("\nRUN_SUMMARY_JSON: " + json.dumps(summary, default=str) + "\n")
@@ -678,9 +708,73 @@ def start_recurring_scheduler(app, interval_seconds=None, prune_interval_seconds
             # If prune_old_jobs isn't present, skip adding that job
             pass
 
+        # access_checkinout is a projection of attendance_logs maintained off the ingest path
+        if real_app.config.get("CHECKINOUT_PROJECTION_ENABLED", True):
+            from .projection import run_checkinout_projection
+            _scheduler.add_job(
+                run_checkinout_projection,
+                'interval',
+                seconds=int(real_app.config.get("CHECKINOUT_PROJECTION_INTERVAL_SECONDS", 30)),
+                args=[real_app],
+                id="checkinout_projection",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+
+        # future month partitions + retention; first run right away so a fresh start is covered
+        if real_app.config.get("PARTITION_MAINTENANCE_ENABLED", True):
+            from .partitions import run_partition_maintenance
+            _scheduler.add_job(
+                run_partition_maintenance,
+                'interval',
+                seconds=int(real_app.config.get("PARTITION_MAINTENANCE_INTERVAL_SECONDS", 6 * 3600)),
+                args=[real_app],
+                id="partition_maintenance",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True,
+                next_run_time=datetime.now()
+            )
+
+        # chunked, throttled retention per RETENTION_POLICIES; progress shows up as a 'retention' job
+        if real_app.config.get("RETENTION_ENABLED", False):
+            from .retention import run_retention_job
+            _scheduler.add_job(
+                run_retention_job,
+                'interval',
+                seconds=int(real_app.config.get("RETENTION_INTERVAL_SECONDS", 3600)),
+                args=[real_app],
+                id="retention",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+
+        if real_app.config.get("ARCHIVE_ENABLED", False):
+            from .archive import run_archive_job
+            _scheduler.add_job(
+                run_archive_job,
+                'interval',
+                seconds=int(real_app.config.get("ARCHIVE_INTERVAL_SECONDS", 24 * 3600)),
+                args=[real_app],
+                id="cold_archive",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+
         _scheduler.start()
         print(Fore.CYAN + f"[SCHEDULER] Started recurring polling every {interval_seconds} seconds.")
 
+        # start the ingest writer now so batches spooled before a restart are replayed right away
+        if real_app.config.get("INGEST_WRITE_BEHIND", True):
+            try:
+                from .ingest import get_ingest_writer
+                get_ingest_writer(real_app)
+            except Exception as e:
+                print(Fore.RED + f"[SCHEDULER] Could not start ingest writer: {e}")
+
 
 def stop_recurring_scheduler():
     """
@@ -699,6 +793,22 @@ def stop_recurring_scheduler():
             _scheduler.remove_job("job_prune")
         except Exception:
             pass
+        try:
+            _scheduler.remove_job("checkinout_projection")
+        except Exception:
+            pass
+        try:
+            _scheduler.remove_job("partition_maintenance")
+        except Exception:
+            pass
+        try:
+            _scheduler.remove_job("retention")
+        except Exception:
+            pass
+        try:
+            _scheduler.remove_job("cold_archive")
+        except Exception:
+            pass
         try:
             _scheduler.shutdown(wait=False)
         except Exception:
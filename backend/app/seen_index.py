@@ -0,0 +1,158 @@
+# app/seen_index.py
+"""
+Compact per-device index of records already stored in attendance_logs.
+
+Each device keeps a sorted array of 64-bit keys (8 bytes per record; the prefix
+of the row's natural_key) plus a watermark (the newest punch time seen). A punch
+newer than the watermark is new without a lookup; anything older is a binary
+search. Fresh keys go into a small set and are merged into the array in bulk.
+The index lives for the whole process and is loaded from the DB the first time
+a device is polled.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+from .extensions import db
+from .models import AttendanceLog, Device
+
+# pending keys merged into the sorted array once the set grows past this
+_MERGE_THRESHOLD = 4096
+# rows streamed per round-trip when (re)building from the DB
+_LOAD_CHUNK = 20000
+
+
+class DeviceSeenIndex:
+    __slots__ = ("device_id", "_keys", "_pending", "watermark", "loaded", "_lock")
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self._keys = array("q")
+        self._pending = set()
+        self.watermark = None
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys) + len(self._pending)
+
+    def load(self, session=None):
+        """Rebuild from attendance_logs (one streamed pass over the device's rows)."""
+        from .ingest import natural_key, natural_key_int, timestamp_order, device_key_serial
+        session = session or db.session
+        dev = (session.query(Device.key_serial, Device.serial_no, Device.ip_address)
+               .filter(Device.id == self.device_id).one_or_none())
+        sn = device_key_serial(*dev) if dev else None
+        keys = array("q")
+        watermark = None
+        q = (session.query(AttendanceLog.natural_key, AttendanceLog.device_userid,
+                           AttendanceLog.timestamp, AttendanceLog.status)
+             .filter(AttendanceLog.device_id == self.device_id)
+             .execution_options(yield_per=_LOAD_CHUNK))
+        for nk, device_userid, ts, status in q:
+            if ts is None:
+                continue
+            # rows written before natural keys existed (and not yet backfilled) are keyed on the fly
+            keys.append(natural_key_int(nk or natural_key(sn, device_userid, ts, status)))
+            order = timestamp_order(ts)
+            if watermark is None or order > watermark:
+                watermark = order
+        keys = array("q", sorted(set(keys)))
+        with self._lock:
+            self._keys = keys
+            self._pending = set()
+            self.watermark = watermark
+            self.loaded = True
+
+    def contains(self, key, order=None):
+        """True if `key` is stored; `order` (punch time) lets newer punches skip the search."""
+        key = int(key)
+        with self._lock:
+            if self.watermark is None or (order is not None and order > self.watermark):
+                return False
+            if key in self._pending:
+                return True
+            i = bisect_left(self._keys, key)
+            return i < len(self._keys) and self._keys[i] == key
+
+    def add_many(self, pairs):
+        """Add (key, order) pairs."""
+        with self._lock:
+            for k, order in pairs:
+                if k is None:
+                    continue
+                self._pending.add(int(k))
+                if order is not None and (self.watermark is None or order > self.watermark):
+                    self.watermark = order
+            if len(self._pending) >= _MERGE_THRESHOLD:
+                self._merge()
+
+    def _merge(self):
+        if not self._pending:
+            return
+        fresh = sorted(k for k in self._pending if not self._has_sorted(k))
+        if fresh and (not self._keys or fresh[0] > self._keys[-1]):
+            # common case: new records arrive in increasing order
+            self._keys.extend(fresh)
+        elif fresh:
+            merged = array("q", sorted(self._keys.tolist() + fresh))
+            self._keys = merged
+        self._pending = set()
+
+    def _has_sorted(self, key):
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def stats(self):
+        with self._lock:
+            return {
+                "device_id": self.device_id,
+                "records": len(self._keys) + len(self._pending),
+                "watermark": self.watermark,
+                "bytes": self._keys.buffer_info()[1] * self._keys.itemsize + len(self._pending) * 8,
+                "loaded": self.loaded,
+            }
+
+
+_INDEXES = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def get_seen_index(device_id, session=None):
+    """Return the device's index, loading it from the DB on first use."""
+    with _INDEX_LOCK:
+        idx = _INDEXES.get(device_id)
+        if idx is None:
+            idx = DeviceSeenIndex(device_id)
+            _INDEXES[device_id] = idx
+    if not idx.loaded:
+        idx.load(session=session)
+    return idx
+
+
+def mark_seen(device_id, pairs):
+    """Record (key, order) pairs that are now stored. Ignored for devices whose index isn't loaded yet."""
+    with _INDEX_LOCK:
+        idx = _INDEXES.get(device_id)
+    if idx is not None and idx.loaded:
+        idx.add_many(pairs)
+
+
+def invalidate_seen_index(device_id=None):
+    """Drop one device's index (or all of them) after rows were deleted; it reloads on next poll."""
+    with _INDEX_LOCK:
+        if device_id is None:
+            _INDEXES.clear()
+        else:
+            _INDEXES.pop(device_id, None)
+
+
+def seen_index_stats():
+    with _INDEX_LOCK:
+        indexes = list(_INDEXES.values())
+    per_device = [i.stats() for i in indexes]
+    return {
+        "devices": len(per_device),
+        "records": sum(s["records"] for s in per_device),
+        "bytes": sum(s["bytes"] for s in per_device),
+    }
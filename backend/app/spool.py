@@ -0,0 +1,174 @@
+# app/spool.py
+"""
+Durable local spool for decoded device batches.
+
+An embedded SQLite file (stdlib sqlite3, WAL mode) that poll workers append to
+before anything touches the main DB. The ingest writer replays spooled batches
+into the main DB in bulk and deletes them only after that commit succeeds, so a
+MySQL outage or a slow commit no longer throws batches away or stalls polling.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from .db_helpers import encode_rows, decode_rows
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool_batches (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id   INTEGER NOT NULL,
+    device_name TEXT,
+    sn          TEXT,
+    set_serial  INTEGER NOT NULL DEFAULT 0,
+    rows        INTEGER NOT NULL,
+    payload     TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT
+)
+"""
+
+
+class IngestSpool:
+    """
+    Append-only spool with the same take/ack/release protocol as the in-memory queue.
+    `put()` returns once the batch is committed to the local file.
+    """
+    kind = "spool"
+    durable = True   # batches survive a restart, so they count as seen once put()
+
+    def __init__(self, path, max_rows=2000000, synchronous="NORMAL"):
+        self.path = path
+        self.max_rows = int(max_rows)
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a new file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.execute(_SCHEMA)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._waiters = {}      # seq -> original IngestBatch (for submit(wait=True))
+        self._in_flight = 0
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM spool_batches").fetchone()
+        self._pending_batches, self._pending_rows = int(row[0]), int(row[1])
+
+    # ---- producer side ----
+    def put(self, batch, timeout=300):
+        payload = json.dumps({
+            "attendance_rows": encode_rows(batch.attendance_rows),
+        }, default=str)
+        deadline = time.time() + float(timeout)
+        with self._cond:
+            waited = 0.0
+            while self._pending_rows and self._pending_rows + batch.size > self.max_rows:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"ingest spool full ({self._pending_rows} rows pending)")
+                t0 = time.time()
+                self._cond.wait(timeout=min(remaining, 1.0))
+                waited += time.time() - t0
+            batch.enqueued_at = time.time()
+            cur = self._conn.execute(
+                "INSERT INTO spool_batches (device_id, device_name, sn, set_serial, rows, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (batch.device_id, batch.device_name, batch.sn, 1 if batch.set_serial else 0,
+                 batch.size, payload, batch.enqueued_at),
+            )
+            self._waiters[cur.lastrowid] = batch
+            self._pending_batches += 1
+            self._pending_rows += batch.size
+            self._cond.notify_all()
+        return waited
+
+    # ---- consumer side ----
+    def take(self, flush_rows, flush_interval, max_txn_rows, stop_event):
+        """Block until a flush condition holds; return (seqs, batches) in spool order."""
+        from .ingest import IngestBatch
+        with self._cond:
+            while not stop_event.is_set():
+                if self._pending_batches:
+                    oldest = self._conn.execute("SELECT MIN(created_at) FROM spool_batches").fetchone()[0] or time.time()
+                    age = time.time() - oldest
+                    if self._pending_rows >= flush_rows or age >= flush_interval:
+                        break
+                    self._cond.wait(timeout=max(0.01, flush_interval - age))
+                else:
+                    self._cond.wait(timeout=1.0)
+            if not self._pending_batches:
+                return None, []
+            seqs, batches, rows = [], [], 0
+            cur = self._conn.execute(
+                "SELECT seq, device_id, device_name, sn, set_serial, rows, payload, created_at "
+                "FROM spool_batches ORDER BY seq"
+            )
+            for seq, device_id, device_name, sn, set_serial, n, payload, created_at in cur:
+                if batches and rows + n > max_txn_rows:
+                    break
+                data = json.loads(payload)
+                b = IngestBatch(device_id, device_name=device_name, sn=sn,
+                                attendance_rows=decode_rows(data.get("attendance_rows") or []),
+                                set_serial=bool(set_serial))
+                b.enqueued_at = created_at
+                seqs.append(seq)
+                batches.append(b)
+                rows += n
+            cur.close()
+            self._in_flight += len(batches)
+            return seqs, batches
+
+    def ack(self, seqs, batches):
+        """The main DB committed these batches: remove them from the spool."""
+        with self._cond:
+            self._conn.executemany("DELETE FROM spool_batches WHERE seq = ?", [(s,) for s in seqs])
+            self._pending_batches -= len(seqs)
+            self._pending_rows -= sum(b.size for b in batches)
+            self._in_flight -= len(batches)
+            for seq, b in zip(seqs, batches):
+                w = self._waiters.pop(seq, None)
+                if w is not None:
+                    w.inserted = b.inserted
+                    w.done.set()
+            if not self._pending_batches:
+                # spool drained: release free pages and shrink the WAL back to zero bytes
+                try:
+                    self._conn.executescript("PRAGMA incremental_vacuum;")  # runs to completion
+                    self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except Exception:
+                    pass
+            self._cond.notify_all()
+
+    def release(self, seqs, batches, error):
+        """Commit failed: keep the batches spooled for the next replay attempt."""
+        with self._cond:
+            self._conn.executemany(
+                "UPDATE spool_batches SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                [(str(error)[:1000], s) for s in seqs],
+            )
+            self._in_flight -= len(batches)
+            self._cond.notify_all()
+        return False  # nothing was dropped
+
+    def is_drained(self):
+        with self._cond:
+            return not self._pending_batches and not self._in_flight
+
+    def depth(self):
+        with self._cond:
+            oldest = self._conn.execute("SELECT MIN(created_at), MAX(attempts) FROM spool_batches").fetchone()
+            try:
+                size = os.path.getsize(self.path) + (os.path.getsize(self.path + "-wal") if os.path.exists(self.path + "-wal") else 0)
+            except Exception:
+                size = None
+            return {
+                "queue_batches": self._pending_batches,
+                "queue_rows": self._pending_rows,
+                "in_flight_batches": self._in_flight,
+                "oldest_wait_seconds": round(time.time() - oldest[0], 3) if oldest and oldest[0] else 0.0,
+                "max_attempts": int(oldest[1] or 0) if oldest else 0,
+                "spool_path": self.path,
+                "spool_bytes": size,
+            }
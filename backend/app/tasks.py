@@ -9,10 +9,18 @@ from datetime import datetime, timedelta
 from flask import current_app
 from zk import ZK
 from colorama import init as colorama_init, Fore
-from . import db, socketio
+from . import db
 from .locks import DirLock, DirLockTimeout
 from .access_helpers import upsert_access_userinfo, get_badge_for_device_userid, ensure_user_and_badge
-from .models import AccessUserInfo, CheckinOut, AttendanceLog, Badge, Device
+from .ingest import attendance_row, natural_key_int, timestamp_order, IngestBatch, write_batches, mark_batches_seen, get_ingest_writer, claim_key_serial, notify_live_export
+from .seen_index import get_seen_index
+from .retention import retention_cutoff as policy_retention_cutoff
+from .archive import archived_through, archive_dir_for
+from .rollups import rollup_archive_dir
+from .events import get_event_bus
+from .audit import get_audit_writer, INSERTS_STREAM, INSERTS_HEADER
+from .zk_decode import read_users, read_attendance
+from .models import AccessUserInfo
 
 colorama_init(autoreset=True)
 
@@ -24,48 +32,9 @@ _JOB_TTL_SECONDS = 60 * 60
 # -----------------------
 # Console / socket emitter
 # -----------------------
-ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
-COLOR_MAP = {
-    Fore.GREEN: 'green',
-    Fore.YELLOW: 'yellow',
-    Fore.CYAN: 'cyan',
-    Fore.BLUE: 'blue',
-    Fore.MAGENTA: 'magenta',
-    Fore.WHITE: 'white',
-    Fore.RED: 'red',
-}
-
-def strip_ansi(s: str) -> str:
-    return ANSI_RE.sub('', s) if s else s
-
 def console_emit(raw_text_with_color: str, level: str = "info", device=None, extra: dict = None):
-    try:
-        print(raw_text_with_color)
-    except Exception:
-        print(strip_ansi(raw_text_with_color))
-
-    color_name = None
-    for code, name in COLOR_MAP.items():
-        if code and code in raw_text_with_color:
-            color_name = name
-            break
-    payload = {
-        "type": "console",
-        "level": level,
-        "text": strip_ansi(raw_text_with_color),
-        "color": color_name,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-    }
-    if device is not None:
-        payload["device_id"] = getattr(device, "id", None)
-        payload["device_name"] = getattr(device, "name", None)
-    if extra:
-        payload["extra"] = extra
-
-    try:
-        socketio.emit("console", payload)
-    except Exception:
-        pass
+    """Queue a console line on the event bus; printing and the socket emit happen off-thread."""
+    get_event_bus().publish(raw_text_with_color, level=level, device=device, extra=extra)
 
 # -------------------------
 # Small device helper utils
@@ -199,6 +168,7 @@ def fetch_and_forward_for_device(device, inspect_only=False):
     conn = None
     new_count = 0
     snapshot = None
+    bus = get_event_bus()
     console_emit(Fore.YELLOW + f"\n[DEBUG] Connecting to {device.name} ({device.ip_address}:{getattr(device, 'port', None)})",
                  level="debug", device=device)
     try:
@@ -210,8 +180,16 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             pass
         # Try get users from device
         users = []
+        fast_decode = current_app.config.get("ZK_FAST_DECODE", True) and hasattr(conn, "read_with_buffer")
         try:
-            if hasattr(conn, "get_users"):
+            if fast_decode:
+                try:
+                    users = read_users(conn).records()
+                except Exception as e:
+                    fast_decode = False
+                    console_emit(Fore.YELLOW + f"    [DECODE WARN] Columnar user decode failed on {device.name}, using pyzk: {e}", level="warning", device=device)
+                    users = conn.get_users() or []
+            elif hasattr(conn, "get_users"):
                 users = conn.get_users() or []
             elif hasattr(conn, "get_user"):
                 u = conn.get_user()
@@ -222,6 +200,8 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             console_emit(Fore.YELLOW + f"    [USER FETCH WARN] Could not fetch users from device {device.name}: {e}", level="warning", device=device)
 
         sn_val = _resolve_device_sn(device, conn)
+        # natural keys use the serial stored on first contact, whatever serial_no becomes later
+        key_sn = device.key_serial or claim_key_serial(device.id, sn_val or device.ip_address)
         # DirLock to avoid concurrent replica writes for same folder
         lock_dir = os.path.join(current_app.config.get("REPLICA_LOCK_DIR", os.path.dirname(current_app.config.get("SCHEDULER_LOG_DIR", "logs"))), f"access_lock_{sn_val}")
         stale = current_app.config.get("ACCESS_LOCK_STALE_SECONDS", 60)
@@ -237,8 +217,7 @@ def fetch_and_forward_for_device(device, inspect_only=False):
                         continue
                     device_userid = str(device_userid).strip()
                     name = getattr(u, "name", None) or None
-                    console_emit(Fore.YELLOW + f"DEBUG: upserting USERID/Badgenumber='{device_userid}' sn='{sn_val}'",
-                                 level="debug", device=device)
+                    bus.count(device, "users", sample=device_userid)
                     upsert_access_userinfo(db.session, device_userid, device_userid, name=name, sn=sn_val, source="zk_device")
                     upsert_count += 1
                 except Exception as e:
@@ -270,7 +249,18 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             # fetch attendance logs
             start_time = time.time()
             try:
-                logs = conn.get_attendance() or []
+                logs = None
+                if fast_decode:
+                    try:
+                        # columnar decode of the raw buffer; reuses the users read above
+                        cols = read_attendance(conn, users=users)
+                        if cols.invalid:
+                            console_emit(Fore.YELLOW + f"    [DECODE WARN] Skipped {cols.invalid} records with invalid timestamps on {device.name}", level="warning", device=device)
+                        logs = cols.records()
+                    except Exception as e:
+                        console_emit(Fore.YELLOW + f"    [DECODE WARN] Columnar attendance decode failed on {device.name}, using pyzk: {e}", level="warning", device=device)
+                if logs is None:
+                    logs = conn.get_attendance() or []
             except Exception as e:
                 logs = []
                 console_emit(Fore.RED + f"    [ATT FETCH ERROR] Could not fetch attendance from {device.name}: {e}", level="error", device=device)
@@ -278,11 +268,12 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             console_emit(Fore.BLUE + f"[INFO] Retrieved {len(logs)} logs from {device.name} in {elapsed:.2f}s",
                          level="info", device=device, extra={"count": len(logs)})
 
-            # fetch existing record ids from Flask DB (avoid re-saving duplicates)
+            # in-memory index of punches already stored (loaded from the DB on first poll only)
             try:
-                existing = {rid for (rid,) in db.session.query(AttendanceLog.record_id).filter_by(device_id=device.id).all()}
-            except Exception:
-                existing = set()
+                seen = get_seen_index(device.id)
+            except Exception as e:
+                seen = None
+                console_emit(Fore.YELLOW + f"    [SEEN INDEX WARN] Could not load record index for {device.name}: {e}", level="warning", device=device)
 
             # Build badge -> USERID map from replica AccessUserInfo
             badge_to_userid = {}
@@ -294,11 +285,14 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             except Exception:
                 badge_to_userid = {}
 
-            # prepare containers
-            checkinout_rows = []
+            # prepare containers (plain dicts for the Core bulk insert path; access_checkinout
+            # is projected from attendance_logs by a background job, see projection.py)
             attendance_rows = []
-            unmapped_badges = set()
-            rec_meta = {}
+            unmapped_badges = {}   # badge -> [punches, first_seen, last_seen]
+            audit_rows = []
+            # device_userid -> (badge_id, access_userid); a device repeats the same users thousands of times
+            resolved_cache = {}
+            INSERT_CHUNK = current_app.config.get("INGEST_INSERT_CHUNK", 1000)
 
             # runtime flags
             AUTO_CREATE_USERINFO = current_app.config.get("AUTO_CREATE_USERINFO", False)
@@ -306,160 +300,165 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             ALLOW_INSERT_RAW_BADGE = current_app.config.get("ALLOW_INSERT_RAW_BADGE", True)
             AUTO_CREATE_USERS_FROM_BADGES = current_app.config.get("AUTO_CREATE_USERS_FROM_BADGES", False)
             AUTO_CREATE_USERS_NAME = current_app.config.get("AUTO_CREATE_USERS_NAME", "IMPORTED")
-
-            # CSV debug file paths
-            try:
-                log_dir = current_app.config.get("SCHEDULER_LOG_DIR", "logs")
-            except Exception:
-                log_dir = "logs"
-            os.makedirs(log_dir, exist_ok=True)
-            csv_fn = os.path.join(log_dir, f"access_inserts_{sn_val}_{datetime.now():%Y%m%d}.csv")
-            csv_unmapped_fn = os.path.join(log_dir, f"access_unmapped_{sn_val}_{datetime.now():%Y%m%d}.csv")
+            # punches older than the retention window (or already in the cold archive) were removed
+            # from attendance_logs on purpose; don't re-ingest them
+            retention_cutoff = policy_retention_cutoff(current_app, "attendance_logs")
+            if current_app.config.get("ARCHIVE_ENABLED", False):
+                archived_until = archived_through(archive_dir_for(current_app), device.branch_id)
+                if archived_until is not None and (retention_cutoff is None or archived_until > retention_cutoff):
+                    retention_cutoff = archived_until
+            expired = 0
 
             for rec in logs:
                 rid = getattr(rec, 'uid', None)
                 if rid is None:
                     continue
-
-                if rid in existing:
+                if retention_cutoff is not None and rec.timestamp < retention_cutoff:
+                    expired += 1
                     continue
 
-                status_str = str(rec.status) if isinstance(rec.status, int) else getattr(rec.status, 'name', str(rec.status))
+                status_str = str(getattr(rec.status, 'value', rec.status))  # stored as a SMALLINT code
                 device_userid = getattr(rec, 'user_id', None) or getattr(rec, 'userid', None) or getattr(rec, 'uid', None)
                 device_userid = str(device_userid) if device_userid is not None else ""
 
-                # resolve canonical badge via helper
-                badge_obj = None
-                try:
-                    badge_obj = get_badge_for_device_userid(db.session, device_userid, sn=sn_val)
-                except Exception:
-                    badge_obj = None
-
-                badge_id = badge_obj.id if badge_obj else None
-                badge_number = badge_obj.badge_number if badge_obj else None
-
-                # compute access_userid via replica AccessUserInfo
-                access_userid = None
-                if badge_number:
-                    ai = db.session.query(AccessUserInfo).filter(
-                        AccessUserInfo.Badgenumber == badge_number,
-                        AccessUserInfo.sn == sn_val
-                    ).one_or_none()
-                    if ai:
-                        access_userid = ai.USERID
-
-                if not access_userid and device_userid:
-                    mapped = badge_to_userid.get(device_userid)
-                    if mapped:
-                        access_userid = mapped
-
-                # optionally auto-create AccessUserInfo rows
-                if not access_userid and AUTO_CREATE_USERINFO and device_userid:
-                    try:
-                        created = upsert_access_userinfo(db.session, device_userid, device_userid, name=AUTO_CREATE_USERINFO_NAME, sn=sn_val, source="auto_create")
-                        if created:
-                            access_userid = created.USERID
-                            badge_to_userid[str(device_userid)] = access_userid
-                    except Exception:
-                        access_userid = None
-
-                # fallback to using device_userid as USERID for replicas
-                if not access_userid and ALLOW_INSERT_RAW_BADGE and device_userid:
-                    access_userid = device_userid
+                # dedupe on content (serial, USERID, time, status), not on the resettable record id
+                row = attendance_row(device.id, rid, device_userid, None, rec.timestamp, status_str, sn=key_sn)
+                if seen is not None and seen.contains(natural_key_int(row["natural_key"]), timestamp_order(rec.timestamp)):
+                    continue
 
-                # optionally create central user+badge
-                if not badge_obj and AUTO_CREATE_USERS_FROM_BADGES and device_userid:
+                cached = resolved_cache.get(device_userid)
+                if cached is not None:
+                    badge_id, access_userid = cached
+                else:
+                    # resolve canonical badge via helper
+                    badge_obj = None
                     try:
-                        created_badge = ensure_user_and_badge(
-                            db.session,
-                            badgenumber=device_userid,
-                            name=None,
-                            branch_id=getattr(device, "branch_id", None),
-                            device_id=getattr(device, "id", None),
-                            default_user_name=AUTO_CREATE_USERS_NAME
-                        )
-                        if created_badge:
-                            badge_obj = created_badge
-                            badge_id = created_badge.id
+                        badge_obj = get_badge_for_device_userid(db.session, device_userid, sn=sn_val)
                     except Exception:
                         badge_obj = None
-                        badge_id = None
 
-                if not badge_obj and not access_userid and device_userid:
-                    unmapped_badges.add(device_userid)
+                    badge_id = badge_obj.id if badge_obj else None
+                    badge_number = badge_obj.badge_number if badge_obj else None
+
+                    # compute access_userid via replica AccessUserInfo
+                    access_userid = None
+                    if badge_number:
+                        ai = db.session.query(AccessUserInfo).filter(
+                            AccessUserInfo.Badgenumber == badge_number,
+                            AccessUserInfo.sn == sn_val
+                        ).one_or_none()
+                        if ai:
+                            access_userid = ai.USERID
+
+                    if not access_userid and device_userid:
+                        mapped = badge_to_userid.get(device_userid)
+                        if mapped:
+                            access_userid = mapped
+
+                    # optionally auto-create AccessUserInfo rows
+                    if not access_userid and AUTO_CREATE_USERINFO and device_userid:
+                        try:
+                            created = upsert_access_userinfo(db.session, device_userid, device_userid, name=AUTO_CREATE_USERINFO_NAME, sn=sn_val, source="auto_create")
+                            if created:
+                                access_userid = created.USERID
+                                badge_to_userid[str(device_userid)] = access_userid
+                        except Exception:
+                            access_userid = None
+
+                    # fallback to using device_userid as USERID for replicas
+                    if not access_userid and ALLOW_INSERT_RAW_BADGE and device_userid:
+                        access_userid = device_userid
+
+                    # optionally create central user+badge
+                    if not badge_obj and AUTO_CREATE_USERS_FROM_BADGES and device_userid:
+                        try:
+                            created_badge = ensure_user_and_badge(
+                                db.session,
+                                badgenumber=device_userid,
+                                name=None,
+                                branch_id=getattr(device, "branch_id", None),
+                                device_id=getattr(device, "id", None),
+                                default_user_name=AUTO_CREATE_USERS_NAME
+                            )
+                            if created_badge:
+                                badge_obj = created_badge
+                                badge_id = created_badge.id
+                        except Exception:
+                            badge_obj = None
+                            badge_id = None
+
+                    resolved_cache[device_userid] = (badge_id, access_userid)
+
+                if not badge_id and not access_userid and device_userid:
+                    u = unmapped_badges.get(device_userid)
+                    if u is None:
+                        unmapped_badges[device_userid] = [1, rec.timestamp, rec.timestamp]
+                    else:
+                        u[0] += 1
+                        u[1] = min(u[1], rec.timestamp)
+                        u[2] = max(u[2], rec.timestamp)
 
-                # Build CheckinOut replica row
                 co_userid = access_userid if access_userid else device_userid
-                co = CheckinOut(
-                    USERID=str(co_userid),
-                    CHECKTIME=rec.timestamp,
-                    CHECKTYPE=status_str,
-                    VERIFYCODE="1",
-                    SENSORID="1",
-                    Memoinfo="FLASK",
-                    WorkCode="FLASK",
-                    sn=sn_val
-                )
-                checkinout_rows.append(co)
-                rec_meta[rid] = (rec.timestamp.isoformat() if hasattr(rec.timestamp, 'isoformat') else str(rec.timestamp),
-                                 co_userid, status_str)
+                audit_rows.append((rid, rec.timestamp.isoformat() if hasattr(rec.timestamp, 'isoformat') else str(rec.timestamp),
+                                   co_userid, status_str, sn_val))
 
                 # central AttendanceLog
-                log_entry = AttendanceLog(
-                    device_id=device.id,
-                    record_id=rid,
-                    user_id=device_userid,
-                    device_userid=device_userid,
-                    badge_id=badge_id,
-                    timestamp=rec.timestamp,
-                    status=status_str
-                )
-                attendance_rows.append(log_entry)
+                row["badge_id"] = badge_id
+                row["access_userid"] = co_userid
+                attendance_rows.append(row)
                 new_count += 1
 
-                console_emit(Fore.GREEN + f"    [NEW ✅] RID {rid}, User={device_userid}, Time={rec.timestamp}",
-                             level="new", device=device)
+                bus.count(device, "new", sample=f"RID {rid}, User={device_userid}, Time={rec.timestamp}")
 
-            # write unmapped badges CSV for review
-            if unmapped_badges:
-                try:
-                    with open(csv_unmapped_fn, "a", encoding="utf-8") as uh:
-                        uh.write("badge\n")
-                        for b in sorted([x for x in unmapped_badges if x]):
-                            uh.write(f"{b}\n")
-                    console_emit(Fore.YELLOW + f"    [UNMAPPED] Wrote {len(unmapped_badges)} badges to {csv_unmapped_fn}", level="warning", device=device)
-                except Exception:
-                    pass
+            if expired:
+                console_emit(Fore.WHITE + f"    [RETENTION] skipped {expired} punches older than {retention_cutoff:%Y-%m-%d}", level="debug", device=device)
 
-            # commit both replica CheckinOut and AttendanceLog
+            # audit output (insert CSV + unmapped badge store) is written by the audit thread
             try:
-                insert_start = time.time()
-                if attendance_rows:
-                    db.session.add_all(attendance_rows)
-                if checkinout_rows:
-                    db.session.add_all(checkinout_rows)
-                db.session.commit()
-                insert_elasped = time.time() - insert_start
-                console_emit(Fore.WHITE + f"[FLASK DB] Committed {len(attendance_rows)} AttendanceLog and {len(checkinout_rows)} CheckinOut rows from {device.name} in {insert_elasped:.2f}s", level="info", device=device)
+                audit = get_audit_writer(current_app._get_current_object())
+                if current_app.config.get("AUDIT_INSERTS_ENABLED", True):
+                    audit.write_rows(INSERTS_STREAM, sn_val, audit_rows, header=INSERTS_HEADER)
+                if unmapped_badges:
+                    audit.record_unmapped(sn_val, device.id, {b: tuple(v) for b, v in unmapped_badges.items()})
+                    console_emit(Fore.YELLOW + f"    [UNMAPPED] {len(unmapped_badges)} badges queued for the unmapped badge store", level="warning", device=device)
             except Exception as e:
+                console_emit(Fore.YELLOW + f"    [AUDIT WARN] {e}", level="warning", device=device)
+
+            # hand the AttendanceLog rows (plus the serial_no fix-up) to the writer;
+            # the unique natural_key drops anything another worker already wrote
+            set_serial = (not getattr(device, "serial_no", None)) and bool(sn_val) and not _is_probably_ip(sn_val)
+            batch = IngestBatch(device.id, device_name=device.name, sn=sn_val,
+                                attendance_rows=attendance_rows, set_serial=set_serial)
+            if current_app.config.get("INGEST_WRITE_BEHIND", True):
                 try:
-                    db.session.rollback()
-                except Exception:
-                    pass
-                console_emit(Fore.RED + f"[FLASK DB ERROR] Commit failed: {e}", level="error", device=device)
-
-            # persist serial_no to device if sensible
-            try:
-                if (not getattr(device, "serial_no", None)) and sn_val and not _is_probably_ip(sn_val):
-                    device.serial_no = sn_val
-                    db.session.add(device)
-                    db.session.commit()
-                    console_emit(Fore.CYAN + f"    [DEVICE UPDATE] saved serial_no={sn_val} for device {device.name}", level="debug", device=device)
-            except Exception:
+                    writer = get_ingest_writer(current_app._get_current_object())
+                    writer.submit(batch)
+                    stats = writer.stats()
+                    console_emit(Fore.WHITE + f"[FLASK DB] Queued {len(attendance_rows)} AttendanceLog rows from {device.name} (queue={stats['queue_rows']} rows)", level="info", device=device)
+                except Exception as e:
+                    new_count = 0
+                    console_emit(Fore.RED + f"[FLASK DB ERROR] Could not queue batch: {e}", level="error", device=device)
+            else:
                 try:
-                    db.session.rollback()
-                except Exception:
-                    pass
+                    insert_start = time.time()
+                    new_count = write_batches(db.session, [batch], chunk_size=INSERT_CHUNK,
+                                              savepoint_rows=current_app.config.get("INGEST_SAVEPOINT_ROWS", INSERT_CHUNK),
+                                              rollups=current_app.config.get("ROLLUPS_ENABLED", True),
+                                              archive_dir=rollup_archive_dir(current_app))
+                    db.session.commit()
+                    mark_batches_seen([batch])
+                    notify_live_export(current_app._get_current_object(), [batch])
+                    insert_elasped = time.time() - insert_start
+                    console_emit(Fore.WHITE + f"[FLASK DB] Committed {batch.inserted} AttendanceLog rows from {device.name} in {insert_elasped:.2f}s", level="info", device=device)
+                except Exception as e:
+                    try:
+                        db.session.rollback()
+                    except Exception:
+                        pass
+                    console_emit(Fore.RED + f"[FLASK DB ERROR] Commit failed: {e}", level="error", device=device)
+
+            if set_serial:
+                console_emit(Fore.CYAN + f"    [DEVICE UPDATE] saving serial_no={sn_val} for device {device.name}", level="debug", device=device)
 
             console_emit(Fore.MAGENTA + f"[SUCCESS ✅]", level="info", device=device)
 
@@ -477,6 +476,7 @@ def fetch_and_forward_for_device(device, inspect_only=False):
             except Exception:
                 pass
             console_emit(Fore.RED + f"[DISCONNECTED] {device.name}", level="info", device=device)
+        bus.finish(device)
 
         if inspect_only and 'snapshot' in locals() and snapshot:
             fn = f"zk_snapshot_{device.name.replace(' ', '_')}_{datetime.now():%Y%m%d_%H%M%S}.json"
@@ -1,6 +1,17 @@
 # app/views/admin.py
-from flask import Blueprint, jsonify, current_app
+from flask import Blueprint, jsonify, current_app, request
 from app.exporter import export_attendance_direct
+from app.projection import project_checkinout
+from app.ingest import backfill_natural_keys
+from app.seen_index import invalidate_seen_index
+from app.partitions import maintain_partitions, list_partitions, PARTITIONED_TABLES
+from app.archive import run_archive, load_manifest, archive_dir_for
+from app.rollups import rebuild_rollups, rollup_archive_dir
+from app.counters import reconcile_log_counters
+from app.replica import probe_replica
+from app.retention import start_retention_job, RETENTION_TABLES
+from app.scheduler import start_export_job, _EXPORT_LOCK
+from app.extensions import db
 from colorama import Fore
 import traceback
 
@@ -24,3 +35,164 @@ def trigger_export():
         tb = traceback.format_exc()
         print(Fore.RED + f"[ADMIN ERROR] Manual export failed: {e}\n{tb}")
         return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/export/enddb/bulk")
+def trigger_bulk_export():
+    """Backfill the end DB through bulk files (LOAD DATA LOCAL INFILE on MySQL) as a background job."""
+    try:
+        if _EXPORT_LOCK.locked():
+            return jsonify({"status": "error", "error": "export already running"}), 409
+        job_id = start_export_job(current_app._get_current_object(), background=True, bulk=True)
+        print(Fore.GREEN + f"[ADMIN] bulk export job started: {job_id}")
+        return jsonify({"status": "ok", "job_id": job_id}), 202
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] bulk export failed to start: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/projection/checkinout")
+def trigger_checkinout_projection():
+    try:
+        batch_size = current_app.config.get("CHECKINOUT_PROJECTION_BATCH", 5000)
+        result = project_checkinout(batch_size=batch_size)
+        print(Fore.GREEN + f"[ADMIN] access_checkinout projection finished. {result}")
+        return jsonify({"status": "ok", "result": result})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] access_checkinout projection failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/backfill/natural-keys")
+def trigger_natural_key_backfill():
+    try:
+        chunk = current_app.config.get("NATURAL_KEY_BACKFILL_CHUNK", 5000)
+        sleep = current_app.config.get("NATURAL_KEY_BACKFILL_SLEEP_SECONDS", 0.0)
+        result = backfill_natural_keys(chunk_size=chunk, sleep_seconds=sleep,
+                                       rollups=current_app.config.get("ROLLUPS_ENABLED", True),
+                                       archive_dir=rollup_archive_dir(current_app))
+        invalidate_seen_index()
+        print(Fore.GREEN + f"[ADMIN] natural_key backfill finished. {result}")
+        return jsonify({"status": "ok", "result": result})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] natural_key backfill failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/partitions/maintain")
+def trigger_partition_maintenance():
+    try:
+        result = maintain_partitions(
+            months_ahead=current_app.config.get("PARTITION_MONTHS_AHEAD", 3),
+            retention=current_app.config.get("PARTITION_RETENTION_MONTHS"),
+            chunk_size=current_app.config.get("PARTITION_RETENTION_CHUNK", 5000),
+        )
+        print(Fore.GREEN + f"[ADMIN] partition maintenance finished. {result}")
+        return jsonify({"status": "ok", "result": result})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] partition maintenance failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.get("/partitions")
+def get_partitions():
+    try:
+        with db.engine.connect() as conn:
+            result = {t: [{"name": n, "rows": r} for n, r in list_partitions(conn, t)] for t in PARTITIONED_TABLES}
+        return jsonify({"status": "ok", "dialect": db.engine.dialect.name, "result": result})
+    except Exception as e:
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/archive/run")
+def trigger_archive():
+    try:
+        result = run_archive(
+            archive_dir_for(current_app),
+            current_app.config.get("ARCHIVE_AFTER_MONTHS", 6),
+            chunk_size=current_app.config.get("ARCHIVE_CHUNK", 5000),
+            sleep_seconds=current_app.config.get("ARCHIVE_SLEEP_SECONDS", 0.0),
+        )
+        print(Fore.GREEN + f"[ADMIN] archive run finished: {result['archived']} file(s), {result['rows']} rows")
+        return jsonify({"status": "ok", "result": result})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] archive run failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.get("/archive/manifest")
+def get_archive_manifest():
+    try:
+        return jsonify({"status": "ok", "result": load_manifest(archive_dir_for(current_app))})
+    except Exception as e:
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/rollups/rebuild")
+def trigger_rollup_rebuild():
+    """Body (optional): {"start": "YYYY-MM-DD", "end": "YYYY-MM-DD"}; default is all history."""
+    try:
+        body = request.get_json(silent=True) or {}
+        result = rebuild_rollups(
+            start_day=body.get("start"),
+            end_day=body.get("end"),
+            archive_dir=rollup_archive_dir(current_app),
+            sleep_seconds=current_app.config.get("ROLLUPS_REBUILD_SLEEP_SECONDS", 0.0),
+        )
+        print(Fore.GREEN + f"[ADMIN] rollup rebuild finished. {result}")
+        return jsonify({"status": "ok", "result": result})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] rollup rebuild failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/counters/reconcile")
+def trigger_counter_reconcile():
+    """Body (optional): {"device_ids": [..]}; default is every device and branch."""
+    try:
+        body = request.get_json(silent=True) or {}
+        result = reconcile_log_counters(
+            archive_dir=rollup_archive_dir(current_app),
+            device_ids=body.get("device_ids"),
+        )
+        return jsonify({"status": "ok", "result": result})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] counter reconcile failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+@bp.post("/retention/run")
+def trigger_retention():
+    """Body (optional): {"tables": [..]}; default is every table with a RETENTION_POLICIES keep_days."""
+    try:
+        body = request.get_json(silent=True) or {}
+        tables = body.get("tables")
+        unknown = [t for t in tables or [] if t not in RETENTION_TABLES]
+        if unknown:
+            return jsonify({"status": "error", "error": f"unknown table(s): {unknown}"}), 400
+        job_id = start_retention_job(current_app._get_current_object(), tables=tables)
+        if job_id is None:
+            return jsonify({"status": "error", "error": "retention already running"}), 409
+        print(Fore.GREEN + f"[ADMIN] retention job started: {job_id}")
+        return jsonify({"status": "ok", "job_id": job_id}), 202
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] retention failed to start: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+@bp.get("/replica")
+def replica_health():
+    """Probe the read replica now: reachability, lag and whether reports are routed to it."""
+    try:
+        return jsonify({"status": "ok", "result": probe_replica(current_app)})
+    except Exception as e:
+        tb = traceback.format_exc()
+        print(Fore.RED + f"[ADMIN ERROR] replica probe failed: {e}\n{tb}")
+        return jsonify({"status": "error", "error": str(e)}), 500
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
-from ..models import Branch, Device, AttendanceLog
+from ..models import Branch, Device
 from .. import db
+from ..seen_index import invalidate_seen_index
+from ..counters import branch_log_counts, forget_branch, forget_device, move_device
+from ..replica import reads_from_replica
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import func
 from zk import ZK
@@ -11,18 +14,14 @@ bp = Blueprint('devices', __name__)
 # Branch list + create
 # -----------------------
 @bp.route('/', methods=['GET'])
+@reads_from_replica
 def list_branches():
     branches = Branch.query.all()
 
     devices_counts = dict(db.session.query(Device.branch_id, func.count(Device.id)).group_by(Device.branch_id).all())
 
-    logs_counts = dict(
-        db.session.query(Branch.id, func.count(AttendanceLog.id))
-        .join(Branch.devices)
-        .join(Device.logs)
-        .group_by(Branch.id)
-        .all()
-    )
+    # maintained by ingest/delete paths (app/counters.py), not counted from attendance_logs
+    logs_counts = branch_log_counts(db.session)
 
     result = []
     for b in branches:
@@ -81,8 +80,10 @@ def delete_branch(branch_id):
     branch = Branch.query.get_or_404(branch_id)
     try:
         # If your relationship is configured with cascade deletes, this will remove devices/logs too.
+        forget_branch(db.session, branch.id)
         db.session.delete(branch)
         db.session.commit()
+        invalidate_seen_index()
         return jsonify({'success': True}), 200
     except Exception as e:
         db.session.rollback()
@@ -178,6 +179,7 @@ def update_device(device_id):
     d.serial_no = data.get('serial_no', d.serial_no)
     # optional: allow branch move (only if provided)
     if 'branch_id' in data:
+        move_device(db.session, d.id, d.branch_id, data.get('branch_id'))
         d.branch_id = data.get('branch_id')
 
     try:
@@ -202,8 +204,10 @@ def update_device(device_id):
 def delete_device(device_id):
     d = Device.query.get_or_404(device_id)
     try:
+        forget_device(db.session, d.id)
         db.session.delete(d)
         db.session.commit()
+        invalidate_seen_index(device_id)
         return jsonify({'success': True}), 200
     except Exception as e:
         db.session.rollback()
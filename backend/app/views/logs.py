@@ -4,15 +4,54 @@ from sqlalchemy import or_, cast, String, desc, asc, func
 from sqlalchemy.orm import joinedload
 from datetime import datetime, time, timedelta
 from typing import Optional, Dict, Any
+import math
 
-from ..models import Device, AttendanceLog, Badge
+from ..models import Device, AttendanceLog, Badge, UnmappedBadge, BadgeDailyRollup, DeviceDailyRollup
 from .. import db
 from ..tasks import fetch_and_forward_for_device
+from ..seen_index import invalidate_seen_index
+from ..archive import ArchiveReader, ARCHIVE_COLUMNS, archive_dir_for, purge_device_rows
+from ..rollups import refresh_rollups, rollup_archive_dir, rollups_ready
+from ..retention import purge_rows, purge_settings
+from ..counters import apply_log_deltas
+from ..replica import reads_from_replica
 from zk.exception import ZKNetworkError
 
 bp = Blueprint("logs", __name__)
 
 # ---------- helpers ----------
+# attendance_logs is range-partitioned by month on `timestamp` (app/partitions.py): filter it with
+# plain half-open ranges on the column (never wrapped in DATE()/CAST) so MySQL can prune partitions.
+def _ts_range(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """timestamp >= start AND timestamp < end (either bound optional)."""
+    cond = []
+    if start is not None:
+        cond.append(AttendanceLog.timestamp >= start)
+    if end is not None:
+        cond.append(AttendanceLog.timestamp < end)
+    return cond
+
+
+def _day_range(d):
+    """[00:00 of d, 00:00 of the next day)."""
+    start = datetime.combine(d, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _date_search_range(q_text: str):
+    """A free-text search that is a date (YYYY-MM-DD) or month (YYYY-MM) as a [start, end) range."""
+    s = q_text.strip()
+    try:
+        if len(s) == 10:
+            return _day_range(datetime.strptime(s, "%Y-%m-%d").date())
+        if len(s) == 7:
+            start = datetime.strptime(s, "%Y-%m")
+            return start, datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    except ValueError:
+        pass
+    return None
+
+
 def _parse_iso(dt_str: Optional[str]):
     """Tolerant parser: accepts YYYY-MM-DD, YYYY-MM-DDTHH:MM[:SS][.ms][Z]."""
     if not dt_str:
@@ -153,7 +192,7 @@ def _build_query(params: Dict[str, Any], *, force_device_id: Optional[int] = Non
             debug_counts["after_user"] = _count(query)
 
     if status:
-        query = query.filter(AttendanceLog.status.ilike(f"%{status}%"))
+        query = query.filter(cast(AttendanceLog.status, String).ilike(f"%{status}%"))
         if debug:
             debug_counts["after_status"] = _count(query)
 
@@ -162,7 +201,7 @@ def _build_query(params: Dict[str, Any], *, force_device_id: Optional[int] = Non
         dt_from = _parse_iso(from_ts)
         if dt_from:
             applied_from = dt_from.isoformat()
-            query = query.filter(AttendanceLog.timestamp >= dt_from)
+            query = query.filter(*_ts_range(start=dt_from))
             if debug:
                 debug_counts["after_from"] = _count(query)
 
@@ -171,14 +210,22 @@ def _build_query(params: Dict[str, Any], *, force_device_id: Optional[int] = Non
         if dt_to:
             # if only a date string (YYYY-MM-DD) was provided, include the full day (end of day)
             if len(str(to_ts).strip()) == 10:
-                dt_to = datetime.combine(dt_to.date(), time.max)
-            applied_to = dt_to.isoformat()
-            query = query.filter(AttendanceLog.timestamp <= dt_to)
+                applied_to = datetime.combine(dt_to.date(), time.max).isoformat()
+                query = query.filter(*_ts_range(end=_day_range(dt_to.date())[1]))
+            else:
+                applied_to = dt_to.isoformat()
+                query = query.filter(AttendanceLog.timestamp <= dt_to)
             if debug:
                 debug_counts["after_to"] = _count(query)
 
     # free-text search across common fields
-    if q_text:
+    date_range = _date_search_range(q_text) if q_text else None
+    if date_range:
+        # a date/month typed into the search box matches punches on that day/month
+        query = query.filter(*_ts_range(*date_range))
+        if debug:
+            debug_counts["after_q"] = _count(query)
+    elif q_text:
         pattern = f"%{q_text}%"
         query = query.filter(
             or_(
@@ -188,7 +235,7 @@ def _build_query(params: Dict[str, Any], *, force_device_id: Optional[int] = Non
                 AttendanceLog.user_id.ilike(pattern),
                 getattr(AttendanceLog, "device_userid", "").ilike(pattern),
                 cast(AttendanceLog.timestamp, String).ilike(pattern),
-                AttendanceLog.status.ilike(pattern),
+                cast(AttendanceLog.status, String).ilike(pattern),
                 cast(AttendanceLog.created_at, String).ilike(pattern),
             )
         )
@@ -197,11 +244,129 @@ def _build_query(params: Dict[str, Any], *, force_device_id: Optional[int] = Non
 
     # sort
     sort_col = getattr(AttendanceLog, sort_by, AttendanceLog.timestamp)
+    if sort_by == "status":
+        # stored as SMALLINT; keep the text ordering the API has always used
+        sort_col = cast(AttendanceLog.status, String)
     query = query.order_by(asc(sort_col) if sort_dir == "asc" else desc(sort_col))
 
     return query, debug_counts, applied_from, applied_to
 
 
+# ---------- cold archive (app/archive.py) ----------
+def _requested_range(params: Dict[str, Any]):
+    """(start, end, end_inclusive) asked for by from/to and by a date typed into q."""
+    start = _parse_iso(params["from_ts"]) if params["from_ts"] else None
+    end, end_inclusive = None, False
+    dt_to = _parse_iso(params["to_ts"]) if params["to_ts"] else None
+    if dt_to:
+        if len(str(params["to_ts"]).strip()) == 10:
+            end = _day_range(dt_to.date())[1]
+        else:
+            end, end_inclusive = dt_to, True
+    q_range = _date_search_range(params["q_text"]) if params["q_text"] else None
+    if q_range:
+        start = max(start, q_range[0]) if start else q_range[0]
+        if end is None or q_range[1] <= end:
+            end, end_inclusive = q_range[1], False
+    return start, end, end_inclusive
+
+
+def _archive_reader(params: Dict[str, Any], *, force_device_id: Optional[int] = None):
+    """
+    Archived rows matching the same filters as _build_query, or None when the
+    requested range covers no archived month. Listings with neither bound stay
+    on the hot table; a `to` alone reads every archived month up to it.
+    """
+    start, end, end_inclusive = _requested_range(params)
+    if start is None and end is None:
+        return None
+    overlap_end = end + timedelta(microseconds=1) if end is not None and end_inclusive else end
+    reader = ArchiveReader(archive_dir_for(current_app), start, overlap_end, params["branch_id"])
+    if not reader.entries:
+        return None
+    reader.filter_range(start, end, end_inclusive)
+    device_id = force_device_id if force_device_id is not None else params["device_id"]
+    if device_id is not None:
+        reader.filter_device(device_id)
+    if params["user_id"]:
+        reader.filter_user(params["user_id"])
+    if params["status"]:
+        reader.filter_status(params["status"])
+    if params["q_text"] and not _date_search_range(params["q_text"]):
+        reader.filter_text(params["q_text"])
+    return reader
+
+
+def _exclude_hot_leftovers(query, reader):
+    """Rows an interrupted archive run left in the hot table are served from the hot side only."""
+    lo = min(e["min_id"] for e in reader.entries)
+    hi = max(e["max_id"] for e in reader.entries)
+    ids = query.order_by(None).with_entities(AttendanceLog.id).filter(AttendanceLog.id.between(lo, hi)).all()
+    reader.exclude_ids([i for (i,) in ids])
+
+
+def _serialize_archived(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": r["id"],
+        "device_id": r["device_id"],
+        "record_id": r["record_id"],
+        "user_id": r["user_id"],
+        "device_userid": r["device_userid"],
+        "badge_id": r["badge_id"],
+        "badge_number": r["badge_number"],
+        "timestamp": r["timestamp"].isoformat() if r["timestamp"] else None,
+        "status": r["status"],
+        "created_at": r["created_at"].isoformat() if r["created_at"] else None,
+        "device": {"id": r["device_id"], "name": r["device_name"]},
+    }
+
+
+class _MergedPage:
+    """The parts of Flask-SQLAlchemy's Pagination the endpoints use, for hot + archived rows."""
+
+    def __init__(self, total, page, per_page):
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+        self.pages = int(math.ceil(total / float(per_page))) if total else 0
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+
+
+def _sort_key(v):
+    # NULLs sort lowest, as in MySQL/SQLite
+    return (0, 0) if v is None else (1, v)
+
+
+def _paginate(query, params: Dict[str, Any], reader=None):
+    """(pagination, serialized items) over the hot query, merged with archived rows when given."""
+    if reader is None or not len(reader):
+        pag = query.paginate(page=params["page"], per_page=params["per_page"], error_out=False)
+        return pag, [_serialize_log(l) for l in pag.items]
+
+    _exclude_hot_leftovers(query, reader)
+    page, per_page = max(params["page"], 1), params["per_page"]
+    need = page * per_page
+    sort_by = params["sort_by"] if params["sort_by"] in ARCHIVE_COLUMNS else "timestamp"
+    descending = params["sort_dir"] != "asc"
+
+    hot_total = query.order_by(None).count()
+    merged = [(_sort_key(getattr(l, sort_by, None)), _serialize_log(l)) for l in query.limit(need).all()]
+    merged += [(_sort_key(r[sort_by]), _serialize_archived(r))
+               for r in reader.rows(reader.sorted_indices(sort_by, descending)[:need])]
+    merged.sort(key=lambda x: x[0], reverse=descending)
+    items = [item for _, item in merged[(page - 1) * per_page:need]]
+    return _MergedPage(hot_total + len(reader), page, per_page), items
+
+
+def _merge_counts(*dicts):
+    out = {}
+    for d in dicts:
+        for k, v in d.items():
+            out[k] = out.get(k, 0) + int(v)
+    return out
+
+
 # ---------- endpoints ----------
 
 # poll endpoint (unchanged)
@@ -220,13 +385,14 @@ def poll_device(device_id):
 # GET /logs (supports page/per_page, user_id or badge, device_id, from/to, q, sort, include_aggregates)
 @bp.route("", methods=["GET"])
 @bp.route("/", methods=["GET"])
+@reads_from_replica
 def get_logs():
     try:
         params = _extract_common_params()
         query, debug_counts, applied_from, applied_to = _build_query(params)
+        archived = _archive_reader(params)
 
-        pag = query.paginate(page=params["page"], per_page=params["per_page"], error_out=False)
-        items = [_serialize_log(l) for l in pag.items]
+        pag, items = _paginate(query, params, archived)
 
         resp = {
             "applied_filters": {
@@ -255,7 +421,12 @@ def get_logs():
             # reapply same filters to dev_q by reusing _build_query logic with subquery filters:
             # easiest: use the filtered query's subquery to aggregate
             subq = query.with_entities(AttendanceLog.id, AttendanceLog.device_id).subquery()
-            dev_counts = db.session.query(subq.c.device_id, func.count(subq.c.device_id).label("cnt")).group_by(subq.c.device_id).order_by(desc("cnt")).limit(top_n).all()
+            dev_q = db.session.query(subq.c.device_id, func.count(subq.c.device_id).label("cnt")).group_by(subq.c.device_id).order_by(desc("cnt"))
+            if archived is not None:
+                merged = _merge_counts(dict(dev_q.all()), archived.count_by("device_id"))
+                dev_counts = sorted(merged.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+            else:
+                dev_counts = dev_q.limit(top_n).all()
             total_by_device = []
             for did, cnt in dev_counts:
                 dev_obj = Device.query.get(did)
@@ -275,6 +446,7 @@ def get_logs():
 # GET logs for specific device (keeps your 'today default' behavior)
 @bp.route("/device/<int:device_id>", methods=["GET"])
 @bp.route("/device/<int:device_id>/", methods=["GET"])
+@reads_from_replica
 def get_logs_for_device(device_id: int):
     try:
         params = _extract_common_params()
@@ -283,15 +455,11 @@ def get_logs_for_device(device_id: int):
         # default to today's records if no from/to
         if not params["from_ts"] and not params["to_ts"]:
             today = datetime.today().date()
-            query = query.filter(
-                AttendanceLog.timestamp >= datetime.combine(today, time.min),
-                AttendanceLog.timestamp <= datetime.combine(today, time.max)
-            )
+            query = query.filter(*_ts_range(*_day_range(today)))
             if params["debug"]:
                 debug_counts["after_default_today"] = _count(query)
 
-        pag = query.paginate(page=params["page"], per_page=params["per_page"], error_out=False)
-        items = [_serialize_log(l) for l in pag.items]
+        pag, items = _paginate(query, params, _archive_reader(params, force_device_id=device_id))
 
         resp = {
             "applied_filters": {
@@ -323,6 +491,7 @@ def get_logs_for_device(device_id: int):
 
 # convenience: fetch logs for a user/badge (paged)
 @bp.route("/user/<string:badge>", methods=["GET"])
+@reads_from_replica
 def get_logs_for_user(badge: str):
     try:
         params = _extract_common_params()
@@ -330,8 +499,7 @@ def get_logs_for_user(badge: str):
         params["user_id"] = badge
         query, debug_counts, applied_from, applied_to = _build_query(params)
 
-        pag = query.paginate(page=params["page"], per_page=params["per_page"], error_out=False)
-        items = [_serialize_log(l) for l in pag.items]
+        pag, items = _paginate(query, params, _archive_reader(params))
 
         resp = {
             "applied_filters": {"user_id": badge, "from_ts": params["from_ts"], "to_ts": params["to_ts"]},
@@ -352,8 +520,124 @@ def get_logs_for_user(badge: str):
         return jsonify({"error": "internal", "message": str(e)}), 500
 
 
+# unmapped badges seen by the poller (badge, serial, first/last seen, count), paged
+@bp.route("/unmapped", methods=["GET"])
+@reads_from_replica
+def get_unmapped_badges():
+    try:
+        page = request.args.get("page", 1, type=int) or 1
+        per_page = min(request.args.get("per_page", current_app.config.get("LOGS_PER_PAGE", 25), type=int) or 25, 1000)
+        query = UnmappedBadge.query
+
+        badge = request.args.get("badge", type=str)
+        if badge:
+            query = query.filter(UnmappedBadge.badge.like(f"{badge.strip()}%"))
+        sn = request.args.get("sn", type=str)
+        if sn:
+            query = query.filter(UnmappedBadge.sn == sn.strip())
+        device_id = request.args.get("device_id", type=int)
+        if device_id:
+            query = query.filter(UnmappedBadge.device_id == device_id)
+        since = _parse_iso(request.args.get("since"))
+        if since:
+            query = query.filter(UnmappedBadge.last_seen >= since)
+
+        sort_by = request.args.get("sort_by", "last_seen")
+        if sort_by not in ("last_seen", "first_seen", "seen_count", "badge", "sn"):
+            sort_by = "last_seen"
+        sort_col = getattr(UnmappedBadge, sort_by)
+        sort_dir = (request.args.get("sort_dir", "desc") or "desc").lower()
+        query = query.order_by(asc(sort_col) if sort_dir == "asc" else desc(sort_col))
+
+        pag = query.paginate(page=page, per_page=per_page, error_out=False)
+        items = [{
+            "id": u.id,
+            "badge": u.badge,
+            "sn": u.sn,
+            "device_id": u.device_id,
+            "first_seen": u.first_seen.isoformat() if u.first_seen else None,
+            "last_seen": u.last_seen.isoformat() if u.last_seen else None,
+            "seen_count": u.seen_count,
+        } for u in pag.items]
+        return jsonify({
+            "applied_filters": {"badge": badge, "sn": sn, "device_id": device_id, "since": request.args.get("since")},
+            "items": items,
+            "total": pag.total,
+            "page": pag.page,
+            "per_page": pag.per_page,
+            "pages": pag.pages,
+            "has_next": pag.has_next,
+            "has_prev": pag.has_prev,
+        }), 200
+    except Exception as e:
+        current_app.logger.exception("get_unmapped_badges failed")
+        return jsonify({"error": "internal", "message": str(e)}), 500
+
+
+def _stats_from_rollups(start_day, end_day, top_n):
+    """/stats aggregates from the daily rollup tables (app/rollups.py), which also cover archived months."""
+    in_days = DeviceDailyRollup.day.between(start_day, end_day)
+    by_date = [{"date": (d.isoformat() if hasattr(d, "isoformat") else str(d)), "count": int(cnt)}
+               for d, cnt in db.session.query(DeviceDailyRollup.day, func.sum(DeviceDailyRollup.punches))
+               .filter(in_days).group_by(DeviceDailyRollup.day).order_by(DeviceDailyRollup.day).all()]
+    total = sum(r["count"] for r in by_date)
+
+    top_users = [{"user": badge, "count": int(cnt)}
+                 for badge, cnt in db.session.query(BadgeDailyRollup.badge, func.sum(BadgeDailyRollup.punches).label("cnt"))
+                 .filter(BadgeDailyRollup.day.between(start_day, end_day))
+                 .group_by(BadgeDailyRollup.badge).order_by(desc("cnt")).limit(top_n).all()]
+
+    dev_rows = (db.session.query(DeviceDailyRollup.device_id, func.sum(DeviceDailyRollup.punches).label("cnt"))
+                .filter(in_days).group_by(DeviceDailyRollup.device_id).order_by(desc("cnt")).limit(top_n).all())
+    names = dict(db.session.query(Device.id, Device.name).filter(Device.id.in_([d for d, _ in dev_rows])).all()) if dev_rows else {}
+    top_devices = [{"device_id": device_id, "device_name": names.get(device_id), "count": int(cnt)}
+                   for device_id, cnt in dev_rows]
+    return total, by_date, top_users, top_devices
+
+
+# per-badge daily attendance summary (first in / last out) from the rollup table
+@bp.route("/daily", methods=["GET"])
+@reads_from_replica
+def get_daily_summary():
+    try:
+        page = request.args.get("page", 1, type=int) or 1
+        per_page = min(request.args.get("per_page", current_app.config.get("LOGS_PER_PAGE", 25), type=int) or 25, 1000)
+        badge = (request.args.get("badge") or request.args.get("user_id") or "").strip() or None
+        end_day = (_parse_iso(request.args.get("to")) or datetime.utcnow()).date()
+        start_day = (_parse_iso(request.args.get("from")) or datetime.combine(end_day - timedelta(days=6), time.min)).date()
+
+        q = BadgeDailyRollup.query.filter(BadgeDailyRollup.day.between(start_day, end_day))
+        if badge:
+            q = q.filter(BadgeDailyRollup.badge == badge)
+        q = q.order_by(BadgeDailyRollup.day.desc(), BadgeDailyRollup.badge.asc())
+        pag = q.paginate(page=page, per_page=per_page, error_out=False)
+        items = [{
+            "date": r.day.isoformat(),
+            "badge": r.badge,
+            "badge_id": r.badge_id,
+            "first_in": r.first_punch.isoformat() if r.first_punch else None,
+            "last_out": r.last_punch.isoformat() if r.last_punch else None,
+            "punches": r.punches,
+            "devices": r.devices,
+        } for r in pag.items]
+        return jsonify({
+            "applied_filters": {"badge": badge, "from": start_day.isoformat(), "to": end_day.isoformat()},
+            "items": items,
+            "total": pag.total,
+            "page": pag.page,
+            "per_page": pag.per_page,
+            "pages": pag.pages,
+            "has_next": pag.has_next,
+            "has_prev": pag.has_prev,
+        }), 200
+    except Exception as e:
+        current_app.logger.exception("get_daily_summary failed")
+        return jsonify({"error": "internal", "message": str(e)}), 500
+
+
 # stats endpoint for date-range aggregates (useful for comparison)
 @bp.route("/stats", methods=["GET"])
+@reads_from_replica
 def logs_stats():
     try:
         start_date = _parse_iso(request.args.get("start_date")) or (datetime.utcnow() - timedelta(days=10))
@@ -362,29 +646,68 @@ def logs_stats():
 
         s_dt = datetime.combine(start_date.date(), time.min) if isinstance(start_date, datetime) else datetime.utcnow() - timedelta(days=10)
         e_dt = datetime.combine(end_date.date(), time.max) if isinstance(end_date, datetime) else datetime.utcnow()
+        in_range = _ts_range(s_dt, _day_range(e_dt.date())[1])
 
-        total = db.session.query(func.count(AttendanceLog.id)).filter(AttendanceLog.timestamp.between(s_dt, e_dt)).scalar() or 0
+        # until a full rollup rebuild is recorded the rollups miss older history: count the base tables
+        if current_app.config.get("ROLLUPS_ENABLED", True) and rollups_ready():
+            total, by_date, top_users, top_devices = _stats_from_rollups(s_dt.date(), e_dt.date(), top_n)
+            return jsonify({
+                "start_date": s_dt.isoformat(),
+                "end_date": e_dt.isoformat(),
+                "total": int(total),
+                "by_date": by_date,
+                "top_users": top_users,
+                "top_devices": top_devices
+            }), 200
+
+        total = db.session.query(func.count(AttendanceLog.id)).filter(*in_range).scalar() or 0
+
+        # closed months moved to the cold archive are counted from the archive files
+        archived = ArchiveReader(archive_dir_for(current_app), s_dt, _day_range(e_dt.date())[1])
+        if archived.entries:
+            archived.filter_range(s_dt, _day_range(e_dt.date())[1])
+            hot_ids = db.session.query(AttendanceLog.id).filter(*in_range).filter(
+                AttendanceLog.id.between(min(e["min_id"] for e in archived.entries),
+                                         max(e["max_id"] for e in archived.entries))).all()
+            archived.exclude_ids([i for (i,) in hot_ids])
+            total += len(archived)
+        else:
+            archived = None
 
         q_by_date = db.session.query(
             func.date(AttendanceLog.timestamp).label("log_date"),
             func.count(AttendanceLog.id).label("cnt")
-        ).filter(AttendanceLog.timestamp.between(s_dt, e_dt)).group_by(func.date(AttendanceLog.timestamp)).order_by(func.date(AttendanceLog.timestamp))
-        by_date = [{ "date": (row.log_date.isoformat() if hasattr(row.log_date, "isoformat") else str(row.log_date)), "count": int(row.cnt)} for row in q_by_date.all()]
+        ).filter(*in_range).group_by(func.date(AttendanceLog.timestamp)).order_by(func.date(AttendanceLog.timestamp))
+        date_counts = {(row.log_date.isoformat() if hasattr(row.log_date, "isoformat") else str(row.log_date)): int(row.cnt)
+                       for row in q_by_date.all()}
+        if archived is not None:
+            date_counts = _merge_counts(date_counts, {d.isoformat(): c for d, c in archived.count_by("date").items()})
+        by_date = [{"date": d, "count": c} for d, c in sorted(date_counts.items())]
 
         q_top_users = db.session.query(
             AttendanceLog.user_id,
             func.count(AttendanceLog.id).label("cnt")
-        ).filter(AttendanceLog.timestamp.between(s_dt, e_dt)).group_by(AttendanceLog.user_id).order_by(desc("cnt")).limit(top_n)
-        top_users = [{ "user": row.user_id, "count": int(row.cnt)} for row in q_top_users.all()]
+        ).filter(*in_range).group_by(AttendanceLog.user_id).order_by(desc("cnt"))
+        if archived is not None:
+            user_counts = _merge_counts(dict(q_top_users.all()), archived.count_by("user_id"))
+            top_user_rows = sorted(user_counts.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+        else:
+            top_user_rows = q_top_users.limit(top_n).all()
+        top_users = [{ "user": user, "count": int(cnt)} for user, cnt in top_user_rows]
 
         q_top_devs = db.session.query(
             AttendanceLog.device_id,
             func.count(AttendanceLog.id).label("cnt")
-        ).filter(AttendanceLog.timestamp.between(s_dt, e_dt)).group_by(AttendanceLog.device_id).order_by(desc("cnt")).limit(top_n)
+        ).filter(*in_range).group_by(AttendanceLog.device_id).order_by(desc("cnt"))
+        if archived is not None:
+            dev_counts = _merge_counts(dict(q_top_devs.all()), archived.count_by("device_id"))
+            top_dev_rows = sorted(dev_counts.items(), key=lambda kv: kv[1], reverse=True)[:top_n]
+        else:
+            top_dev_rows = q_top_devs.limit(top_n).all()
         top_devices = []
-        for row in q_top_devs.all():
-            dev = Device.query.get(row.device_id)
-            top_devices.append({"device_id": row.device_id, "device_name": getattr(dev, "name", None) if dev else None, "count": int(row.cnt)})
+        for device_id, cnt in top_dev_rows:
+            dev = Device.query.get(device_id)
+            top_devices.append({"device_id": device_id, "device_name": getattr(dev, "name", None) if dev else None, "count": int(cnt)})
 
         return jsonify({
             "start_date": s_dt.isoformat(),
@@ -399,7 +722,24 @@ def logs_stats():
         return jsonify({"error": "internal", "message": str(e)}), 500
 
 
-# Delete endpoints (unchanged behavior)
+def _purge_device_logs(device_id, where, start, end):
+    """
+    Delete the device's rows matching `where` in primary-key chunks (app/retention.py), so the
+    table is never locked for the whole delete, then recompute the daily rollups it touched.
+    """
+    db.session.commit()  # end the read transaction so the rollup refresh sees the deletes
+    chunk_size, sleep_seconds = purge_settings(current_app, "attendance_logs")
+    try:
+        return purge_rows("attendance_logs", where, chunk_size=chunk_size, sleep_seconds=sleep_seconds)["deleted"]
+    finally:
+        invalidate_seen_index(device_id)
+        if start is not None and current_app.config.get("ROLLUPS_ENABLED", True):
+            refresh_rollups(db.session, start, end, badges=None, device_ids=[device_id],
+                            archive_dir=rollup_archive_dir(current_app))
+            db.session.commit()
+
+
+# Delete endpoints
 @bp.route("/device/<int:device_id>/logs", methods=["DELETE"])
 @bp.route("/device/<int:device_id>/logs/", methods=["DELETE"])
 def delete_logs_for_device(device_id: int):
@@ -412,15 +752,22 @@ def delete_logs_for_device(device_id: int):
                 "message": "Destructive action. To confirm deletion, call this endpoint with ?confirm=1"
             }), 400
 
-        q = AttendanceLog.__table__.delete().where(AttendanceLog.device_id == device_id)
-        res = db.session.execute(q)
-        db.session.commit()
-        deleted = res.rowcount if res.rowcount is not None else AttendanceLog.query.filter_by(device_id=device_id).count()
+        span = db.session.query(func.min(AttendanceLog.timestamp), func.max(AttendanceLog.timestamp)).filter(
+            AttendanceLog.device_id == device_id).one()
+        # archived months are rewritten without the device (counted like hot rows, see counters.py)
+        archived = purge_device_rows(archive_dir_for(current_app), device_id)
+        if archived["deleted"]:
+            with db.engine.begin() as conn:
+                apply_log_deltas(conn, {device_id: -archived["deleted"]})
+        start = min([t for t in (span[0], archived["first"]) if t is not None], default=None)
+        end = max([t for t in (span[1], archived["last"]) if t is not None], default=None)
+        deleted = _purge_device_logs(device_id, AttendanceLog.device_id == device_id, start, end)
 
         return jsonify({
             "device_id": device_id,
             "device_name": device.name,
-            "deleted": deleted
+            "deleted": deleted + archived["deleted"],
+            "archived_deleted": archived["deleted"]
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -443,14 +790,12 @@ def delete_today_logs_for_device(device_id: int):
         start_dt = datetime(today.year, today.month, today.day, 0, 0, 0)
         end_dt = start_dt + timedelta(days=1)
 
-        q = AttendanceLog.__table__.delete().where(
+        in_today = (
             (AttendanceLog.device_id == device_id) &
             (AttendanceLog.timestamp >= start_dt) &
             (AttendanceLog.timestamp < end_dt)
         )
-        res = db.session.execute(q)
-        db.session.commit()
-        deleted = res.rowcount if res.rowcount is not None else 0
+        deleted = _purge_device_logs(device_id, in_today, today, today)
 
         return jsonify({
             "device_id": device_id,
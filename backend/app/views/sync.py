@@ -1,8 +1,16 @@
 # views/sync.py
-from flask import Blueprint, jsonify, current_app
+from datetime import datetime
+from flask import Blueprint, jsonify, current_app, request
 from ..scheduler import start_poll_all_job, start_poll_branch_job, stop_recurring_scheduler
 from ..tasks import get_job_status
-from ..models import Branch
+from ..ingest import ingest_stats, retry_dead_letters
+from ..seen_index import seen_index_stats
+from ..events import get_event_bus
+from ..audit import audit_stats
+from ..live_export import live_export_stats
+from ..rollups import rollup_archive_dir
+from ..models import Branch, IngestDeadLetter, ExportRetry
+from ..extensions import db
 bp = Blueprint('sync', __name__)
 
 @bp.route('/', methods=['POST'])
@@ -36,3 +44,89 @@ def stop_sync():
     """
     stop_recurring_scheduler()
     return jsonify({'status': 'scheduler_stopped'}), 200
+
+@bp.route('/ingest', methods=['GET'])
+def ingest_metrics():
+    """
+    Write-behind ingest writer metrics: queue depth, commit latency, backpressure.
+    """
+    stats = ingest_stats() or {'running': False}
+    stats['seen_index'] = seen_index_stats()
+    stats['events'] = get_event_bus().stats()
+    stats['audit'] = audit_stats() or {'running': False}
+    stats['live_export'] = live_export_stats() or {'running': False}
+    return jsonify(stats), 200
+
+@bp.route('/dead-letters', methods=['GET'])
+def list_dead_letters():
+    """
+    Rows the ingest writer quarantined (newest first), with the database error for each.
+    """
+    page = request.args.get('page', 1, type=int) or 1
+    per_page = min(request.args.get('per_page', 50, type=int) or 50, 1000)
+    query = IngestDeadLetter.query
+    device_id = request.args.get('device_id', type=int)
+    if device_id:
+        query = query.filter(IngestDeadLetter.device_id == device_id)
+    pag = query.order_by(IngestDeadLetter.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    items = [{
+        'id': d.id,
+        'target_table': d.target_table,
+        'device_id': d.device_id,
+        'sn': d.sn,
+        'natural_key': d.natural_key,
+        'payload': d.payload,
+        'error': d.error,
+        'attempts': d.attempts,
+        'created_at': d.created_at.isoformat() if d.created_at else None,
+        'last_attempt_at': d.last_attempt_at.isoformat() if d.last_attempt_at else None,
+    } for d in pag.items]
+    return jsonify({'items': items, 'total': pag.total, 'page': pag.page, 'per_page': pag.per_page, 'pages': pag.pages}), 200
+
+@bp.route('/dead-letters/retry', methods=['POST'])
+def retry_dead_letter_rows():
+    """
+    Re-insert quarantined rows (body: {"ids": [...]} or empty for all), e.g. after a schema fix.
+    """
+    body = request.get_json(silent=True) or {}
+    result = retry_dead_letters(ids=body.get('ids'), limit=int(body.get('limit', 1000)),
+                                rollups=current_app.config.get('ROLLUPS_ENABLED', True),
+                                archive_dir=rollup_archive_dir(current_app))
+    return jsonify(result), 200
+
+@bp.route('/export-retries', methods=['GET'])
+def list_export_retries():
+    """
+    attendance_logs rows the exporter parked (?state=retry|dead), with the last end-DB error for each.
+    """
+    page = request.args.get('page', 1, type=int) or 1
+    per_page = min(request.args.get('per_page', 50, type=int) or 50, 1000)
+    query = ExportRetry.query
+    state = request.args.get('state')
+    if state:
+        query = query.filter(ExportRetry.state == state)
+    pag = query.order_by(ExportRetry.log_id).paginate(page=page, per_page=per_page, error_out=False)
+    items = [{
+        'log_id': r.log_id,
+        'state': r.state,
+        'attempts': r.attempts,
+        'next_attempt_at': r.next_attempt_at.isoformat() if r.next_attempt_at else None,
+        'error': r.error,
+        'created_at': r.created_at.isoformat() if r.created_at else None,
+        'updated_at': r.updated_at.isoformat() if r.updated_at else None,
+    } for r in pag.items]
+    return jsonify({'items': items, 'total': pag.total, 'page': pag.page, 'per_page': pag.per_page, 'pages': pag.pages}), 200
+
+@bp.route('/export-retries/requeue', methods=['POST'])
+def requeue_export_retries():
+    """
+    Put dead export rows back in line (body: {"log_ids": [...]} or empty for all dead rows); the next export retries them.
+    """
+    body = request.get_json(silent=True) or {}
+    query = ExportRetry.query.filter(ExportRetry.state == 'dead')
+    if body.get('log_ids'):
+        query = query.filter(ExportRetry.log_id.in_([int(i) for i in body['log_ids']]))
+    requeued = query.update({'state': 'retry', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+                            synchronize_session=False)
+    db.session.commit()
+    return jsonify({'requeued': requeued}), 200
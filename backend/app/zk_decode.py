@@ -0,0 +1,292 @@
+# app/zk_decode.py
+"""
+Columnar decoder for ZK attendance and user buffers.
+
+pyzk's get_attendance() slices the raw buffer record by record, unpacks each
+slice with struct.unpack, scans the whole user list per record to resolve the
+user id, and builds an Attendance object per punch. Here the buffer is read
+once through a memoryview as a NumPy structured array (or struct.iter_unpack
+when NumPy is unavailable) and decoded into column arrays:
+
+    uid, user_id, timestamp, status, punch
+
+Record layouts (same as pyzk):
+    attendance  8 bytes  <HB4sB          uid, status, time, punch
+    attendance 16 bytes  <I4sBB2sI       user_id, time, status, punch, reserved, workcode
+    attendance 40 bytes  <H24sB4sB8s     uid, user_id, status, time, punch, space
+    user       28 bytes  <HB5s8sIxBhI    uid, privilege, password, name, card, group_id, timezone, user_id
+    user       72 bytes  <HB8s24sIx7sx24s uid, privilege, password, name, card, group_id, user_id
+"""
+import struct
+from collections import namedtuple
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is in requirements.txt
+    np = None
+
+DecodedAttendance = namedtuple("DecodedAttendance", "uid user_id timestamp status punch")
+DecodedUser = namedtuple("DecodedUser", "uid name privilege password group_id user_id card")
+
+# struct formats, keyed by record size
+ATT_FORMATS = {8: "<HB4sB", 16: "<I4sBB2sI", 40: "<H24sB4sB8s"}
+USER_FORMATS = {28: "<HB5s8sIxBhI", 72: "<HB8s24sIx7sx24s"}
+
+if np is not None:
+    ATT_DTYPES = {
+        8: np.dtype({"names": ["uid", "status", "time", "punch"],
+                     "formats": ["<u2", "u1", "<u4", "u1"],
+                     "offsets": [0, 2, 3, 7], "itemsize": 8}),
+        16: np.dtype({"names": ["user_id", "time", "status", "punch", "workcode"],
+                      "formats": ["<u4", "<u4", "u1", "u1", "<u4"],
+                      "offsets": [0, 4, 8, 9, 12], "itemsize": 16}),
+        40: np.dtype({"names": ["uid", "user_id", "status", "time", "punch"],
+                      "formats": ["<u2", "S24", "u1", "<u4", "u1"],
+                      "offsets": [0, 2, 26, 27, 31], "itemsize": 40}),
+    }
+    USER_DTYPES = {
+        28: np.dtype({"names": ["uid", "privilege", "password", "name", "card", "group_id", "user_id"],
+                      "formats": ["<u2", "u1", "S5", "S8", "<u4", "u1", "<u4"],
+                      "offsets": [0, 2, 3, 8, 16, 21, 24], "itemsize": 28}),
+        72: np.dtype({"names": ["uid", "privilege", "password", "name", "card", "group_id", "user_id"],
+                      "formats": ["<u2", "u1", "S8", "S24", "<u4", "S7", "S24"],
+                      "offsets": [0, 2, 3, 11, 35, 40, 48], "itemsize": 72}),
+    }
+
+
+def attendance_record_size(total_size, records):
+    """pyzk picks the layout from total_size / records; anything but 8 or 16 is read as 40."""
+    size = total_size / records if records else 0
+    return int(size) if size in (8, 16) else 40
+
+
+def user_packet_size(total_size, users):
+    size = total_size / users if users else 0
+    return 28 if size == 28 else 72
+
+
+def decode_time(t):
+    """ZK packed time (zkemsdk DecodeTime) -> datetime."""
+    second = t % 60
+    t //= 60
+    minute = t % 60
+    t //= 60
+    hour = t % 24
+    t //= 24
+    day = t % 31 + 1
+    t //= 31
+    month = t % 12 + 1
+    year = t // 12 + 2000
+    return datetime(year, month, day, hour, minute, second)
+
+
+def _cstr(b, encoding="UTF-8"):
+    return b.split(b"\x00", 1)[0].decode(encoding, errors="ignore")
+
+
+def _decode_times_np(raw):
+    """Vectorized decode_time: uint32 array -> (datetime64[s] array, valid mask)."""
+    t = raw.astype(np.int64)
+    secs = t % 86400
+    t //= 86400
+    day = t % 31
+    t //= 31
+    months = (t + (2000 - 1970) * 12).astype("datetime64[M]")   # t = (year-2000)*12 + month-1
+    first = months.astype("datetime64[D]")
+    month_len = ((months + 1).astype("datetime64[D]") - first).astype(np.int64)
+    valid = day < month_len   # e.g. Feb 30 can't be a datetime; pyzk would raise on the whole buffer
+    ts = (first + day).astype("datetime64[s]") + secs.astype("timedelta64[s]")
+    return ts, valid
+
+
+def _cstr_column(arr, encoding="UTF-8"):
+    """S<n> array -> list of str, cut at the first NUL like pyzk."""
+    return [_cstr(b, encoding) for b in arr.tolist()]
+
+
+class AttendanceColumns:
+    """Decoded attendance buffer as parallel columns (NumPy arrays or lists)."""
+    __slots__ = ("uid", "user_id", "timestamp", "status", "punch", "record_size", "invalid")
+
+    def __init__(self, uid, user_id, timestamp, status, punch, record_size, invalid=0):
+        self.uid = uid
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+        self.record_size = record_size
+        self.invalid = invalid
+
+    def __len__(self):
+        return len(self.user_id)
+
+    def records(self):
+        """Row view with plain Python values (datetime timestamps), in device order."""
+        def col(c):
+            return c.tolist() if hasattr(c, "tolist") else list(c)
+        return list(map(DecodedAttendance._make, zip(
+            col(self.uid), self.user_id, col(self.timestamp), col(self.status), col(self.punch))))
+
+
+class UserColumns:
+    __slots__ = ("uid", "name", "privilege", "password", "group_id", "user_id", "card", "packet_size")
+
+    def __init__(self, uid, name, privilege, password, group_id, user_id, card, packet_size):
+        self.uid = uid
+        self.name = name
+        self.privilege = privilege
+        self.password = password
+        self.group_id = group_id
+        self.user_id = user_id
+        self.card = card
+        self.packet_size = packet_size
+
+    def __len__(self):
+        return len(self.user_id)
+
+    def records(self):
+        def col(c):
+            return c.tolist() if hasattr(c, "tolist") else list(c)
+        return list(map(DecodedUser._make, zip(
+            col(self.uid), self.name, col(self.privilege), self.password, self.group_id, self.user_id, col(self.card))))
+
+
+def _user_maps(users):
+    """uid -> user_id and user_id -> uid from pyzk User objects, DecodedUser rows or UserColumns."""
+    if users is None:
+        return {}, {}
+    if isinstance(users, UserColumns):
+        uids = users.uid.tolist() if hasattr(users.uid, "tolist") else list(users.uid)
+        pairs = zip(uids, users.user_id)
+    else:
+        pairs = ((getattr(u, "uid", None), getattr(u, "user_id", None)) for u in users)
+    by_uid, by_user_id = {}, {}
+    for uid, user_id in pairs:
+        # pyzk takes the first match in device order
+        by_uid.setdefault(uid, user_id)
+        by_user_id.setdefault(str(user_id), uid)
+    return by_uid, by_user_id
+
+
+def decode_attendance(buf, record_size, users=None, use_numpy=True):
+    """
+    Decode an attendance buffer (without the 4-byte size header) into AttendanceColumns.
+    `users` resolves ids the way pyzk does: the 8-byte layout only carries the
+    device uid, the 16-byte layout only the numeric user id.
+    """
+    mv = memoryview(buf).cast("B")
+    n = len(mv) // record_size
+    mv = mv[:n * record_size]
+    by_uid, by_user_id = _user_maps(users)
+
+    if use_numpy and np is not None:
+        a = np.frombuffer(mv, dtype=ATT_DTYPES[record_size], count=n)
+        ts, valid = _decode_times_np(a["time"])
+        invalid = int(n - valid.sum())
+        if invalid:
+            a, ts = a[valid], ts[valid]
+        status, punch = a["status"], a["punch"]
+        if record_size == 8:
+            uid = a["uid"]
+            user_id = [by_uid.get(u, str(u)) for u in uid.tolist()]
+        elif record_size == 16:
+            user_id = [str(u) for u in a["user_id"].tolist()]
+            uid = [by_user_id.get(u, u) for u in user_id]
+        else:
+            uid = a["uid"]
+            user_id = _cstr_column(a["user_id"])
+        return AttendanceColumns(uid, user_id, ts, status, punch, record_size, invalid)
+
+    uid, user_id, timestamp, status, punch = [], [], [], [], []
+    invalid = 0
+    for rec in struct.iter_unpack(ATT_FORMATS[record_size], mv):
+        if record_size == 8:
+            u, st, t, p = rec
+            uid_v, user_v = u, by_uid.get(u, str(u))
+        elif record_size == 16:
+            uid_raw, t, st, p, _reserved, _workcode = rec
+            user_v = str(uid_raw)
+            uid_v = by_user_id.get(user_v, user_v)
+        else:
+            uid_v, raw_user, st, t, p, _space = rec
+            user_v = _cstr(raw_user)
+        try:
+            ts = decode_time(struct.unpack("<I", t)[0])
+        except ValueError:
+            invalid += 1
+            continue
+        uid.append(uid_v)
+        user_id.append(user_v)
+        timestamp.append(ts)
+        status.append(st)
+        punch.append(p)
+    return AttendanceColumns(uid, user_id, timestamp, status, punch, record_size, invalid)
+
+
+def decode_users(buf, packet_size, encoding="UTF-8", use_numpy=True):
+    """Decode a user buffer (without the 4-byte size header) into UserColumns."""
+    mv = memoryview(buf).cast("B")
+    n = len(mv) // packet_size
+    mv = mv[:n * packet_size]
+
+    if use_numpy and np is not None:
+        a = np.frombuffer(mv, dtype=USER_DTYPES[packet_size], count=n)
+        password = _cstr_column(a["password"], encoding)
+        name = [s.strip() for s in _cstr_column(a["name"], encoding)]
+        if packet_size == 28:
+            group_id = [str(g) for g in a["group_id"].tolist()]
+            user_id = [str(u) for u in a["user_id"].tolist()]
+        else:
+            group_id = [s.strip() for s in _cstr_column(a["group_id"], encoding)]
+            user_id = _cstr_column(a["user_id"], encoding)
+        name = [nm or f"NN-{uid}" for nm, uid in zip(name, user_id)]
+        return UserColumns(a["uid"], name, a["privilege"], password, group_id, user_id, a["card"], packet_size)
+
+    cols = {k: [] for k in ("uid", "name", "privilege", "password", "group_id", "user_id", "card")}
+    for rec in struct.iter_unpack(USER_FORMATS[packet_size], mv):
+        if packet_size == 28:
+            uid, privilege, password, name, card, group_id, _tz, user_id = rec
+            group_id, user_id = str(group_id), str(user_id)
+        else:
+            uid, privilege, password, name, card, group_id, user_id = rec
+            group_id, user_id = _cstr(group_id, encoding).strip(), _cstr(user_id, encoding)
+        name = _cstr(name, encoding).strip() or f"NN-{user_id}"
+        for k, v in (("uid", uid), ("name", name), ("privilege", privilege), ("password", _cstr(password, encoding)),
+                     ("group_id", group_id), ("user_id", user_id), ("card", card)):
+            cols[k].append(v)
+    return UserColumns(packet_size=packet_size, **cols)
+
+
+def read_users(conn):
+    """Fetch and decode the user table from a connected pyzk ZK object."""
+    from zk import const
+    conn.read_sizes()
+    if not conn.users:
+        return UserColumns([], [], [], [], [], [], [], 72)
+    data, size = conn.read_with_buffer(const.CMD_USERTEMP_RRQ, const.FCT_USER)
+    if size <= 4:
+        return UserColumns([], [], [], [], [], [], [], 72)
+    total_size = struct.unpack("<I", data[:4])[0]
+    packet_size = user_packet_size(total_size, conn.users)
+    return decode_users(memoryview(data)[4:], packet_size, encoding=getattr(conn, "encoding", "UTF-8"))
+
+
+def read_attendance(conn, users=None):
+    """
+    Fetch and decode the attendance log from a connected pyzk ZK object.
+    Pass the users already fetched for this poll to avoid the second user read
+    pyzk's get_attendance() does.
+    """
+    from zk import const
+    conn.read_sizes()
+    if not conn.records:
+        return AttendanceColumns([], [], [], [], [], 0)
+    if users is None:
+        users = read_users(conn)
+    data, size = conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+    if size < 4:
+        return AttendanceColumns([], [], [], [], [], 0)
+    total_size = struct.unpack("<I", data[:4])[0]
+    record_size = attendance_record_size(total_size, conn.records)
+    return decode_attendance(memoryview(data)[4:], record_size, users=users)
@@ -0,0 +1,36 @@
+"""attendance_logs.natural_key content-hash dedupe key
+
+Revision ID: 3c9e5a7d21b4
+Revises: ff73d1c01488
+Create Date: 2026-10-18 11:02:17.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e5a7d21b4'
+down_revision = 'ff73d1c01488'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # record ids restart when a device is cleared, so (device_id, record_id) is kept
+    # as a plain index and uniqueness moves to the content key.
+    # Existing rows stay NULL until POST /api/admin/backfill/natural-keys fills them.
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('natural_key', sa.String(length=40), nullable=True))
+        # created before the drop so MySQL keeps an index for the device_id foreign key
+        batch_op.create_index('ix_attendance_logs_device_record', ['device_id', 'record_id'], unique=False)
+        batch_op.drop_constraint('_device_record_uc', type_='unique')
+        batch_op.create_index('uix_attendance_logs_natural_key', ['natural_key'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.drop_index('uix_attendance_logs_natural_key')
+        batch_op.create_unique_constraint('_device_record_uc', ['device_id', 'record_id'])
+        batch_op.drop_index('ix_attendance_logs_device_record')
+        batch_op.drop_column('natural_key')
@@ -0,0 +1,58 @@
+"""daily rollup tables (per badge / per device)
+
+Revision ID: 4f2a8c6e1d93
+Revises: e7b3d90a4c15
+Create Date: 2026-10-18 15:06:44.902137
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a8c6e1d93'
+down_revision = 'e7b3d90a4c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rollup_badge_daily',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('badge', sa.String(length=64), nullable=True),
+    sa.Column('badge_id', sa.Integer(), nullable=True),
+    sa.Column('first_punch', sa.DateTime(), nullable=False),
+    sa.Column('last_punch', sa.DateTime(), nullable=False),
+    sa.Column('punches', sa.Integer(), nullable=False),
+    sa.Column('devices', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('rollup_badge_daily', schema=None) as batch_op:
+        batch_op.create_index('ix_rollup_badge_daily_day_badge', ['day', 'badge'], unique=False)
+        batch_op.create_index('ix_rollup_badge_daily_badge_day', ['badge', 'day'], unique=False)
+
+    op.create_table('rollup_device_daily',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('device_id', sa.Integer(), nullable=False),
+    sa.Column('punches', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('day', 'device_id', name='uix_rollup_device_daily_day_device')
+    )
+    with op.batch_alter_table('rollup_device_daily', schema=None) as batch_op:
+        batch_op.create_index('ix_rollup_device_daily_device_day', ['device_id', 'day'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('rollup_device_daily', schema=None) as batch_op:
+        batch_op.drop_index('ix_rollup_device_daily_device_day')
+
+    op.drop_table('rollup_device_daily')
+    with op.batch_alter_table('rollup_badge_daily', schema=None) as batch_op:
+        batch_op.drop_index('ix_rollup_badge_daily_badge_day')
+        batch_op.drop_index('ix_rollup_badge_daily_day_badge')
+
+    op.drop_table('rollup_badge_daily')
@@ -0,0 +1,43 @@
+"""export_retries table for the cursor-driven exporter
+
+The exporter's cursor lives in sync_cursors ('enddb_export') and is created by
+the exporter on first use, just before the oldest unexported row in its
+lookback window.
+
+Revision ID: 5e8c2b7f40a9
+Revises: a61f3e8b0d47
+Create Date: 2026-10-18 19:07:14.502361
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8c2b7f40a9'
+down_revision = 'a61f3e8b0d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_retries',
+    sa.Column('log_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('state', sa.String(length=8), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('log_id')
+    )
+    with op.batch_alter_table('export_retries', schema=None) as batch_op:
+        batch_op.create_index('ix_export_retries_state_next', ['state', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('export_retries', schema=None) as batch_op:
+        batch_op.drop_index('ix_export_retries_state_next')
+
+    op.drop_table('export_retries')
+    op.execute("DELETE FROM sync_cursors WHERE name = 'enddb_export'")
@@ -0,0 +1,130 @@
+"""devices.key_serial, and natural keys for the remaining legacy rows
+
+Natural keys are built from one persisted serial per device (devices.key_serial,
+stored on first contact and never changed afterwards). Existing devices get what
+the keys written so far were built from: serial_no, else the IP address.
+
+Rows still without a natural_key are keyed here. A row whose key is already taken
+(the same punch stored twice, e.g. re-read after a device reset) is deleted; the
+log counters and the daily rollups of the affected days are corrected to match.
+
+Revision ID: 7d3f1a9c5b20
+Revises: 5e8c2b7f40a9
+Create Date: 2026-10-19 09:12:40.381527
+
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3f1a9c5b20'
+down_revision = '5e8c2b7f40a9'
+branch_labels = None
+depends_on = None
+
+CHUNK = 5000
+
+
+def _natural_key(sn, device_userid, timestamp, status):
+    # same as app.ingest.natural_key
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    ts = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    raw = f"{sn or ''}|{device_userid or ''}|{ts}|{status if status is not None else ''}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _tables(conn):
+    md = sa.MetaData()
+    return [sa.Table(name, md, autoload_with=conn) for name in (
+        'attendance_logs', 'devices', 'device_log_counters', 'branch_log_counters',
+        'rollup_badge_daily', 'rollup_device_daily')]
+
+
+def _as_date(v):
+    return v.date() if isinstance(v, datetime) else datetime.fromisoformat(str(v)).date()
+
+
+def _recount_rollups(conn, logs, rb, rd, badge_days, device_days):
+    """Recompute the rollup rows of the (day, badge) / (day, device) pairs that lost rows."""
+    now = datetime.utcnow()
+    for day, badge in badge_days:
+        lo = datetime.combine(day, datetime.min.time())
+        rng = [logs.c.timestamp >= lo, logs.c.timestamp < lo + timedelta(days=1)]
+        who = logs.c.user_id.is_(None) if badge is None else logs.c.user_id == badge
+        conn.execute(rb.delete().where(rb.c.day == day, rb.c.badge.is_(None) if badge is None else rb.c.badge == badge))
+        badge_id = logs.c.badge_id if 'badge_id' in logs.c else sa.null()
+        row = conn.execute(sa.select(sa.func.max(badge_id), sa.func.min(logs.c.timestamp),
+                                     sa.func.max(logs.c.timestamp), sa.func.count(),
+                                     sa.func.count(sa.func.distinct(logs.c.device_id))).where(who, *rng)).one()
+        if row[3]:
+            conn.execute(rb.insert().values(day=day, badge=badge, badge_id=row[0], first_punch=row[1],
+                                            last_punch=row[2], punches=row[3], devices=row[4], updated_at=now))
+    for day, device_id in device_days:
+        lo = datetime.combine(day, datetime.min.time())
+        n = conn.execute(sa.select(sa.func.count()).where(
+            logs.c.device_id == device_id, logs.c.timestamp >= lo, logs.c.timestamp < lo + timedelta(days=1))).scalar()
+        conn.execute(rd.delete().where(rd.c.day == day, rd.c.device_id == device_id))
+        if n:
+            conn.execute(rd.insert().values(day=day, device_id=device_id, punches=n, updated_at=now))
+
+
+def upgrade():
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key_serial', sa.String(length=128), nullable=True))
+    op.execute("UPDATE devices SET key_serial = COALESCE(NULLIF(serial_no, ''), ip_address)")
+
+    conn = op.get_bind()
+    logs, devs, dc, bc, rb, rd = _tables(conn)
+    # installs built from the migrations alone have no device_userid column (the app writes both)
+    device_userid = logs.c.device_userid if 'device_userid' in logs.c else logs.c.user_id
+    key_sn = dict(conn.execute(sa.select(devs.c.id, devs.c.key_serial)).all())
+    branch_of = dict(conn.execute(sa.select(devs.c.id, devs.c.branch_id)).all())
+    deleted, badge_days, device_days = {}, set(), set()
+    last = 0
+    while True:
+        rows = conn.execute(
+            sa.select(logs.c.id, logs.c.device_id, logs.c.user_id, device_userid.label('device_userid'),
+                      logs.c.timestamp, logs.c.status)
+            .where(logs.c.natural_key.is_(None), logs.c.id > last).order_by(logs.c.id).limit(CHUNK)
+        ).all()
+        if not rows:
+            break
+        last = rows[-1].id
+        keyed, dupes = {}, []
+        for r in rows:
+            if r.timestamp is None:
+                continue
+            nk = _natural_key(key_sn.get(r.device_id), r.device_userid, r.timestamp, r.status)
+            if nk in keyed:
+                dupes.append(r)
+            else:
+                keyed[nk] = r
+        taken = set(conn.execute(sa.select(logs.c.natural_key).where(logs.c.natural_key.in_(list(keyed)))).scalars())
+        dupes += [keyed.pop(nk) for nk in taken]
+        if keyed:
+            conn.execute(
+                logs.update().where(logs.c.id == sa.bindparam('b_id'))
+                .values(natural_key=sa.bindparam('b_nk')),
+                [{'b_id': r.id, 'b_nk': nk} for nk, r in keyed.items()])
+        if dupes:
+            conn.execute(logs.delete().where(logs.c.id.in_([r.id for r in dupes])))
+            for r in dupes:
+                deleted[r.device_id] = deleted.get(r.device_id, 0) + 1
+                badge_days.add((_as_date(r.timestamp), r.user_id))
+                device_days.add((_as_date(r.timestamp), r.device_id))
+
+    for device_id, n in deleted.items():
+        conn.execute(dc.update().where(dc.c.device_id == device_id).values(log_count=dc.c.log_count - n))
+        conn.execute(bc.update().where(bc.c.branch_id == branch_of.get(device_id)).values(log_count=bc.c.log_count - n))
+    _recount_rollups(conn, logs, rb, rd, badge_days, device_days)
+
+
+def downgrade():
+    # deleted duplicates are not restored
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.drop_column('key_serial')
@@ -0,0 +1,41 @@
+"""unmapped_badges store
+
+Revision ID: 8d41f0b6c3e2
+Revises: 3c9e5a7d21b4
+Create Date: 2026-10-18 12:20:05.331870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41f0b6c3e2'
+down_revision = '3c9e5a7d21b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('unmapped_badges',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('badge', sa.String(length=64), nullable=False),
+    sa.Column('sn', sa.String(length=128), nullable=False),
+    sa.Column('device_id', sa.Integer(), nullable=True),
+    sa.Column('first_seen', sa.DateTime(), nullable=False),
+    sa.Column('last_seen', sa.DateTime(), nullable=False),
+    sa.Column('seen_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sn', 'badge', name='uix_unmapped_badges_sn_badge')
+    )
+    with op.batch_alter_table('unmapped_badges', schema=None) as batch_op:
+        batch_op.create_index('ix_unmapped_badges_badge', ['badge'], unique=False)
+        batch_op.create_index(batch_op.f('ix_unmapped_badges_last_seen'), ['last_seen'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('unmapped_badges', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_unmapped_badges_last_seen'))
+        batch_op.drop_index('ix_unmapped_badges_badge')
+
+    op.drop_table('unmapped_badges')
@@ -0,0 +1,49 @@
+"""maintained per-device / per-branch log counters
+
+Seeded from attendance_logs. With the cold archive enabled, run
+reconcile_counters.py afterwards to add the archived rows.
+
+Revision ID: 9b1e4d7c2a60
+Revises: 4f2a8c6e1d93
+Create Date: 2026-10-18 15:41:19.275614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e4d7c2a60'
+down_revision = '4f2a8c6e1d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device_log_counters',
+    sa.Column('device_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('log_count', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('device_id')
+    )
+    op.create_table('branch_log_counters',
+    sa.Column('branch_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('log_count', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('branch_id')
+    )
+
+    op.execute(
+        "INSERT INTO device_log_counters (device_id, log_count, updated_at) "
+        "SELECT device_id, COUNT(*), CURRENT_TIMESTAMP FROM attendance_logs GROUP BY device_id"
+    )
+    op.execute(
+        "INSERT INTO branch_log_counters (branch_id, log_count, updated_at) "
+        "SELECT d.branch_id, SUM(c.log_count), CURRENT_TIMESTAMP "
+        "FROM device_log_counters c JOIN devices d ON d.id = c.device_id GROUP BY d.branch_id"
+    )
+
+
+def downgrade():
+    op.drop_table('branch_log_counters')
+    op.drop_table('device_log_counters')
@@ -0,0 +1,43 @@
+"""indexes for the hot query shapes (see explain_queries.py)
+
+attendance_logs: (timestamp) for listings/stats/retention by time range,
+(device_id, timestamp) for per-device listings, (exported, id) for the
+exporter's pending scan. devices: (branch_id) for the branch filter.
+The exported flag is not created by earlier revisions on every install, so
+its index is only added where the column exists.
+
+Revision ID: a61f3e8b0d47
+Revises: d3a7c1f59e28
+Create Date: 2026-10-18 16:48:30.117942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a61f3e8b0d47'
+down_revision = 'd3a7c1f59e28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('attendance_logs')}
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.create_index('ix_attendance_logs_timestamp', ['timestamp'], unique=False)
+        batch_op.create_index('ix_attendance_logs_device_timestamp', ['device_id', 'timestamp'], unique=False)
+        if 'exported' in columns:
+            batch_op.create_index('ix_attendance_logs_exported_id', ['exported', 'id'], unique=False)
+
+    with op.batch_alter_table('devices', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_devices_branch_id'), ['branch_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_devices_branch_id'), table_name='devices')
+    existing = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('attendance_logs')}
+    if 'ix_attendance_logs_exported_id' in existing:
+        op.drop_index('ix_attendance_logs_exported_id', table_name='attendance_logs')
+    op.drop_index('ix_attendance_logs_device_timestamp', table_name='attendance_logs')
+    op.drop_index('ix_attendance_logs_timestamp', table_name='attendance_logs')
@@ -0,0 +1,46 @@
+"""rollup_badge_daily unique on (day, badge); rollups-rebuilt marker
+
+Duplicate (day, badge) rows left by concurrent refreshes are dropped, keeping the
+newest. On an empty attendance_logs the rollups are complete from the start, so the
+rebuild marker (sync_cursors 'rollups_rebuild') is recorded right away; otherwise
+/api/logs/stats counts the base tables until rebuild_rollups.py has run.
+
+Revision ID: b4e6d2a8f315
+Revises: 7d3f1a9c5b20
+Create Date: 2026-10-19 10:41:07.215904
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e6d2a8f315'
+down_revision = '7d3f1a9c5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM rollup_badge_daily WHERE id NOT IN "
+        "(SELECT id FROM (SELECT MAX(id) AS id FROM rollup_badge_daily GROUP BY day, badge) AS keep)"
+    )
+    with op.batch_alter_table('rollup_badge_daily', schema=None) as batch_op:
+        batch_op.drop_index('ix_rollup_badge_daily_day_badge')
+        batch_op.create_unique_constraint('uix_rollup_badge_daily_day_badge', ['day', 'badge'])
+
+    conn = op.get_bind()
+    if conn.execute(sa.text("SELECT id FROM attendance_logs LIMIT 1")).first() is None:
+        cursors = sa.table('sync_cursors', sa.column('name'), sa.column('position'), sa.column('updated_at'))
+        conn.execute(cursors.delete().where(cursors.c.name == 'rollups_rebuild'))
+        conn.execute(cursors.insert().values(name='rollups_rebuild', position=0, updated_at=datetime.utcnow()))
+
+
+def downgrade():
+    op.execute("DELETE FROM sync_cursors WHERE name = 'rollups_rebuild'")
+    with op.batch_alter_table('rollup_badge_daily', schema=None) as batch_op:
+        batch_op.drop_constraint('uix_rollup_badge_daily_day_badge', type_='unique')
+        batch_op.create_index('ix_rollup_badge_daily_day_badge', ['day', 'badge'], unique=False)
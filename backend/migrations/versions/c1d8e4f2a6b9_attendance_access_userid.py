@@ -0,0 +1,31 @@
+"""attendance_logs.access_userid
+
+The access_checkinout USERID resolved at ingest (canonical badge, then the replica
+USERINFO of the device's serial), stored so the projection writes the same USERID
+the insert audit CSV carries. Existing rows stay NULL and are resolved by the
+projection's fallback join.
+
+Revision ID: c1d8e4f2a6b9
+Revises: b4e6d2a8f315
+Create Date: 2026-10-20 09:27:51.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1d8e4f2a6b9'
+down_revision = 'b4e6d2a8f315'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('access_userid', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.drop_column('access_userid')
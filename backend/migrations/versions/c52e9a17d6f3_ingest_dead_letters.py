@@ -0,0 +1,43 @@
+"""ingest_dead_letters quarantine table
+
+Revision ID: c52e9a17d6f3
+Revises: 8d41f0b6c3e2
+Create Date: 2026-10-18 13:41:52.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e9a17d6f3'
+down_revision = '8d41f0b6c3e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ingest_dead_letters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('target_table', sa.String(length=64), nullable=False),
+    sa.Column('device_id', sa.Integer(), nullable=True),
+    sa.Column('sn', sa.String(length=128), nullable=True),
+    sa.Column('natural_key', sa.String(length=40), nullable=True),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('error', sa.String(length=1000), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_attempt_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ingest_dead_letters', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_ingest_dead_letters_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_ingest_dead_letters_device_id'), ['device_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ingest_dead_letters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_ingest_dead_letters_device_id'))
+        batch_op.drop_index(batch_op.f('ix_ingest_dead_letters_created_at'))
+
+    op.drop_table('ingest_dead_letters')
@@ -0,0 +1,131 @@
+"""compact encoding for attendance_logs.status and access_checkinout
+
+attendance_logs.status VARCHAR(32) -> SMALLINT (the model reads it back as the
+same string). Aborts if a row holds a non-numeric status.
+
+access_checkinout: the serial and the VERIFYCODE/SENSORID/Memoinfo/WorkCode
+strings repeated on every row move to the device_serials and
+access_checkinout_texts dictionaries; rows keep SMALLINT sn_id / text_id.
+The ids are filled in id-range chunks so no single UPDATE touches the whole table.
+
+Revision ID: d3a7c1f59e28
+Revises: 9b1e4d7c2a60
+Create Date: 2026-10-18 16:12:53.604418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7c1f59e28'
+down_revision = '9b1e4d7c2a60'
+branch_labels = None
+depends_on = None
+
+CHUNK = 50000
+TEXT_COLUMNS = ('VERIFYCODE', 'SENSORID', 'Memoinfo', 'WorkCode')
+SmallIntPK = sa.SmallInteger().with_variant(sa.Integer(), 'sqlite')
+
+
+def _null_safe_eq(bind, left, right):
+    return f"{left} <=> {right}" if bind.dialect.name == 'mysql' else f"{left} IS {right}"
+
+
+def _chunked_update(bind, table, sql):
+    """Run `sql` (which ends in a WHERE clause) for id ranges of CHUNK rows."""
+    lo, hi = bind.execute(sa.text(f"SELECT MIN(id), MAX(id) FROM {table}")).one()
+    if lo is None:
+        return
+    start = lo
+    while start <= hi:
+        bind.execute(sa.text(sql + " AND id >= :lo AND id < :hi"), {"lo": start, "hi": start + CHUNK})
+        start += CHUNK
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    if bind.dialect.name == 'mysql':
+        bad = bind.execute(sa.text("SELECT COUNT(*) FROM attendance_logs WHERE status NOT REGEXP '^[0-9]+$'")).scalar()
+    else:
+        bad = bind.execute(sa.text("SELECT COUNT(*) FROM attendance_logs WHERE status = '' OR status GLOB '*[^0-9]*'")).scalar()
+    if bad:
+        raise RuntimeError(f"{bad} attendance_logs rows have a non-numeric status; fix them before this migration")
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.alter_column('status', existing_type=sa.String(length=32), type_=sa.SmallInteger(),
+                              existing_nullable=False)
+
+    op.create_table('device_serials',
+    sa.Column('id', SmallIntPK, autoincrement=True, nullable=False),
+    sa.Column('sn', sa.String(length=128), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sn')
+    )
+    op.create_table('access_checkinout_texts',
+    sa.Column('id', SmallIntPK, autoincrement=True, nullable=False),
+    sa.Column('VERIFYCODE', sa.String(length=16), nullable=True),
+    sa.Column('SENSORID', sa.String(length=32), nullable=True),
+    sa.Column('Memoinfo', sa.String(length=255), nullable=True),
+    sa.Column('WorkCode', sa.String(length=64), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('VERIFYCODE', 'SENSORID', 'Memoinfo', 'WorkCode', name='uix_access_checkinout_texts')
+    )
+
+    if not insp.has_table('access_checkinout'):
+        return
+    with op.batch_alter_table('access_checkinout', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('text_id', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('sn_id', sa.SmallInteger(), nullable=True))
+
+    cols = ", ".join(TEXT_COLUMNS)
+    op.execute("INSERT INTO device_serials (sn) SELECT DISTINCT sn FROM access_checkinout WHERE sn IS NOT NULL")
+    op.execute(f"INSERT INTO access_checkinout_texts ({cols}) SELECT DISTINCT {cols} FROM access_checkinout")
+    match = " AND ".join(_null_safe_eq(bind, f"t.{c}", f"access_checkinout.{c}") for c in TEXT_COLUMNS)
+    _chunked_update(bind, 'access_checkinout',
+                    "UPDATE access_checkinout SET "
+                    "sn_id = (SELECT s.id FROM device_serials s WHERE s.sn = access_checkinout.sn), "
+                    f"text_id = (SELECT MIN(t.id) FROM access_checkinout_texts t WHERE {match}) "
+                    "WHERE 1 = 1")
+
+    existing = {ix['name'] for ix in insp.get_indexes('access_checkinout')}
+    with op.batch_alter_table('access_checkinout', schema=None) as batch_op:
+        for name in ('ix_access_checkinout_user_time_sn', 'ix_access_checkinout_sn'):
+            if name in existing:
+                batch_op.drop_index(name)
+        for c in TEXT_COLUMNS + ('sn',):
+            batch_op.drop_column(c)
+        batch_op.create_index('ix_access_checkinout_user_time_sn', ['USERID', 'CHECKTIME', 'sn_id'], unique=False)
+        batch_op.create_index('ix_access_checkinout_sn_id', ['sn_id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    if insp.has_table('access_checkinout'):
+        with op.batch_alter_table('access_checkinout', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('VERIFYCODE', sa.String(length=16), nullable=True))
+            batch_op.add_column(sa.Column('SENSORID', sa.String(length=32), nullable=True))
+            batch_op.add_column(sa.Column('Memoinfo', sa.String(length=255), nullable=True))
+            batch_op.add_column(sa.Column('WorkCode', sa.String(length=64), nullable=True))
+            batch_op.add_column(sa.Column('sn', sa.String(length=128), nullable=True))
+        sets = ", ".join(f"{c} = (SELECT t.{c} FROM access_checkinout_texts t WHERE t.id = access_checkinout.text_id)"
+                         for c in TEXT_COLUMNS)
+        _chunked_update(bind, 'access_checkinout',
+                        f"UPDATE access_checkinout SET {sets}, "
+                        "sn = (SELECT s.sn FROM device_serials s WHERE s.id = access_checkinout.sn_id) "
+                        "WHERE 1 = 1")
+        with op.batch_alter_table('access_checkinout', schema=None) as batch_op:
+            batch_op.drop_index('ix_access_checkinout_sn_id')
+            batch_op.drop_index('ix_access_checkinout_user_time_sn')
+            batch_op.drop_column('sn_id')
+            batch_op.drop_column('text_id')
+            batch_op.create_index('ix_access_checkinout_sn', ['sn'], unique=False)
+            batch_op.create_index('ix_access_checkinout_user_time_sn', ['USERID', 'CHECKTIME', 'sn'], unique=False)
+
+    op.drop_table('access_checkinout_texts')
+    op.drop_table('device_serials')
+    with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+        batch_op.alter_column('status', existing_type=sa.SmallInteger(), type_=sa.String(length=32),
+                              existing_nullable=False)
@@ -0,0 +1,85 @@
+"""monthly range partitions on attendance_logs / access_checkinout
+
+MySQL only: every unique key of a partitioned table must contain the partition
+column, and partitioned InnoDB tables cannot have foreign keys, so the primary
+keys become (id, <time column>), the natural-key unique index becomes
+(natural_key, timestamp) and the attendance_logs foreign keys are dropped (the
+ORM relationships stay). Then both tables are partitioned by month from the
+oldest row through PARTITION_MONTHS_AHEAD months from now, plus pmax.
+
+Other dialects only get the widened natural-key index so the model matches.
+
+Revision ID: e7b3d90a4c15
+Revises: c52e9a17d6f3
+Create Date: 2026-10-18 14:22:07.318904
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3d90a4c15'
+down_revision = 'c52e9a17d6f3'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+TABLES = (('attendance_logs', 'timestamp'), ('access_checkinout', 'CHECKTIME'))
+
+
+def _add_months(d, n):
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def _partition_clause(column, first, last):
+    parts = []
+    m = date(first.year, first.month, 1)
+    while m <= last:
+        parts.append(f"PARTITION p{m:%Y%m} VALUES LESS THAN (TO_DAYS('{_add_months(m, 1):%Y-%m-%d}'))")
+        m = _add_months(m, 1)
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return f"PARTITION BY RANGE (TO_DAYS(`{column}`)) (" + ", ".join(parts) + ")"
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql':
+        with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+            batch_op.drop_index('uix_attendance_logs_natural_key')
+            batch_op.create_index('uix_attendance_logs_natural_key', ['natural_key', 'timestamp'], unique=True)
+        return
+
+    for fk in sa.inspect(bind).get_foreign_keys('attendance_logs'):
+        op.drop_constraint(fk['name'], 'attendance_logs', type_='foreignkey')
+    op.execute("ALTER TABLE attendance_logs "
+               "DROP INDEX uix_attendance_logs_natural_key, "
+               "ADD UNIQUE INDEX uix_attendance_logs_natural_key (natural_key, `timestamp`)")
+
+    today = date.today()
+    last = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+    for table, column in TABLES:
+        op.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, `{column}`)")
+        first = bind.execute(sa.text(f"SELECT MIN(`{column}`) FROM {table}")).scalar() or today
+        op.execute(f"ALTER TABLE {table} " + _partition_clause(column, first, last))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql':
+        with op.batch_alter_table('attendance_logs', schema=None) as batch_op:
+            batch_op.drop_index('uix_attendance_logs_natural_key')
+            batch_op.create_index('uix_attendance_logs_natural_key', ['natural_key'], unique=True)
+        return
+
+    for table, column in TABLES:
+        op.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+        op.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE attendance_logs "
+               "DROP INDEX uix_attendance_logs_natural_key, "
+               "ADD UNIQUE INDEX uix_attendance_logs_natural_key (natural_key)")
+    op.create_foreign_key(None, 'attendance_logs', 'devices', ['device_id'], ['id'])
+    op.create_foreign_key(None, 'attendance_logs', 'badges', ['badge_id'], ['id'])
@@ -0,0 +1,34 @@
+"""sync_cursors table for the access_checkinout projection
+
+Revision ID: ff73d1c01488
+Revises: baf0714b7942
+Create Date: 2026-10-18 10:12:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ff73d1c01488'
+down_revision = 'baf0714b7942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_cursors',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('position', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # every log row that exists now was already written to access_checkinout inline
+    op.execute(
+        "INSERT INTO sync_cursors (name, position, updated_at) "
+        "SELECT 'checkinout_projection', COALESCE(MAX(id), 0), CURRENT_TIMESTAMP FROM attendance_logs"
+    )
+
+
+def downgrade():
+    op.drop_table('sync_cursors')
@@ -0,0 +1,30 @@
+# rebuild_rollups.py
+"""
+Recompute the daily rollup tables (rollup_badge_daily / rollup_device_daily)
+from attendance_logs and, when the cold archive is enabled, the archive files.
+
+    python rebuild_rollups.py                      # all history
+    python rebuild_rollups.py --start 2025-01-01 --end 2025-06-30
+"""
+import argparse
+
+from app import create_app
+from app.rollups import rebuild_rollups, rollup_archive_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", help="first day (YYYY-MM-DD); default: oldest punch", default=None)
+    parser.add_argument("--end", help="last day (YYYY-MM-DD); default: newest punch", default=None)
+    parser.add_argument("--sleep", type=float, default=None, help="pause between months (seconds)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        sleep = args.sleep if args.sleep is not None else app.config.get("ROLLUPS_REBUILD_SLEEP_SECONDS", 0.0)
+        result = rebuild_rollups(args.start, args.end, archive_dir=rollup_archive_dir(app), sleep_seconds=sleep)
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# reconcile_counters.py
+"""
+Recount device_log_counters / branch_log_counters from attendance_logs (and the
+cold archive when enabled) and fix any drift. Safe to run while ingest is running.
+
+    python reconcile_counters.py                   # every device and branch
+    python reconcile_counters.py --device 3 --device 7
+"""
+import argparse
+
+from app import create_app
+from app.counters import reconcile_log_counters
+from app.rollups import rollup_archive_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=int, action="append", default=None, help="device id (repeatable)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        result = reconcile_log_counters(archive_dir=rollup_archive_dir(app), device_ids=args.device)
+        print(result)
+
+
+if __name__ == "__main__":
+    main()